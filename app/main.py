@@ -1,15 +1,44 @@
 # app/main.py
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 
 # Routers
 from app.routers import chat            # POST /chat
-from app.routers import files, status   # /upload, /admin/reindex, /status
+from app.routers import files, status   # /upload, /admin/reindex, /status, /metrics
+from app.services.retrieval import get_engine, shutdown_engine
+from app.memory.log_writer import shutdown_log_writer
+from app.services.llm_client import shutdown_llm_client
+from app.services.rerank import get_reranker, shutdown_reranker
+from app.services.metrics import ServerTimingMiddleware
+from app.services.structured_log import RequestIdMiddleware, setup_logging, shutdown_logging
+
+# ---- Lifespan: one warm retrieval engine per process ----
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_logging()
+    engine = get_engine()
+    app.state.retrieval_engine = engine
+    await run_in_threadpool(engine.warm)   # load model + open collection off the event loop
+    reranker = get_reranker()
+    if reranker is not None:
+        await run_in_threadpool(reranker.warm)
+    yield
+    files.reindex_jobs.shutdown()          # stop a background reindex after its current document
+    shutdown_engine()
+    shutdown_reranker()
+    shutdown_log_writer()                   # drain queued interaction-log lines
+    await shutdown_llm_client()             # close pooled LLM connections
+    shutdown_logging()                      # flush queued log records
 
 # Single FastAPI app instance
-app = FastAPI(title="Pain & Substance-Use AI Agent")
+app = FastAPI(title="Pain & Substance-Use AI Agent", lifespan=lifespan)
+app.add_middleware(ServerTimingMiddleware)   # per-stage Server-Timing header on /chat
+app.add_middleware(RequestIdMiddleware)      # outermost: request_id on every log line
 
 # ---- Static & Templates ----
 # Expect these at project root:
@@ -0,0 +1,276 @@
+# app/memory/log_writer.py
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from app.services.structured_log import get_logger
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: single-process deployments only
+    fcntl = None
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_QUEUE_POLICY = os.getenv("LOG_QUEUE_POLICY", "drop")            # "drop" | "block"
+LOG_BLOCK_TIMEOUT_SEC = float(os.getenv("LOG_BLOCK_TIMEOUT_SEC", "1.0"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+LOG_FLUSH_INTERVAL_SEC = float(os.getenv("LOG_FLUSH_INTERVAL_SEC", "0.5"))
+LOG_FSYNC_INTERVAL_SEC = float(os.getenv("LOG_FSYNC_INTERVAL_SEC", "5"))
+LOG_ROTATE_BYTES = int(float(os.getenv("LOG_ROTATE_MB", "50")) * 1024 * 1024)
+LOG_ROTATE_DAILY = os.getenv("LOG_ROTATE_DAILY", "1") not in ("0", "false", "False")
+
+log = get_logger("interaction_log")
+
+_STOP = object()
+
+
+class InteractionLogWriter:
+    """
+    Background JSONL writer with a bounded queue.
+
+    submit() only enqueues; one thread drains the queue in batches, writes
+    each batch with a single append under an flock (so lines from several
+    uvicorn workers never interleave), fsyncs at most every fsync_interval,
+    and rotates + gzips the file by size or calendar day. When the queue is
+    full the record is dropped or the caller blocks, per `policy`. Sinks
+    added with add_sink get every written batch on the same thread, so
+    other stores of the records stay off the request path too.
+    """
+
+    def __init__(self, path: str, max_queue: int = LOG_QUEUE_SIZE, policy: str = LOG_QUEUE_POLICY,
+                 block_timeout: float = LOG_BLOCK_TIMEOUT_SEC, batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL_SEC,
+                 fsync_interval: float = LOG_FSYNC_INTERVAL_SEC,
+                 rotate_bytes: int = LOG_ROTATE_BYTES, rotate_daily: bool = LOG_ROTATE_DAILY):
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Unknown log queue policy: {policy}")
+        self.path = path
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self._q: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._fh = None
+        self._last_fsync = time.monotonic()
+        self._sinks: List[Callable[[List[Dict]], None]] = []
+        self.counters = {"enqueued": 0, "written": 0, "dropped": 0, "blocked": 0,
+                         "batches": 0, "fsyncs": 0, "rotations": 0, "errors": 0}
+
+    # ---- producer side (request path) ----
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="interaction-log", daemon=True)
+                self._thread.start()
+
+    def add_sink(self, sink: Callable[[List[Dict]], None]):
+        """Also hand each batch to `sink` (once per distinct sink)."""
+        with self._lock:
+            if sink not in self._sinks:
+                self._sinks.append(sink)
+
+    def submit(self, record: Dict) -> bool:
+        """Queue a record; returns False if it was dropped under back-pressure."""
+        self.start()
+        try:
+            self._q.put_nowait(record)
+        except queue.Full:
+            if self.policy == "drop":
+                self._count("dropped")
+                return False
+            self._count("blocked")
+            try:
+                self._q.put(record, timeout=self.block_timeout)
+            except queue.Full:
+                self._count("dropped")
+                return False
+        self._count("enqueued")
+        return True
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until everything queued so far is written (tests, shutdown)."""
+        done = threading.Event()
+        self.start()
+        self._q.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        if self._thread is not None and self._thread.is_alive():
+            self._q.put(_STOP)
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self.counters)
+        out.update(queue_depth=self._q.qsize(), queue_max=self._q.maxsize, policy=self.policy)
+        return out
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.counters[key] += n
+
+    # ---- consumer side (writer thread) ----
+    def _run(self):
+        while True:
+            item = self._q.get()
+            batch, waiters, stop = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or waiters or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write_batch(batch)
+                self._run_sinks(batch)
+            for w in waiters:
+                w.set()
+            if stop:
+                self._close_file()
+                return
+
+    def _run_sinks(self, batch):
+        with self._lock:
+            sinks = list(self._sinks)
+        for sink in sinks:
+            try:
+                sink(batch)
+            except Exception as e:
+                self._count("errors")
+                log.error("interaction_log.sink_failed", sink=getattr(sink, "__name__", repr(sink)), error=str(e))
+
+    def _open(self):
+        if self._fh is not None:
+            try:
+                # another worker rotated the file away: reopen the new one
+                if os.fstat(self._fh.fileno()).st_ino == os.stat(self.path).st_ino:
+                    return self._fh
+            except OSError:
+                pass
+            self._close_file()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._fh = open(self.path, "a", encoding="utf-8")
+        return self._fh
+
+    def _close_file(self):
+        if self._fh is not None:
+            try:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+                self._fh.close()
+            except OSError:
+                pass
+            self._fh = None
+
+    def _needs_rotation(self, fh) -> bool:
+        st = os.fstat(fh.fileno())
+        if st.st_size == 0:
+            return False
+        if self.rotate_bytes and st.st_size >= self.rotate_bytes:
+            return True
+        if self.rotate_daily:
+            started = datetime.fromtimestamp(st.st_mtime, tz=timezone.utc).date()
+            return started < datetime.now(timezone.utc).date()
+        return False
+
+    def _rotate_locked(self) -> str:
+        """Rename the active file (caller holds the flock); returns the rotated path."""
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}-{stamp}-{os.getpid()}{ext}"
+        os.replace(self.path, rotated)
+        self._count("rotations")
+        return rotated
+
+    @staticmethod
+    def _compress(path: str):
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+
+    def _lock_current(self):
+        """Open and flock the file currently at self.path (it may be rotated meanwhile)."""
+        while True:
+            fh = self._open()
+            if fcntl is None:
+                return fh
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                if os.fstat(fh.fileno()).st_ino == os.stat(self.path).st_ino:
+                    return fh
+            except OSError:
+                pass
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            self._close_file()
+
+    def _write_batch(self, batch):
+        data = "".join(json.dumps(r) + "\n" for r in batch)
+        rotated = None
+        try:
+            fh = self._lock_current()
+            if self._needs_rotation(fh):
+                rotated = self._rotate_locked()
+                self._close_file()            # also drops the lock on the rotated file
+                fh = self._lock_current()
+            try:
+                fh.write(data)
+                fh.flush()
+                if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                    os.fsync(fh.fileno())
+                    self._last_fsync = time.monotonic()
+                    self._count("fsyncs")
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            self._count("written", len(batch))
+            self._count("batches")
+        except Exception as e:
+            self._count("errors")
+            log.error("interaction_log.write_failed", path=self.path, error=str(e))
+        if rotated:
+            try:
+                self._compress(rotated)
+            except OSError as e:
+                log.warning("interaction_log.compress_failed", path=rotated, error=str(e))
+
+
+_writer: Optional[InteractionLogWriter] = None
+_writer_lock = threading.Lock()
+
+def get_log_writer(path: str) -> InteractionLogWriter:
+    """Process-wide writer for `path`, started on first use."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = InteractionLogWriter(path)
+                _writer.start()
+                atexit.register(_writer.close)
+    return _writer
+
+def shutdown_log_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+        _writer = None
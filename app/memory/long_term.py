@@ -1,13 +1,159 @@
 import json
 import os
+import sqlite3
+import threading
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 
-LOG_PATH = "logs/conversation_history.jsonl"
-os.makedirs("logs", exist_ok=True)
+from app.memory.log_writer import get_log_writer
+
+LOG_PATH = os.getenv("CONVERSATION_LOG", "logs/conversation_history.jsonl")
+DB_PATH = os.getenv("CONVERSATION_DB", "logs/conversation_history.sqlite3")
+HISTORY_TURNS = 3   # exchanges returned by summarize_history
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    thread_id      TEXT NOT NULL,
+    timestamp      TEXT NOT NULL,
+    user_message   TEXT NOT NULL,
+    ai_response    TEXT NOT NULL,
+    retrieved_docs TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS interactions_thread ON interactions (thread_id, id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class LongTermStore:
+    """
+    SQLite (WAL) store of past interactions indexed by thread_id, so reading
+    a thread's recent turns is O(k) instead of a scan over every user's log.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, legacy_log: Optional[str] = LOG_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        con = self._conn()
+        con.executescript(_SCHEMA)
+        if legacy_log:
+            self.migrate_jsonl(legacy_log)
+
+    def _conn(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def migrate_jsonl(self, path: str) -> int:
+        """
+        One-time import of the legacy JSONL history; returns rows imported.
+        The marker is written even when there is nothing to import, so lines
+        appended later are never imported a second time.
+        """
+        con = self._conn()
+        con.execute("BEGIN IMMEDIATE")   # one worker migrates, the rest wait and see the marker
+        try:
+            if con.execute("SELECT 1 FROM meta WHERE key = 'jsonl_migrated'").fetchone():
+                con.execute("COMMIT")
+                return 0
+            rows = []
+            try:
+                with open(path) as f:
+                    for line in f:
+                        try:
+                            rec = json.loads(line)
+                        except ValueError:
+                            continue
+                        rows.append((
+                            rec.get("thread_id", ""),
+                            rec.get("timestamp", ""),
+                            rec.get("user_message", ""),
+                            rec.get("ai_response", ""),
+                            json.dumps(rec.get("retrieved_docs", [])),
+                        ))
+            except FileNotFoundError:
+                pass   # no legacy log: nothing to import
+            con.executemany(
+                "INSERT INTO interactions (thread_id, timestamp, user_message, ai_response, retrieved_docs) "
+                "VALUES (?, ?, ?, ?, ?)", rows)
+            con.execute("INSERT INTO meta (key, value) VALUES ('jsonl_migrated', ?)", (str(len(rows)),))
+            con.execute("COMMIT")
+            return len(rows)
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+
+    def add(self, record: Dict):
+        self.add_many([record])
+
+    def add_many(self, records: List[Dict]):
+        """Insert records in one transaction."""
+        con = self._conn()
+        con.execute("BEGIN")
+        try:
+            con.executemany(
+                "INSERT INTO interactions (thread_id, timestamp, user_message, ai_response, retrieved_docs) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(r["thread_id"], r["timestamp"], r["user_message"], r["ai_response"],
+                  json.dumps(r["retrieved_docs"])) for r in records],
+            )
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+
+    def recent(self, thread_id: str, k: int) -> List[Dict]:
+        """Last k interactions for one thread, oldest first."""
+        rows = self._conn().execute(
+            "SELECT timestamp, user_message, ai_response FROM interactions "
+            "WHERE thread_id = ? ORDER BY id DESC LIMIT ?",
+            (thread_id, k),
+        ).fetchall()
+        return [{"timestamp": t, "user_message": u, "ai_response": a} for t, u, a in reversed(rows)]
+
+
+_store: Optional[LongTermStore] = None
+_store_lock = threading.Lock()
+_pending: Dict[str, List[Dict]] = {}   # thread_id -> records queued but not yet in SQLite
+_pending_lock = threading.Lock()
+
+def get_store() -> LongTermStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LongTermStore()
+    return _store
+
+def _persist(batch: List[Dict]):
+    """Log-writer sink: insert a written batch into SQLite, then stop tracking it as pending."""
+    try:
+        get_store().add_many(batch)
+    finally:
+        _forget(batch)
+
+def _forget(records: List[Dict]):
+    with _pending_lock:
+        for rec in records:
+            queued = _pending.get(rec["thread_id"])
+            if queued is None:
+                continue
+            queued[:] = [r for r in queued if r is not rec]
+            if not queued:
+                del _pending[rec["thread_id"]]
 
 def store_interaction(thread_id: str, user_message: str, ai_response: str, retrieval: List[Dict]):
-    """Append structured interaction to a JSONL log for long-term memory."""
+    """
+    Record an interaction. It is queued for the background writer, which
+    appends the JSONL line and inserts the SQLite row on its own thread; the
+    request never waits on disk. Until then summarize_history reads it from
+    the pending records of this process.
+    """
     record = {
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "thread_id": thread_id,
@@ -17,24 +163,30 @@ def store_interaction(thread_id: str, user_message: str, ai_response: str, retri
             {"source": r.get("source"), "chunk": r.get("chunk")} for r in retrieval
         ]
     }
-    with open(LOG_PATH, "a") as f:
-        f.write(json.dumps(record) + "\n")
+    store = get_store()   # migrates the existing JSONL before this record is appended
+    writer = get_log_writer(LOG_PATH)
+    writer.add_sink(_persist)
+    with _pending_lock:
+        _pending.setdefault(thread_id, []).append(record)
+    if not writer.submit(record):   # dropped under back-pressure: keep the history row at least
+        _forget([record])
+        store.add(record)
 
 def summarize_history(thread_id: str):
     """Return last few exchanges for context reconstruction."""
-    if not os.path.exists(LOG_PATH):
-        return []
+    with _pending_lock:
+        pending = list(_pending.get(thread_id, ()))
+    rows = get_store().recent(thread_id, HISTORY_TURNS)
+    stored = {(r["timestamp"], r["user_message"]) for r in rows}
+    rows += [r for r in pending if (r["timestamp"], r["user_message"]) not in stored]
     summaries = []
-    with open(LOG_PATH, "r") as f:
-        for line in f:
-            rec = json.loads(line)
-            if rec["thread_id"] == thread_id:
-                summaries.append({
-                    "role": "user",
-                    "message": rec["user_message"]
-                })
-                summaries.append({
-                    "role": "assistant",
-                    "message": rec["ai_response"][:150] + "..."
-                })
-    return summaries[-6:]  # only last 3 exchanges
+    for rec in rows[-HISTORY_TURNS:]:
+        summaries.append({
+            "role": "user",
+            "message": rec["user_message"]
+        })
+        summaries.append({
+            "role": "assistant",
+            "message": rec["ai_response"][:150] + "..."
+        })
+    return summaries  # only last 3 exchanges
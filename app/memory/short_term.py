@@ -1,12 +1,110 @@
-from collections import defaultdict, deque
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+MAX_SESSIONS = int(os.getenv("SHORT_TERM_MAX_SESSIONS", "10000"))
+SESSION_TTL_SEC = float(os.getenv("SHORT_TERM_TTL_SEC", "3600"))
+MEMORY_BUDGET_BYTES = int(float(os.getenv("SHORT_TERM_BUDGET_MB", "64")) * 1024 * 1024)
+_ENTRY_OVERHEAD = 200   # rough per-message cost of the dict + deque slot
+
+def _entry_size(message: str) -> int:
+    return len(message) + _ENTRY_OVERHEAD
+
+
+class _Session:
+    __slots__ = ("turns", "bytes", "last_access")
+
+    def __init__(self, window_size: int, now: float):
+        self.turns = deque(maxlen=window_size)
+        self.bytes = 0
+        self.last_access = now
+
 
 class ShortTermMemory:
-    def __init__(self, window_size: int = 5):
-        self.store = defaultdict(lambda: deque(maxlen=window_size))
+    """
+    Per-thread conversation window with bounded total footprint.
+
+    Sessions are kept in LRU order and evicted when there are more than
+    max_sessions, when idle longer than ttl_sec, or when the estimated size
+    of all stored messages exceeds budget_bytes. get() on an unknown thread
+    does not create a session. All methods are safe to call from concurrent
+    threadpool workers.
+    """
+
+    def __init__(self, window_size: int = 5, max_sessions: int = MAX_SESSIONS,
+                 ttl_sec: float = SESSION_TTL_SEC, budget_bytes: int = MEMORY_BUDGET_BYTES):
+        self.window_size = window_size
+        self.max_sessions = max_sessions
+        self.ttl_sec = ttl_sec
+        self.budget_bytes = budget_bytes
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = {"lru": 0, "ttl": 0, "budget": 0}
 
     def add(self, thread_id: str, role: str, message: str):
-        self.store[thread_id].append({"role": role, "message": message})
+        now = time.monotonic()
+        with self._lock:
+            sess = self._sessions.get(thread_id)
+            if sess is None:
+                sess = self._sessions[thread_id] = _Session(self.window_size, now)
+            if len(sess.turns) == sess.turns.maxlen:
+                dropped = _entry_size(sess.turns[0]["message"])
+                sess.bytes -= dropped
+                self._bytes -= dropped
+            sess.turns.append({"role": role, "message": message})
+            size = _entry_size(message)
+            sess.bytes += size
+            self._bytes += size
+            sess.last_access = now
+            self._sessions.move_to_end(thread_id)
+            self._evict_locked(now, keep=thread_id)
 
     def get(self, thread_id: str):
-        return list(self.store[thread_id])
+        now = time.monotonic()
+        with self._lock:
+            sess = self._sessions.get(thread_id)
+            if sess is None:
+                return []
+            if now - sess.last_access > self.ttl_sec:
+                self._drop_locked(thread_id, "ttl")
+                return []
+            sess.last_access = now
+            self._sessions.move_to_end(thread_id)
+            return list(sess.turns)
+
+    def _drop_locked(self, thread_id: str, reason: str):
+        sess = self._sessions.pop(thread_id)
+        self._bytes -= sess.bytes
+        self.evictions[reason] += 1
+
+    def _evict_locked(self, now: float, keep: str):
+        # front of the OrderedDict = least recently used; `keep` is never evicted,
+        # so if it is at the front it becomes most recent and eviction goes on
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if oldest_id == keep:
+                if len(self._sessions) == 1:
+                    break
+                self._sessions.move_to_end(keep)
+                continue
+            if now - oldest.last_access > self.ttl_sec:
+                self._drop_locked(oldest_id, "ttl")
+            elif len(self._sessions) > self.max_sessions:
+                self._drop_locked(oldest_id, "lru")
+            elif self._bytes > self.budget_bytes:
+                self._drop_locked(oldest_id, "budget")
+            else:
+                break
 
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "bytes_estimate": self._bytes,
+                "budget_bytes": self.budget_bytes,
+                "ttl_sec": self.ttl_sec,
+                "evictions": dict(self.evictions),
+            }
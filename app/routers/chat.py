@@ -1,458 +1,382 @@
-# from datetime import datetime
-# from fastapi import APIRouter, HTTPException
-
-# from app.schemas import ChatRequest, ChatNormalized
-# from app.services.intent import classify_intent, normalize_message
-# from app.services.safety import basic_safety_check
-# from app.utils.rate_limit import allow_request
-
-# from app.memory.short_term import ShortTermMemory
-# from app.memory.long_term import store_interaction, summarize_history
-
-# from app.services.topics import is_domain_relevant, select_topic_terms
-# from app.services.retrieval import retrieve_relevant_chunks, passes_relevance
-# from app.services.llm_reasoning import generate_answer
-
-
-# router = APIRouter()
-# memory = ShortTermMemory(window_size=5)
-
-
-# @router.post("/chat", response_model=ChatNormalized)
-# def chat(req: ChatRequest):
-#     # --- Rate limiting ---
-#     if not allow_request(req.thread_id):
-#         raise HTTPException(status_code=429, detail="Rate limit exceeded. Please try again shortly.")
-
-#     # --- Safety check first ---
-#     safety = basic_safety_check(req.message)
-#     if not safety.allowed:
-#         # remember the blocked interaction
-#         memory.add(req.thread_id, "user", req.message)
-#         memory.add(req.thread_id, "assistant", safety.replacement or "Blocked for safety.")
-
-#         retrieved, _ = retrieve_relevant_chunks(req.message, set(), n_results=3)
-
-#         context = memory.get(req.thread_id)
-#         return ChatNormalized(
-#             thread_id=req.thread_id,
-#             message=req.message,
-#             intent={"intent": "other", "confidence": 0.0},
-#             safety=safety.model_dump(),
-#             normalized_message=safety.replacement or "Blocked for safety.",
-#             tags=["safety_blocked"],
-#             context=context,
-#             retrieval=[],
-#             generated_answer=safety.replacement or "Blocked for safety.",
-#             citations=[]
-#         )
-
-#     # --- Intent + normalization ---
-#     intent = classify_intent(req.message)
-#     normalized = normalize_message(req.message, intent.intent)
-
-#     # --- Domain gate + topic terms (topic-agnostic) ---
-#     domain_ok = is_domain_relevant(normalized)
-#     topic_terms = select_topic_terms(normalized)
-
-#     # --- Retrieval (topic-aware) ---
-#     retrieved, max_score = retrieve_relevant_chunks(normalized, topic_terms, n_results=5)
-#     relevant = passes_relevance(max_score)
-
-#     # --- LLM reasoning with guardrails (refuse if OOD/low-evidence) ---
-#     answer_text, citations = generate_answer(
-#         user_query=normalized,
-#         retrieved=retrieved,
-#         domain_ok=domain_ok,
-#         relevant=relevant
-#     )
-
-#     # --- Memory (short + long term) ---
-#     memory.add(req.thread_id, "user", req.message)
-#     memory.add(req.thread_id, "assistant", answer_text)
-#     store_interaction(req.thread_id, req.message, answer_text, retrieved)
-#     context = summarize_history(req.thread_id)  # or memory.get(req.thread_id)
-
-#     # --- Logging (optional) ---
-#     print("[USER_INPUT_EVENT]", {
-#         "ts": datetime.utcnow().isoformat() + "Z",
-#         "thread_id": req.thread_id,
-#         "intent": intent.model_dump(),
-#         "safety": safety.model_dump(),
-#         "normalized_message": normalized,
-#         "domain_ok": domain_ok,
-#         "max_score": max_score
-#     })
-
-#     # --- Tags to help UI ---
-#     tags = ["reasoned_response"]
-#     if not domain_ok:
-#         tags.append("out_of_domain")
-#     if not relevant:
-#         tags.append("low_evidence")
-
-#     # --- Response ---
-#     return ChatNormalized(
-#         thread_id=req.thread_id,
-#         message=req.message,
-#         intent=intent.model_dump(),       # dict for Pydantic v2 validation
-#         safety=safety.model_dump(),       # dict for Pydantic v2 validation
-#         normalized_message=normalized,
-#         tags=tags,
-#         context=context,
-#         retrieval=retrieved,
-#         generated_answer=answer_text,
-#         citations=citations
-#     )
-
-
-# app/services/retrieval.py
-
-
-# Multi-Query Settings
-MULTI_QUERY_ENABLED = True  # Toggle multi-query on/off
-NUM_QUERY_VARIATIONS = 3    # How many variations to generate
-USE_LLM_FOR_QUERIES = False # Use LLM (requires API key) vs templates
-
-# Retrieval Settings
-MAX_RESULTS = 12            # Results per query
-MIN_SCORE = 0.25           # Minimum relevance threshold
-TOP_N = 5     
-import chromadb
-from typing import List, Dict, Tuple, Optional
-import re
+import asyncio
+import json
 import os
-from collections import defaultdict
+import time
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+from app.schemas import ChatRequest, ChatNormalized, ChatBatchRequest
+from app.services.analyzer import analyze_query
+from app.utils.rate_limit import allow_request
 
-DB_DIR = "data/chroma_db"
-COLLECTION = "papers"
+from app.memory.short_term import ShortTermMemory
+from app.memory.long_term import store_interaction, summarize_history
 
-MAX_RESULTS = 12
-MIN_SCORE = 0.25
-TOP_N = 5
-MULTI_QUERY_ENABLED = True
-NUM_QUERY_VARIATIONS = 3
+from app.services.retrieval import (
+    retrieve_relevant_chunks, passes_relevance, get_engine, prime_query_embeddings,
+)
+from app.services.llm_reasoning import (
+    agenerate_answer, astream_answer, _build_citations, LLM_UNAVAILABLE_PREFIX,
+)
+from app.services.answer_cache import SemanticAnswerCache, ANSWER_CACHE_ENABLED
+from app.services.metrics import ANSWER_CACHE, RESPONSE_TAGS, request_timings, timed
+from app.services.structured_log import get_logger
 
-_whitespace = re.compile(r"\s+")
 
-def _clean_excerpt(s: str) -> str:
-    s = _whitespace.sub(" ", (s or "")).strip()
-    return s.replace(" ,", ",").replace(" .", ".")
+BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "4"))   # answers generated at once per batch
+BATCH_WAVE = int(os.getenv("CHAT_BATCH_WAVE", "64"))                 # questions embedded per model call
 
-def _get_embedding_function():
-    return SentenceTransformerEmbeddingFunction(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
-
-def passes_relevance(max_score: float, threshold: float = MIN_SCORE) -> bool:
-    """Check if the max score passes the relevance threshold."""
-    return max_score >= threshold
+router = APIRouter()
+memory = ShortTermMemory(window_size=5)
+answer_cache = SemanticAnswerCache()
+log = get_logger("chat")
 
 
-# ============================================================
-# STEP 1: MULTI-QUERY GENERATOR
-# ============================================================
-
-class MultiQueryGenerator:
+def _query_vector(text: str):
     """
-    Generates multiple query variations to improve retrieval recall.
-    Based on the LangChain Multi-Query Retrieval pattern.
+    Embed the user's own message as the answer-cache key (None if the model
+    is unavailable). Not the normalized message: its intent preamble is the
+    same for every question of an intent and would dominate short ones.
     """
-    
-    def __init__(self, num_variations: int = NUM_QUERY_VARIATIONS):
-        self.num_variations = num_variations
-        self.prompt_template = """Generate {n} different versions of this question to help retrieve relevant documents from a research paper database.
+    try:
+        return get_engine().embed_queries([text])[0]
+    except Exception as e:
+        log.warning("answer_cache.embedding_unavailable", error=str(e))
+        return None
+
+
+def _remember(thread_id: str, message: str, answer_text: str, retrieved):
+    """Short + long term memory for one completed exchange; returns the context."""
+    with timed("memory_write"):
+        memory.add(thread_id, "user", message)
+        memory.add(thread_id, "assistant", answer_text)
+        store_interaction(thread_id, message, answer_text, retrieved)
+    with timed("memory_read"):
+        return summarize_history(thread_id)  # or memory.get(thread_id)
+
+
+def _tags(domain_ok: bool, relevant: bool, cached: bool):
+    tags = ["reasoned_response"]
+    if not domain_ok:
+        tags.append("out_of_domain")
+    if not relevant:
+        tags.append("low_evidence")
+    if cached:
+        tags.append("cached_answer")
+    for tag in tags:
+        RESPONSE_TAGS.inc(tag=tag)
+    return tags
+
+
+def _analyze(req: ChatRequest):
+    """Safety, intent, normalization, domain gate and topic terms in one scan."""
+    with timed("analyze"):
+        a = analyze_query(req.message)
+    return {
+        "safety": a.safety,
+        "intent": a.intent,
+        "message": req.message,
+        "normalized": a.normalized,
+        "domain_ok": a.domain_ok,
+        "topic_terms": a.topic_terms,
+    }
+
+
+def _retrieve(turn):
+    """Semantic answer cache lookup, else topic-aware retrieval; fills in `turn`."""
+    normalized, intent = turn["normalized"], turn["intent"].intent
+    corpus_version = get_engine().corpus_version()
+    query_vec = cached = None
+    if ANSWER_CACHE_ENABLED and turn["domain_ok"]:
+        with timed("answer_cache"):
+            query_vec = _query_vector(turn["message"])
+            cached = answer_cache.lookup(query_vec, intent, corpus_version) if query_vec is not None else None
+        if query_vec is not None:
+            ANSWER_CACHE.inc(result="hit" if cached else "miss")
+    turn.update(query_vec=query_vec, corpus_version=corpus_version, cached=cached)
+    if cached:
+        turn.update(retrieved=cached["retrieved"], max_score=cached["max_score"], relevant=True)
+    else:
+        with timed("retrieval"):
+            retrieved, max_score = retrieve_relevant_chunks(normalized, turn["topic_terms"], n_results=5)
+        turn.update(retrieved=retrieved, max_score=max_score, relevant=passes_relevance(max_score))
+    return turn
+
+
+def _finish(req: ChatRequest, turn, answer_text: str, citations, stream: bool = False):
+    """Cache the answer, update memory and log the event; returns the context."""
+    if (turn["query_vec"] is not None and not turn["cached"] and turn["relevant"] and turn["retrieved"]
+            and not answer_text.startswith(LLM_UNAVAILABLE_PREFIX)):
+        answer_cache.store(turn["query_vec"], turn["intent"].intent, turn["corpus_version"],
+                           turn["normalized"], answer_text, citations, turn["retrieved"], turn["max_score"])
+
+    # --- Memory (short + long term) ---
+    context = _remember(req.thread_id, req.message, answer_text, turn["retrieved"])
+
+    # --- Logging ---
+    log.info(
+        "chat.turn",
+        thread_id=req.thread_id,
+        intent=turn["intent"].model_dump(),
+        safety=turn["safety"].model_dump(),
+        normalized_message=turn["normalized"],
+        domain_ok=turn["domain_ok"],
+        max_score=turn["max_score"],
+        cached=bool(turn["cached"]),
+        stream=stream,
+    )
+    return context
+
+
+def _block(req: ChatRequest, safety):
+    """Remember a blocked interaction; returns (replacement text, context)."""
+    blocked = safety.replacement or "Blocked for safety."
+    RESPONSE_TAGS.inc(tag="safety_blocked")
+    memory.add(req.thread_id, "user", req.message)
+    memory.add(req.thread_id, "assistant", blocked)
+    return blocked, memory.get(req.thread_id)
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat", response_model=ChatNormalized)
+async def chat(req: ChatRequest):
+    # --- Rate limiting ---
+    if not await run_in_threadpool(allow_request, req.thread_id):
+        raise HTTPException(status_code=429, detail="Rate limit exceeded. Please try again shortly.")
+
+    # --- Safety, intent + normalization, domain gate + topic terms ---
+    turn = _analyze(req)   # pure CPU, tens of microseconds: cheaper inline than a threadpool hop
+    safety = turn["safety"]
+    if not safety.allowed:
+        blocked, context = await run_in_threadpool(_block, req, safety)
+        return ChatNormalized(
+            thread_id=req.thread_id,
+            message=req.message,
+            intent={"intent": "other", "confidence": 0.0},
+            safety=safety.model_dump(),
+            normalized_message=blocked,
+            tags=["safety_blocked"],
+            context=context,
+            retrieval=[],
+            generated_answer=blocked,
+            citations=[]
+        )
+
+    # --- Semantic answer cache, else retrieval (topic-aware) ---
+    turn = await run_in_threadpool(_retrieve, turn)
+    if turn["cached"]:
+        answer_text, citations = turn["cached"]["answer"], turn["cached"]["citations"]
+    else:
+        # --- LLM reasoning with guardrails (refuse if OOD/low-evidence) ---
+        # awaited on the event loop: a slow endpoint does not hold a threadpool worker
+        with timed("llm"):
+            answer_text, citations = await agenerate_answer(
+                user_query=turn["normalized"],
+                retrieved=turn["retrieved"],
+                domain_ok=turn["domain_ok"],
+                relevant=turn["relevant"]
+            )
+
+    context = await run_in_threadpool(_finish, req, turn, answer_text, citations)
+
+    # --- Response ---
+    return ChatNormalized(
+        thread_id=req.thread_id,
+        message=req.message,
+        intent=turn["intent"].model_dump(),       # dict for Pydantic v2 validation
+        safety=safety.model_dump(),               # dict for Pydantic v2 validation
+        normalized_message=turn["normalized"],
+        tags=_tags(turn["domain_ok"], turn["relevant"], bool(turn["cached"])),
+        context=context,
+        retrieval=turn["retrieved"],
+        generated_answer=answer_text,
+        citations=citations
+    )
 
-Each variation should rephrase the question in a different way while maintaining the core intent.
 
-Original question: {question}
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Server-Sent Events variant of /chat. Events, in order:
+      meta    - intent, safety, normalized message, domain gate
+      sources - retrieval + citations, as soon as retrieval finishes
+      token   - answer text pieces (one piece for cached/fallback answers)
+      done    - final answer, tags and conversation context
+    """
+    if not await run_in_threadpool(allow_request, req.thread_id):
+        raise HTTPException(status_code=429, detail="Rate limit exceeded. Please try again shortly.")
+    return StreamingResponse(
+        _chat_events(req),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-Output only the {n} alternative questions, one per line, without numbering or explanations."""
 
-    def generate_with_llm(self, question: str) -> List[str]:
-        """
-        Generate query variations using an LLM (OpenAI/Anthropic).
-        Falls back to template-based if LLM fails.
-        """
+async def _chat_events(req: ChatRequest):
+    turn = _analyze(req)   # pure CPU, tens of microseconds: cheaper inline than a threadpool hop
+    safety = turn["safety"]
+    if not safety.allowed:
+        blocked, context = await run_in_threadpool(_block, req, safety)
+        yield _sse("meta", {"thread_id": req.thread_id,
+                            "intent": {"intent": "other", "confidence": 0.0},
+                            "safety": safety.model_dump(), "normalized_message": blocked})
+        yield _sse("done", {"generated_answer": blocked, "citations": [], "tags": ["safety_blocked"],
+                            "context": context})
+        return
+
+    yield _sse("meta", {"thread_id": req.thread_id, "intent": turn["intent"].model_dump(),
+                        "safety": safety.model_dump(), "normalized_message": turn["normalized"],
+                        "domain_ok": turn["domain_ok"]})
+
+    turn = await run_in_threadpool(_retrieve, turn)
+    if turn["cached"]:
+        citations = turn["cached"]["citations"]
+    elif turn["domain_ok"] and turn["relevant"] and turn["retrieved"]:
+        citations = _build_citations(turn["retrieved"])
+    else:
+        citations = []
+    yield _sse("sources", {"retrieval": turn["retrieved"], "citations": citations,
+                           "max_score": turn["max_score"], "relevant": turn["relevant"]})
+
+    if turn["cached"]:
+        answer_text = turn["cached"]["answer"]
+        yield _sse("token", {"text": answer_text})
+    else:
+        pieces = []
+        with timed("llm"):   # includes time the client takes to read the tokens
+            async for piece in astream_answer(turn["normalized"], turn["retrieved"],
+                                              turn["domain_ok"], turn["relevant"]):
+                pieces.append(piece)
+                yield _sse("token", {"text": piece})
+        answer_text = "".join(pieces).strip()
+
+    context = await run_in_threadpool(_finish, req, turn, answer_text, citations, True)
+    yield _sse("done", {"generated_answer": answer_text, "citations": citations,
+                        "tags": _tags(turn["domain_ok"], turn["relevant"], bool(turn["cached"])),
+                        "context": context,
+                        # headers went out before these stages ran, so no Server-Timing here
+                        "timings_ms": {k: round(v * 1000, 2) for k, v in request_timings().items()}})
+
+
+# ---- Batch ----
+def _retrieve_wave(turns):
+    """Prime the query cache for a wave in one model call, then retrieve each turn."""
+    try:
+        keys = [t["message"] for t in turns if ANSWER_CACHE_ENABLED and t["domain_ok"]]
+        prime_query_embeddings([t["normalized"] for t in turns], extra=keys)
+    except Exception as e:
+        log.warning("chat.batch_prime_failed", error=str(e))   # retrieval embeds per question instead
+    for turn in turns:
         try:
-            import openai
-            
-            prompt = self.prompt_template.format(
-                n=self.num_variations,
-                question=question
-            )
-            
-            response = openai.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=200
-            )
-            
-            # Parse response
-            variations = response.choices[0].message.content.strip().split('\n')
-            variations = [v.strip() for v in variations if v.strip()]
-            
-            # Always include original question first
-            all_queries = [question] + variations
-            
-            return all_queries[:self.num_variations + 1]
-        
+            _retrieve(turn)
         except Exception as e:
-            print(f"[MultiQueryGenerator] LLM generation failed: {e}")
-            return self.generate_template_based(question)
-    
-    def generate_template_based(self, question: str) -> List[str]:
-        """
-        Fallback: Generate variations using templates.
-        Fast and doesn't require API calls.
-        """
-        # Start with original
-        variations = [question]
-        
-        # Template-based variations
-        templates = [
-            f"What are the key findings about {question}?",
-            f"Explain the research on {question}",
-            f"What information exists regarding {question}?",
-            f"Summarize knowledge about {question}",
-            f"What do papers say about {question}?"
-        ]
-        
-        for template in templates:
-            if len(variations) >= self.num_variations + 1:
-                break
-            # Avoid duplicates
-            if template.lower().strip() != question.lower().strip():
-                variations.append(template)
-        
-        return variations[:self.num_variations + 1]
-    
-    def generate(self, question: str, use_llm: bool = False) -> List[str]:
-        """
-        Main entry point for query generation.
-        
-        Args:
-            question: Original user question
-            use_llm: If True, use LLM; otherwise use templates
-            
-        Returns:
-            List of query variations (including original)
-        """
-        if use_llm:
-            return self.generate_with_llm(question)
-        else:
-            return self.generate_template_based(question)
-
-
-# ============================================================
-# STEP 2: MULTI-QUERY SEARCHER
-# ============================================================
-
-class MultiQuerySearcher:
+            turn["error"] = str(e)
+    return turns
+
+
+def _batch_line(item) -> str:
+    return json.dumps(item, default=float) + "\n"
+
+
+@router.post("/chat/batch")
+async def chat_batch(req: ChatBatchRequest):
     """
-    Performs vector search with multiple query variations and merges results.
-    Uses Reciprocal Rank Fusion (RRF) for result fusion.
+    Answers independent questions and streams one NDJSON line per question
+    in completion order; `index` is the question's position in the request.
+    If the batch itself fails, a last line with index null carries the error.
+    One rate-limit check per batch; questions are embedded in waves of
+    CHAT_BATCH_WAVE and at most `max_concurrency` answers are generated at
+    once. Nothing is written to conversational memory or the answer cache.
     """
-    
-    def __init__(self, collection_name: str = COLLECTION, db_path: str = DB_DIR):
-        self.collection_name = collection_name
-        self.db_path = db_path
-        self.client = chromadb.PersistentClient(path=db_path)
-        self.embedding_function = _get_embedding_function()
-    
-    def _get_collection(self):
-        """Get or create the ChromaDB collection."""
+    if not await run_in_threadpool(allow_request, req.batch_id, "/chat/batch"):
+        raise HTTPException(status_code=429, detail="Rate limit exceeded. Please try again shortly.")
+    return StreamingResponse(_batch_lines(req), media_type="application/x-ndjson")
+
+
+async def _batch_lines(req: ChatBatchRequest):
+    t0 = time.perf_counter()
+    results: asyncio.Queue = asyncio.Queue()
+    gate = asyncio.Semaphore(req.max_concurrency or BATCH_CONCURRENCY)
+    tasks = []
+
+    def emit(item):
+        item["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        results.put_nowait(item)
+
+    async def answer(item, turn):
         try:
-            return self.client.get_collection(
-                self.collection_name,
-                embedding_function=self.embedding_function
-            )
+            if turn["cached"]:
+                answer_text, citations = turn["cached"]["answer"], turn["cached"]["citations"]
+            else:
+                async with gate:
+                    with timed("llm"):
+                        answer_text, citations = await agenerate_answer(
+                            user_query=turn["normalized"],
+                            retrieved=turn["retrieved"],
+                            domain_ok=turn["domain_ok"],
+                            relevant=turn["relevant"]
+                        )
+            item.update(tags=_tags(turn["domain_ok"], turn["relevant"], bool(turn["cached"])),
+                        retrieval=turn["retrieved"], max_score=turn["max_score"],
+                        generated_answer=answer_text, citations=citations)
         except Exception as e:
-            print(f"[MultiQuerySearcher] Failed to get collection: {e}")
-            return None
-    
-    def _create_doc_id(self, doc: Dict) -> str:
-        """Create unique identifier for deduplication."""
-        source = doc.get("source", "unknown")
-        chunk = doc.get("chunk", -1)
-        return f"{source}::{chunk}"
-    
-    def search_single(self, query: str, top_k: int = MAX_RESULTS) -> List[Dict]:
-        """
-        Search with a single query.
-        
-        Args:
-            query: Search query
-            top_k: Number of results to retrieve
-            
-        Returns:
-            List of document dictionaries with metadata
-        """
-        collection = self._get_collection()
-        if collection is None:
-            return []
-        
+            item["error"] = str(e)
+        emit(item)
+
+    async def feed():
+        questions = req.questions
+        for start in range(0, len(questions), BATCH_WAVE):
+            wave = []
+            for index in range(start, min(start + BATCH_WAVE, len(questions))):
+                q = questions[index]
+                item = {"index": index, "id": q.id, "message": q.message}
+                try:
+                    turn = _analyze(q)
+                    item["safety"] = turn["safety"].model_dump()
+                    if not turn["safety"].allowed:
+                        blocked = turn["safety"].replacement or "Blocked for safety."
+                        RESPONSE_TAGS.inc(tag="safety_blocked")
+                        emit({**item, "intent": {"intent": "other", "confidence": 0.0},
+                              "normalized_message": blocked, "tags": ["safety_blocked"], "retrieval": [],
+                              "generated_answer": blocked, "citations": []})
+                        continue
+                    item.update(intent=turn["intent"].model_dump(), normalized_message=turn["normalized"])
+                except Exception as e:
+                    emit({**item, "error": str(e)})
+                    continue
+                wave.append((item, turn))
+            # one worker thread per batch; the next wave is retrieved while this one is answered
+            await run_in_threadpool(_retrieve_wave, [turn for _, turn in wave])
+            for item, turn in wave:
+                if "error" in turn:
+                    emit({**item, "error": turn["error"]})
+                else:
+                    tasks.append(asyncio.create_task(answer(item, turn)))
+
+    async def guarded_feed():
         try:
-            results = collection.query(
-                query_texts=[query],
-                n_results=top_k,
-                include=["distances", "metadatas", "documents"]
-            )
-            
-            docs = (results.get("documents") or [[]])[0]
-            metas = (results.get("metadatas") or [[]])[0]
-            dists = (results.get("distances") or [[1.0] * len(docs)])[0]
-            
-            items = []
-            for doc, meta, dist in zip(docs, metas, dists):
-                score = max(0.0, 1.0 - float(dist))
-                items.append({
-                    "source": meta.get("source", "unknown.pdf"),
-                    "chunk": meta.get("chunk", -1),
-                    "excerpt": _clean_excerpt(doc)[:1400],
-                    "score": round(score, 3),
-                    "distance": round(float(dist), 3)
-                })
-            
-            return items
-        
+            await feed()
         except Exception as e:
-            print(f"[MultiQuerySearcher] Search failed for query '{query}': {e}")
-            return []
-    
-    def search_multi(self, queries: List[str], top_k_per_query: int = MAX_RESULTS) -> List[Dict]:
-        """
-        Search with multiple queries and merge results using RRF.
-        
-        Args:
-            queries: List of query variations
-            top_k_per_query: How many results to get per query
-            
-        Returns:
-            Merged and deduplicated list of documents
-        """
-        # Store results with their query ranks
-        doc_results = defaultdict(list)  # doc_id -> list of (rank, score, doc)
-        
-        for query_idx, query in enumerate(queries):
-            results = self.search_single(query, top_k=top_k_per_query)
-            
-            for rank, doc in enumerate(results):
-                doc_id = self._create_doc_id(doc)
-                doc_results[doc_id].append({
-                    "rank": rank,
-                    "score": doc.get("score", 0),
-                    "doc": doc,
-                    "query_idx": query_idx
-                })
-        
-        # Apply Reciprocal Rank Fusion (RRF)
-        merged = []
-        for doc_id, occurrences in doc_results.items():
-            # RRF formula: sum of 1/(k + rank) for each occurrence
-            # k=60 is a common constant in RRF literature
-            k = 60
-            rrf_score = sum(1.0 / (k + occ["rank"] + 1) for occ in occurrences)
-            
-            # Get the best raw score
-            max_score = max(occ["score"] for occ in occurrences)
-            
-            # Take the first occurrence's document and enhance it
-            doc = occurrences[0]["doc"].copy()
-            doc["score"] = round(max_score, 3)
-            doc["rrf_score"] = round(rrf_score, 4)
-            doc["query_hits"] = len(occurrences)  # How many queries found this
-            
-            merged.append(doc)
-        
-        # Sort by RRF score (better fusion than raw similarity)
-        merged.sort(key=lambda x: x.get("rrf_score", 0), reverse=True)
-        
-        return merged
-
-
-# ============================================================
-# STEP 3: COMPLETE MULTI-QUERY RAG RETRIEVAL
-# ============================================================
-
-def retrieve_relevant_chunks(
-    query: str, 
-    topic_terms=None, 
-    n_results: int = TOP_N,
-    use_multi_query: bool = MULTI_QUERY_ENABLED,
-    use_llm_for_queries: bool = False
-) -> Tuple[List[Dict], float]:
-    """
-    Main retrieval function with multi-query support.
-    
-    Args:
-        query: User's search query
-        topic_terms: Optional topic terms (for future enhancement)
-        n_results: Number of final results to return
-        use_multi_query: Enable multi-query retrieval
-        use_llm_for_queries: Use LLM for query generation (requires OpenAI API key)
-        
-    Returns:
-        Tuple of (filtered_results, max_score)
-    """
-    
-    if not use_multi_query:
-        # Single query path (original behavior)
-        items, max_score = retrieve(query)
-        filtered = [item for item in items if item.get("score", 0) >= MIN_SCORE]
-        return filtered[:n_results], max_score
-    
-    # ========== MULTI-QUERY PATH ==========
-    
-    print(f"[RETRIEVAL] 🔍 Multi-query retrieval for: '{query}'")
-    
-    # Step 1: Generate query variations
-    generator = MultiQueryGenerator(num_variations=NUM_QUERY_VARIATIONS)
-    queries = generator.generate(query, use_llm=use_llm_for_queries)
-    
-    print(f"[RETRIEVAL] 📝 Generated {len(queries)} query variations:")
-    for i, q in enumerate(queries):
-        print(f"  {i+1}. {q}")
-    
-    # Step 2: Search with all queries
-    searcher = MultiQuerySearcher()
-    merged_results = searcher.search_multi(queries, top_k_per_query=MAX_RESULTS)
-    
-    print(f"[RETRIEVAL] 📊 Found {len(merged_results)} unique documents")
-    
-    # Step 3: Filter by minimum score
-    filtered = [
-        item for item in merged_results 
-        if item.get("score", 0) >= MIN_SCORE
-    ]
-    
-    print(f"[RETRIEVAL] ✅ {len(filtered)} documents pass threshold (>= {MIN_SCORE})")
-    
-    # Step 4: Calculate max score
-    max_score = max([item.get("score", 0) for item in merged_results], default=0.0)
-    
-    # Step 5: Return top N
-    final_results = filtered[:n_results]
-    
-    print(f"[RETRIEVAL] 🎯 Returning top {len(final_results)} results")
-    
-    return final_results, max_score
-
-
-def retrieve(query: str) -> Tuple[List[Dict], float]:
-    """
-    Legacy single-query retrieval (kept for backwards compatibility).
-    """
-    searcher = MultiQuerySearcher()
-    items = searcher.search_single(query, top_k=MAX_RESULTS)
-    
-    if not items:
-        return [], 0.0
-    
-    items.sort(key=lambda x: x["score"], reverse=True)
-    max_score = max([item.get("score", 0) for item in items], default=0.0)
-    
-    return items, max_score
\ No newline at end of file
+            results.put_nowait(e)   # wake the consumer: it would otherwise wait for lines never sent
+
+    feeder = asyncio.create_task(guarded_feed())
+    failed = 0
+    try:
+        for _ in range(len(req.questions)):
+            item = await results.get()
+            if isinstance(item, Exception):
+                log.error("chat.batch_failed", batch_id=req.batch_id, error=str(item))
+                failed += 1
+                yield _batch_line({"index": None, "error": f"batch aborted: {item}"})
+                break
+            failed += "error" in item
+            yield _batch_line(item)
+    finally:
+        for task in [feeder, *tasks]:
+            task.cancel()
+        log.info("chat.batch", batch_id=req.batch_id, questions=len(req.questions), failed=failed,
+                 elapsed_ms=round((time.perf_counter() - t0) * 1000, 2))
@@ -1,24 +1,117 @@
 # app/routers/files.py
+import hashlib
 import os
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.services.ingest import ingest_all, collection_stats
+import tempfile
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from app.services.ingest import ingest_all, ingest_file, find_ingested_by_sha, collection_stats
+from app.services.jobs import ReindexJobs, JobConflict
+from app.utils.rate_limit import allow_request
 
 DATA_DIR = "data/papers"
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 
 router = APIRouter(tags=["files"])
+reindex_jobs = ReindexJobs(ingest_all)
+
+def _write_and_hash(f, h, chunk: bytes):
+    h.update(chunk)
+    f.write(chunk)
+
+def _open_part(fname: str):
+    """A new temp file next to the destination (unique, so same-name uploads never share one)."""
+    fd, tmp = tempfile.mkstemp(prefix=f".{fname}.", suffix=".part", dir=DATA_DIR)
+    return os.fdopen(fd, "wb"), tmp
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
 
 @router.post("/upload")
-async def upload_pdf(file: UploadFile = File(...)):
-    if not file.filename.lower().endswith(".pdf"):
+async def upload_pdf(request: Request, file: UploadFile = File(...), ingest: bool = False):
+    """
+    Stream an upload to data/papers in chunks, hashing as it goes.
+    Content already in the index is not stored twice; with ingest=true the
+    new file is indexed on its own (no full reindex), or 409 while a
+    reindex holds the index lock.
+    """
+    client = request.client.host if request.client else "anon"
+    if not await run_in_threadpool(allow_request, client, "/upload"):
+        raise HTTPException(status_code=429, detail="Upload rate limit exceeded. Please try again shortly.")
+    fname = os.path.basename(file.filename or "")
+    if not fname.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are accepted.")
     os.makedirs(DATA_DIR, exist_ok=True)
-    dest = os.path.join(DATA_DIR, file.filename)
-    with open(dest, "wb") as f:
-        f.write(await file.read())
-    return {"ok": True, "saved_as": file.filename}
+    dest = os.path.join(DATA_DIR, fname)
+
+    h = hashlib.sha256()
+    size = 0
+    f, tmp = await run_in_threadpool(_open_part, fname)
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413,
+                                    detail=f"File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit.")
+            await run_in_threadpool(_write_and_hash, f, h, chunk)
+    except BaseException:
+        await run_in_threadpool(f.close)
+        await run_in_threadpool(_discard, tmp)
+        raise
+    await run_in_threadpool(f.close)
+    sha = h.hexdigest()
+
+    dup = await run_in_threadpool(find_ingested_by_sha, sha)
+    if dup:
+        await run_in_threadpool(_discard, tmp)
+        return {"ok": True, "duplicate": True, "saved_as": dup["source"], "sha256": sha, "bytes": size}
 
-@router.post("/admin/reindex")
+    await run_in_threadpool(os.replace, tmp, dest)
+    out = {"ok": True, "duplicate": False, "saved_as": fname, "sha256": sha, "bytes": size}
+
+    if ingest:
+        try:
+            out["ingest"] = await run_in_threadpool(reindex_jobs.run_exclusive, ingest_file, dest, sha)
+        except JobConflict as e:
+            return JSONResponse(status_code=409, content={
+                **out,
+                "detail": "A reindex job is running; the file is saved and it or the next one will index it.",
+                "job_id": e.running_id,
+            })
+    return out
+
+@router.post("/admin/reindex", status_code=202)
 def reindex():
-    out = ingest_all()
-    stats = collection_stats()
-    return {"ingest": out, "stats": stats}
+    """Start a background reindex; poll /admin/jobs/{id} for progress."""
+    try:
+        job = reindex_jobs.start()
+    except JobConflict as e:
+        return JSONResponse(status_code=409, content={
+            "detail": str(e),
+            "job_id": e.running_id,
+        })
+    return {"job_id": job["id"], "status_url": f"/admin/jobs/{job['id']}", "job": job}
+
+@router.get("/admin/jobs")
+def list_jobs():
+    return {"jobs": reindex_jobs.list()}
+
+@router.get("/admin/jobs/{job_id}")
+def job_status(job_id: str):
+    job = reindex_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    if job["state"] not in ("running", "cancelling"):
+        job["stats"] = collection_stats()
+    return job
+
+@router.post("/admin/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    job = reindex_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    return job
@@ -1,8 +1,40 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 from app.services.ingest import collection_stats
+from app.services.retrieval import get_engine
+from app.routers.chat import answer_cache, memory
+from app.memory.long_term import LOG_PATH
+from app.memory.log_writer import get_log_writer
+from app.services.llm_client import get_llm_client
+from app.services.rerank import get_reranker
+from app.services.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge
 
 router = APIRouter(tags=["status"])
 
+# Read from their sources at scrape time
+Gauge("chroma_collection_vectors", "Vectors in the retrieval collection.", fn=lambda: get_engine().count())
+Gauge("chat_sessions", "Short-term memory sessions held in this process.", fn=lambda: memory.stats()["sessions"])
+Counter("chat_query_embedding_cache_hits_total", "Query embeddings served from the cache.",
+        fn=lambda: (lambda s: s["hits"] + s["spill_hits"])(get_engine().query_cache.stats()))
+
 @router.get("/status")
 def status():
-    return {"ok": True, "chroma": collection_stats()}
\ No newline at end of file
+    llm = get_llm_client()
+    reranker = get_reranker()
+    return {
+        "ok": True,
+        "chroma": collection_stats(),
+        "corpus_version": get_engine().corpus_version(),
+        "vector_backend": get_engine().backend,
+        "query_cache": get_engine().query_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "sessions": memory.stats(),
+        "interaction_log": get_log_writer(LOG_PATH).stats(),
+        "llm": llm.stats() if llm else None,
+        "rerank": reranker.stats() if reranker else None,
+    }
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of the pipeline metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -1,9 +1,12 @@
+import os
 from pydantic import BaseModel, Field, constr
 from typing import Optional, Literal, List, Dict
 from typing import List, Optional
 
 
 MessageText = constr(strip_whitespace=True, min_length=1, max_length=8000)
+BATCH_MAX_QUESTIONS = int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", "1000"))
+BATCH_MAX_CONCURRENCY = 32
 
 class ChatRequest(BaseModel):
     thread_id: constr(strip_whitespace=True, min_length=1) = Field(..., description="Logical conversation id")
@@ -11,6 +14,16 @@ class ChatRequest(BaseModel):
     user_id: Optional[str] = Field(default=None, description="(Future) Authenticated user id")
     prefs: Optional[Dict[str, str]] = Field(default=None, description="(Optional) user preferences")
 
+class BatchQuestion(BaseModel):
+    id: Optional[str] = Field(default=None, description="Caller's id, echoed in the result line")
+    message: MessageText = Field(..., description="Question text")
+
+class ChatBatchRequest(BaseModel):
+    batch_id: constr(strip_whitespace=True, min_length=1) = Field(..., description="Run id; the rate-limit key, not a conversation")
+    questions: List[BatchQuestion] = Field(..., min_length=1, max_length=BATCH_MAX_QUESTIONS)
+    max_concurrency: Optional[int] = Field(default=None, ge=1, le=BATCH_MAX_CONCURRENCY,
+                                           description="Answers generated at once (default CHAT_BATCH_CONCURRENCY)")
+
 class IntentResult(BaseModel):
     intent: Literal["summarize","compare","extract","cite","critique","other"]
     confidence: float = Field(ge=0, le=1)
@@ -0,0 +1,160 @@
+# app/services/analyzer.py
+import re
+from typing import Dict, FrozenSet, List, NamedTuple, Set, Tuple
+
+from app.schemas import IntentResult, SafetyResult
+from app.services.intent import ACRONYMS, INTENT_KEYWORDS, PREAMBLES
+from app.services.safety import CLINICAL_TERMS, SUICIDE_TERMS, CRISIS_REPLY, MEDICAL_REPLY
+from app.services.topics import DOMAIN_KEYWORDS, PACK_PATTERNS, TOPIC_PACKS
+
+
+class QueryAnalysis(NamedTuple):
+    safety: SafetyResult
+    intent: IntentResult
+    normalized: str
+    domain_ok: bool
+    topic_packs: FrozenSet[str]
+    topic_terms: Set[str]
+
+
+def _literal(terms) -> str:
+    return "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True))
+
+def _literal_prefix(pattern: str) -> str:
+    """Literal text every match of a simple keyword regex starts with (r"\bsmok(ing|ers?)\b" -> "smok")."""
+    out = []
+    for ch in pattern.replace(r"\b", ""):
+        if ch in "()[]|\\.^$+":
+            break
+        if ch in "?*{":
+            out.pop()
+            break
+        out.append(ch)
+    return "".join(out).lower()
+
+def _trie_regex(words) -> str:
+    """Prefix-factored alternation ("dos(?:e|age)"): one char test per step instead of one per word."""
+    trie: Dict = {}
+    for w in sorted(set(words)):
+        node = trie
+        for ch in w:
+            if "" in node:
+                break            # a shorter anchor already covers this one
+            node = node.setdefault(ch, {})
+        else:
+            node.clear()
+            node[""] = True
+
+    def emit(node) -> str:
+        if "" in node:
+            return ""
+        alts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items())]
+        return alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+    return emit(trie)
+
+# label -> (pattern, anchors). Anchors are literal prefixes every match starts
+# with. Safety and intent keep the substring semantics of basic_safety_check and
+# classify_intent and run on the raw lowercased message; domain and topic packs
+# use the word-boundary regexes from topics.py on the normalized message.
+_RAW_SPECS = {
+    "safety:crisis": (re.compile(_literal(SUICIDE_TERMS)), SUICIDE_TERMS),
+    "safety:medical": (re.compile(_literal(CLINICAL_TERMS)), CLINICAL_TERMS),
+    **{f"intent:{name}": (re.compile(_literal(terms)), terms) for name, _, terms in INTENT_KEYWORDS},
+}
+_TOPIC_SPECS = {
+    "domain": (re.compile("|".join(DOMAIN_KEYWORDS), re.IGNORECASE),
+               [_literal_prefix(p) for p in DOMAIN_KEYWORDS]),
+    **{f"pack:{pack}": (rx, [t.lower() for t in TOPIC_PACKS[pack]]) for pack, rx in PACK_PATTERNS.items()},
+}
+assert all(all(anchors) for _, anchors in {**_RAW_SPECS, **_TOPIC_SPECS}.values()), \
+    "every keyword needs a literal prefix"
+
+
+def _index(specs) -> Tuple["re.Pattern", Dict[str, List[Tuple[str, "re.Pattern"]]]]:
+    """
+    One prefix trie over all anchors (every position where some label could
+    match is a hit) and, per first character, the labels that can start there.
+    """
+    by_first_char: Dict[str, List[Tuple[str, "re.Pattern"]]] = {}
+    for label, (rx, anchors) in specs.items():
+        for ch in sorted({a[0] for a in anchors}):
+            by_first_char.setdefault(ch, []).append((label, rx))
+    return re.compile(_trie_regex(a for _, anchors in specs.values() for a in anchors)), by_first_char
+
+_RAW_INDEX = _index(_RAW_SPECS)
+_TOPIC_INDEX = _index(_TOPIC_SPECS)
+_ws = re.compile(r"\s+")
+_acronyms = re.compile(r"\b(?:" + "|".join(ACRONYMS) + r")\b", re.IGNORECASE)
+
+
+def _scan(text: str, index) -> Set[str]:
+    """
+    Labels whose pattern occurs in `text` (lowercased), in a single
+    left-to-right scan. At each anchor hit only the labels that can start
+    with that character and are not found yet are verified; the scan resumes
+    one character later so overlapping terms are not lost.
+    """
+    scan, by_first_char = index
+    found: Set[str] = set()
+    pos = 0
+    search = scan.search
+    while True:
+        m = search(text, pos)
+        if m is None:
+            return found
+        start = m.start()
+        for label, rx in by_first_char[text[start]]:
+            if label not in found and rx.match(text, start):
+                found.add(label)
+        pos = start + 1
+
+
+def _topic_labels(msg: str) -> Set[str]:
+    """
+    Domain and pack labels for the normalized message. The anchor scan needs
+    lowercase text; lower() can change the length or the word boundaries of
+    non-ASCII text ("İ" -> "i̇"), so that falls back to one case-insensitive
+    search per pattern on the text as is.
+    """
+    if msg.isascii():
+        return _scan(msg.lower(), _TOPIC_INDEX)
+    return {label for label, (rx, _) in _TOPIC_SPECS.items() if rx.search(msg)}
+
+
+def analyze_query(message: str) -> QueryAnalysis:
+    """
+    Safety check, intent, normalization, domain gate and topic packs for one
+    message, equivalent to basic_safety_check + classify_intent +
+    normalize_message + is_domain_relevant + select_topic_terms: safety and
+    intent scan the raw message, domain and topics the normalized one.
+    """
+    msg = _acronyms.sub(lambda m: ACRONYMS[m.group(0).lower()], _ws.sub(" ", message).strip())
+    labels = _scan(message.lower(), _RAW_INDEX) | _topic_labels(msg)
+
+    if "safety:crisis" in labels:
+        safety = SafetyResult(allowed=False, reason="crisis_content", replacement=CRISIS_REPLY)
+    elif "safety:medical" in labels:
+        safety = SafetyResult(allowed=False, reason="medical_advice", replacement=MEDICAL_REPLY)
+    else:
+        safety = SafetyResult(allowed=True)
+
+    intent = IntentResult(intent="other", confidence=0.4)
+    for name, confidence, _ in INTENT_KEYWORDS:
+        if f"intent:{name}" in labels:
+            intent = IntentResult(intent=name, confidence=confidence)
+            break
+
+    preamble = PREAMBLES.get(intent.intent)
+    packs = frozenset(label[5:] for label in labels if label.startswith("pack:"))
+    terms: Set[str] = set()
+    for pack in packs:
+        terms.update(TOPIC_PACKS[pack])
+
+    return QueryAnalysis(
+        safety=safety,
+        intent=intent,
+        normalized=preamble.format(msg=msg) if preamble else msg,
+        domain_ok="domain" in labels,
+        topic_packs=packs,
+        topic_terms=terms,
+    )
@@ -0,0 +1,125 @@
+# app/services/answer_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") not in ("0", "false", "False")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))  # cosine similarity
+ANSWER_CACHE_TTL_SEC = float(os.getenv("ANSWER_CACHE_TTL_SEC", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+
+
+def _unit(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32)
+    n = float(np.linalg.norm(v))
+    return v / n if n else v
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache matched by query-embedding similarity.
+
+    An entry only matches queries with the same intent and corpus version,
+    so a reindex (which bumps the version) invalidates everything cached
+    before it. Entries expire after ttl_sec; the least recently used entry
+    is evicted once max_size is reached.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl_sec: float = ANSWER_CACHE_TTL_SEC,
+                 max_size: int = ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl_sec = ttl_sec
+        self.max_size = max(0, int(max_size))
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _purge_locked(self, now: float, corpus_version: str):
+        # older corpus version: invalidated by a reindex; same version but too old: expired
+        outdated = [k for k, e in self._entries.items() if e["corpus_version"] != corpus_version]
+        for k in outdated:
+            del self._entries[k]
+        expired = [k for k, e in self._entries.items() if now - e["created"] > self.ttl_sec]
+        for k in expired:
+            del self._entries[k]
+        self.invalidations += len(outdated)
+        self.expirations += len(expired)
+
+    def lookup(self, vector, intent: str, corpus_version: str) -> Optional[Dict]:
+        """Return the most similar cached entry above the threshold, or None."""
+        q = _unit(vector)
+        now = time.time()
+        with self._lock:
+            self._purge_locked(now, corpus_version)
+            keys = [k for k, e in self._entries.items() if e["intent"] == intent]
+            if not keys:
+                self.misses += 1
+                return None
+            sims = np.stack([self._entries[k]["vector"] for k in keys]) @ q
+            best = int(np.argmax(sims))
+            if float(sims[best]) < self.threshold:
+                self.misses += 1
+                return None
+            key = keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            entry = self._entries[key]
+            return {
+                "query": entry["query"],
+                "answer": entry["answer"],
+                "citations": list(entry["citations"]),
+                "retrieved": list(entry["retrieved"]),
+                "max_score": entry["max_score"],
+                "similarity": round(float(sims[best]), 4),
+            }
+
+    def store(self, vector, intent: str, corpus_version: str, query: str,
+              answer: str, citations: List[str], retrieved: List[Dict], max_score: float):
+        if not self.max_size:
+            return
+        with self._lock:
+            self._entries[self._next_id] = {
+                "vector": _unit(vector),
+                "intent": intent,
+                "corpus_version": corpus_version,
+                "query": query,
+                "answer": answer,
+                "citations": list(citations or []),
+                "retrieved": list(retrieved or []),
+                "max_score": max_score,
+                "created": time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,123 @@
+# app/services/embedding_cache.py
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))   # max in-memory entries
+QUERY_CACHE_DIR = os.getenv("QUERY_EMBED_CACHE_DIR") or None          # optional on-disk spill
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings keyed by (model name, exact text).
+
+    Keys never depend on the corpus, so entries stay valid across reindexes.
+    When spill_dir is set, evicted vectors are written there as .npy files and
+    read back on a memory miss instead of re-running the model.
+    """
+
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE, spill_dir: Optional[str] = QUERY_CACHE_DIR):
+        self.max_size = max(0, int(max_size))
+        self.spill_dir = spill_dir
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._store: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.spill_hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.npy")
+
+    def _load_spilled(self, key: str) -> Optional[np.ndarray]:
+        if not self.spill_dir:
+            return None
+        try:
+            return np.load(self._spill_path(key))
+        except (OSError, ValueError):
+            return None
+
+    def _put_locked(self, key: str, vec: np.ndarray):
+        self._store[key] = vec
+        self._store.move_to_end(key)
+        while len(self._store) > self.max_size:
+            old_key, old_vec = self._store.popitem(last=False)
+            self.evictions += 1
+            if self.spill_dir:
+                try:
+                    np.save(self._spill_path(old_key), old_vec)
+                except OSError:
+                    pass
+
+    def get(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        key = self.make_key(model_name, text)
+        with self._lock:
+            vec = self._store.get(key)
+            if vec is not None:
+                self._store.move_to_end(key)
+                self.hits += 1
+                return vec
+        vec = self._load_spilled(key)
+        with self._lock:
+            if vec is None:
+                self.misses += 1
+                return None
+            self.spill_hits += 1
+            self._put_locked(key, vec)
+            return vec
+
+    def put(self, model_name: str, text: str, vec) -> np.ndarray:
+        vec = np.asarray(vec, dtype=np.float32)
+        if self.max_size:
+            with self._lock:
+                self._put_locked(self.make_key(model_name, text), vec)
+        return vec
+
+    def get_or_embed(self, model_name: str, texts: List[str],
+                     embed: Callable[[List[str]], List]) -> List[np.ndarray]:
+        """
+        Return one vector per text, embedding only the misses.
+
+        All misses go to `embed` in a single call, so a batch costs at most
+        one model forward pass.
+        """
+        out: List[Optional[np.ndarray]] = [self.get(model_name, t) for t in texts]
+        missing: Dict[str, List[int]] = {}
+        for i, vec in enumerate(out):
+            if vec is None:
+                missing.setdefault(texts[i], []).append(i)
+        if missing:
+            fresh = embed(list(missing))
+            for text, vec in zip(missing, fresh):
+                vec = self.put(model_name, text, vec)
+                for i in missing[text]:
+                    out[i] = vec
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.spill_hits + self.misses
+            return {
+                "size": len(self._store),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "spill_hits": self.spill_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.spill_hits) / lookups, 3) if lookups else 0.0,
+                "spill_dir": self.spill_dir,
+            }
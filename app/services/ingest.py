@@ -1,19 +1,43 @@
-import os, hashlib
-from typing import Dict, Tuple
+import os, hashlib, time, threading
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
 from PyPDF2 import PdfReader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-import chromadb
+from app.services.retrieval import get_engine, DB_DIR, COLLECTION
+from app.services.manifest import IngestManifest, MANIFEST_FILE
+from app.services.topics import TOPIC_TAGS_VERSION, match_topic_packs, topic_flags
+from app.services.text_cache import PageTextCache, TEXT_CACHE_DIR
 
 DATA_DIR = "data/papers"
-DB_DIR = "data/chroma_db"
-COLLECTION = "papers"
 
-def _pdf_text(path: str) -> str:
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+TOPICS_VERSION_FILE = "topics_version"   # in DB_DIR; TOPIC_TAGS_VERSION all chunks are tagged with
+
+def _pdf_pages(path: str) -> List[str]:
     reader = PdfReader(path)
-    txt = []
-    for p in reader.pages:
-        txt.append((p.extract_text() or "").strip())
-    return "\n".join(txt)
+    return [(p.extract_text() or "").strip() for p in reader.pages]
+
+def _chunk_pages(pages: List[str]) -> List[Tuple[str, int, int]]:
+    """
+    Split the document text (pages joined by newlines) into chunks; each
+    comes with the 1-based first and last page it covers.
+    """
+    starts, pos = [], 0
+    for page in pages:
+        starts.append(pos)
+        pos += len(page) + 1
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                                              add_start_index=True)
+    out = []
+    for doc in splitter.create_documents(["\n".join(pages)]):
+        start = doc.metadata["start_index"]
+        end = start + max(len(doc.page_content) - 1, 0)
+        out.append((doc.page_content, bisect_right(starts, start), bisect_right(starts, end)))
+    return out
 
 def _sha256(path: str) -> str:
     h = hashlib.sha256()
@@ -23,76 +47,348 @@ def _sha256(path: str) -> str:
     return h.hexdigest()
 
 def _get_collection():
-    client = chromadb.PersistentClient(path=DB_DIR)
+    return get_engine().get_collection(COLLECTION, create=True)
+
+def _get_manifest() -> IngestManifest:
+    return IngestManifest(os.path.join(get_engine().db_path, MANIFEST_FILE))
+
+def _migrate_legacy_manifest(col, manifest: IngestManifest) -> int:
+    """
+    Move old in-index manifest rows ("[DOC] fname", chunk == -1) into the
+    sidecar manifest and delete them from the vector index.
+    """
+    res = col.get(where={"chunk": -1}, include=["metadatas"])
+    if not res["ids"]:
+        return 0
+    for meta in res["metadatas"]:
+        if not meta or "sha256" not in meta or "doc_id" not in meta:
+            continue
+        n = len(col.get(where={"doc_id": meta["doc_id"]}, include=[])["ids"]) - 1
+        # mtime/size unknown: the next run hashes once and records them
+        manifest.upsert(meta["doc_id"], meta.get("source", ""), meta["sha256"], None, None,
+                        max(n, 0), CHUNK_SIZE, CHUNK_OVERLAP)
+    col.delete(where={"chunk": -1})
+    return len(res["ids"])
+
+def _prepare_doc(fpath: str, known_sha: Optional[str], sha: Optional[str] = None,
+                 cache_dir: Optional[str] = None) -> Dict:
+    """
+    CPU stage, run in a worker process: hash, extract and chunk one PDF.
+    Returns only the hash when the file is unchanged. Pass `sha` when the
+    caller already hashed the file (e.g. while streaming an upload). Page
+    text comes from the extracted-text cache when this content was parsed
+    before, so re-chunking never re-parses the PDF.
+    """
+    fname = os.path.basename(fpath)
+    t0 = time.perf_counter()
+    sha = sha or _sha256(fpath)
+    t1 = time.perf_counter()
+    out = {"fname": fname, "sha256": sha, "doc_id": f"doc::{fname}", "chunks": None,
+           "hash_s": t1 - t0, "extract_s": 0.0, "chunk_s": 0.0, "text_cached": None}
+    if known_sha == sha:
+        return out  # unchanged
+
+    cache = PageTextCache(cache_dir or TEXT_CACHE_DIR)
+    pages, out["text_cached"] = cache.get_or_extract(sha, lambda: _pdf_pages(fpath))
+    t2 = time.perf_counter()
+    chunked = _chunk_pages(pages)
+    out["chunks"] = [ch for ch, _, _ in chunked]
+    out["pages"] = [(first, last) for _, first, last in chunked]
+    out["topics"] = [sorted(match_topic_packs(ch)) for ch in out["chunks"]]
+    out["extract_s"] = t2 - t1
+    out["chunk_s"] = time.perf_counter() - t2
+    return out
+
+def _iter_prepared(jobs: List[Tuple[str, Optional[str]]], workers: int):
+    """Yield prepared docs for (path, known_sha) jobs as they finish; inline when workers <= 1."""
+    if workers <= 1 or len(jobs) <= 1:
+        for path, known_sha in jobs:
+            yield _prepare_doc(path, known_sha, cache_dir=TEXT_CACHE_DIR)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_prepare_doc, path, known_sha, None, TEXT_CACHE_DIR) for path, known_sha in jobs]
+        try:
+            for fut in as_completed(futures):
+                yield fut.result()
+        finally:
+            for fut in futures:   # caller stopped early (cancel): drop queued work
+                fut.cancel()
+
+class _EmbedWriter:
+    """
+    Single embedding stage: buffers rows from any number of documents and
+    embeds + writes them in fixed-size batches. Callbacks queued with
+    on_written() run once every row added before them has been written.
+    """
+
+    def __init__(self, col, embed, batch_size: int):
+        self.col = col
+        self.embed = embed
+        self.batch_size = max(1, batch_size)
+        self.ids: List[str] = []
+        self.docs: List[str] = []
+        self.metas: List[Dict] = []
+        self.pending: List[Callable[[], None]] = []
+        self.embed_s = 0.0
+        self.write_s = 0.0
+        self.batches = 0
+        self.written = 0
+
+    def add(self, _id: str, doc: str, meta: Dict):
+        self.ids.append(_id)
+        self.docs.append(doc)
+        self.metas.append(meta)
+        if len(self.ids) >= self.batch_size:
+            self.flush()
+
+    def on_written(self, callback: Callable[[], None]):
+        if self.ids:
+            self.pending.append(callback)
+        else:
+            callback()
+
+    def flush(self):
+        if self.ids:
+            t0 = time.perf_counter()
+            vectors = self.embed(self.docs)
+            t1 = time.perf_counter()
+            self.col.add(ids=self.ids, documents=self.docs, metadatas=self.metas, embeddings=vectors)
+            self.write_s += time.perf_counter() - t1
+            self.embed_s += t1 - t0
+            self.batches += 1
+            self.written += len(self.ids)
+            self.ids, self.docs, self.metas = [], [], []
+        pending, self.pending = self.pending, []
+        for callback in pending:
+            callback()
+
+def _queue_doc(col, writer: _EmbedWriter, manifest: IngestManifest, prepared: Dict, st) -> Optional[int]:
+    """
+    Replace one prepared document's chunks in the index via `writer`.
+    Returns the number of chunks queued, or None if the content is unchanged.
+    """
+    chunks = prepared["chunks"]
+    fname, sha, doc_id = prepared["fname"], prepared["sha256"], prepared["doc_id"]
+    if chunks is None:
+        manifest.touch(doc_id, st.st_mtime_ns, st.st_size)  # same content, new mtime
+        return None
+
+    # delete old records for this doc
+    try:
+        col.delete(where={"source": fname})
+    except Exception:
+        pass
+
+    for i, ch in enumerate(chunks):
+        page, page_end = prepared["pages"][i]
+        writer.add(f"{doc_id}::chunk::{i}", ch,
+                   {"source": fname, "chunk": i, "sha256": sha, "doc_id": doc_id,
+                    "page": page, "page_end": page_end, **topic_flags(prepared["topics"][i])})
+
+    # manifest row is committed only after all of this doc's chunks are written
+    writer.on_written(lambda: manifest.upsert(doc_id, fname, sha, st.st_mtime_ns, st.st_size,
+                                              len(chunks), CHUNK_SIZE, CHUNK_OVERLAP))
+    return len(chunks)
+
+def _retag_topics(col, batch_size: int = 512) -> int:
+    """
+    Metadata-only re-tag of chunks tagged under an older TOPIC_PACKS (or
+    none): no re-embedding. Skipped entirely once the marker file is current.
+    """
+    marker = os.path.join(get_engine().db_path, TOPICS_VERSION_FILE)
     try:
-        col = client.get_collection(COLLECTION)
-    except:
-        col = client.create_collection(COLLECTION)
-    return col
+        with open(marker) as f:
+            if f.read().strip() == TOPIC_TAGS_VERSION:
+                return 0
+    except OSError:
+        pass
+    retagged = 0
+    for offset in range(0, col.count(), batch_size):   # paged, like RetrievalEngine._collection_pages
+        page = col.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        stale = [(_id, doc, meta) for _id, doc, meta in zip(page["ids"], page["documents"], page["metadatas"])
+                 if meta and meta.get("chunk", -1) >= 0 and meta.get("topics_v") != TOPIC_TAGS_VERSION]
+        if stale:
+            col.update(ids=[_id for _id, _, _ in stale], metadatas=[
+                {**meta, **topic_flags(match_topic_packs(doc))} for _, doc, meta in stale
+            ])
+            retagged += len(stale)
+    with open(marker, "w") as f:
+        f.write(TOPIC_TAGS_VERSION)
+    return retagged
+
+def _known_sha(manifest: IngestManifest, fname: str) -> Optional[str]:
+    """Stored hash for fname, or None when missing or chunked with other params."""
+    row = manifest.get(f"doc::{fname}")
+    if row and (row["chunk_size"], row["chunk_overlap"]) == (CHUNK_SIZE, CHUNK_OVERLAP):
+        return row["sha256"]
+    return None
+
+def _rate(n: int, seconds: float) -> float:
+    return round(n / seconds, 2) if seconds > 0 else 0.0
+
+def ingest_all(
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    progress: Optional[Callable[[Dict], None]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> Dict:
+    """
+    Incremental ingest all PDFs in data/papers.
+
+    Hashing, PDF extraction and chunking run in a process pool of `workers`;
+    their output feeds one embedding stage that embeds in batches of
+    `batch_size` chunks. The result includes per-stage throughput.
+
+    `progress` receives {docs_total, docs_done, chunks_done} after every
+    document; setting `cancel` stops after the current document (finished
+    documents stay committed, the rest are picked up by the next run).
+    """
+    workers = INGEST_WORKERS if workers is None else workers
+    batch_size = EMBED_BATCH_SIZE if batch_size is None else batch_size
+    t_start = time.perf_counter()
 
-def ingest_all() -> Dict:
-    """Incremental ingest all PDFs in data/papers."""
     os.makedirs(DATA_DIR, exist_ok=True)
     col = _get_collection()
+    manifest = _get_manifest()
 
-    # load existing hashes
-    existing = {}
-    offset=0; page=500
-    while True:
-        res = col.get(include=["metadatas"], limit=page, offset=offset)
-        if not res["ids"]:
-            break
-        for _id, meta in zip(res["ids"], res["metadatas"]):
-            if meta and "sha256" in meta and "doc_id" in meta and meta.get("chunk",-1)==-1:
-                existing[meta["doc_id"]] = meta["sha256"]
-        offset += page
+    # existing docs come from the sidecar manifest: O(documents), no vector scan
+    existing = manifest.all()
+    if not existing:
+        _migrate_legacy_manifest(col, manifest)
+        existing = manifest.all()
+
+    paths = [
+        os.path.join(DATA_DIR, fname) for fname in sorted(os.listdir(DATA_DIR))
+        if fname.lower().endswith(".pdf")
+    ]
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    # cheap change detection first: mtime + size + chunking params; hash only on mismatch
+    stats, jobs = {}, []
+    for fpath in paths:
+        fname = os.path.basename(fpath)
+        st = os.stat(fpath)
+        stats[fname] = st
+        row = existing.get(f"doc::{fname}")
+        same_params = bool(row) and (row["chunk_size"], row["chunk_overlap"]) == (CHUNK_SIZE, CHUNK_OVERLAP)
+        if same_params and (row["mtime_ns"], row["size"]) == (st.st_mtime_ns, st.st_size):
+            continue  # unchanged, not even hashed
+        jobs.append((fpath, row["sha256"] if same_params else None))
+
+    # documents that disappeared from disk
+    removed_docs = 0
+    for doc_id, row in existing.items():
+        if row["source"] not in stats:
+            try:
+                col.delete(where={"source": row["source"]})
+            except Exception:
+                pass
+            manifest.delete(doc_id)
+            removed_docs += 1
+
+    writer = _EmbedWriter(col, get_engine().embedding_function, batch_size)
 
     added_docs = 0
     added_chunks = 0
+    docs_done = 0
+    cancelled = False
+    hash_s = extract_s = chunk_s = 0.0
+    text_cache_hits = 0
 
-    for fname in os.listdir(DATA_DIR):
-        if not fname.lower().endswith(".pdf"): 
-            continue
-        fpath = os.path.join(DATA_DIR, fname)
-        sha = _sha256(fpath)
-        doc_id = f"doc::{fname}"
+    def _report():
+        if progress:
+            progress({"docs_total": len(jobs), "docs_done": docs_done, "chunks_done": writer.written})
 
-        if existing.get(doc_id) == sha:
-            continue  # unchanged
+    _report()
+    for prepared in _iter_prepared(jobs, workers):
+        if cancel is not None and cancel.is_set():
+            cancelled = True
+            break
+        docs_done += 1
+        hash_s += prepared["hash_s"]
+        extract_s += prepared["extract_s"]
+        chunk_s += prepared["chunk_s"]
+        text_cache_hits += bool(prepared["text_cached"])
+        n = _queue_doc(col, writer, manifest, prepared, stats[prepared["fname"]])
+        if n is not None:
+            added_docs += 1
+            added_chunks += n
+        _report()
 
-        text = _pdf_text(fpath)
-        chunks = splitter.split_text(text)
+    writer.flush()
+    _report()
 
-        # delete old records for this doc
-        try:
-            col.delete(where={"source": fname})
-        except Exception:
-            pass
+    retagged = 0 if cancelled else _retag_topics(col)
+    if not cancelled:   # drop extracted text of removed/replaced documents and old extractor versions
+        PageTextCache(TEXT_CACHE_DIR).prune(row["sha256"] for row in manifest.all().values())
+
+    lexical_s = vectors_s = 0.0
+    if added_docs or removed_docs or retagged:
+        built = get_engine().publish_corpus(COLLECTION)
+        lexical_s, vectors_s = built["lexical_s"], built["vectors_s"]
+
+    wall_s = time.perf_counter() - t_start
+    return {
+        "added_docs": added_docs,
+        "added_chunks": added_chunks,
+        "removed_docs": removed_docs,
+        "retagged_chunks": retagged,
+        "cancelled": cancelled,
+        "scanned_docs": len(paths),
+        "hashed_docs": len(jobs),
+        "workers": workers,
+        "batch_size": batch_size,
+        "embed_batches": writer.batches,
+        "text_cache_hits": text_cache_hits,
+        "wall_s": round(wall_s, 3),
+        "stages": {
+            # CPU stages are summed across workers (worker-seconds)
+            "hash": {"seconds": round(hash_s, 3), "docs_per_s": _rate(len(jobs), hash_s)},
+            # extraction includes text cache reads; hits skip PDF parsing
+            "extract": {"seconds": round(extract_s, 3), "docs_per_s": _rate(added_docs, extract_s)},
+            "chunk": {"seconds": round(chunk_s, 3), "chunks_per_s": _rate(added_chunks, chunk_s)},
+            "embed": {"seconds": round(writer.embed_s, 3), "chunks_per_s": _rate(added_chunks, writer.embed_s)},
+            "write": {"seconds": round(writer.write_s, 3), "chunks_per_s": _rate(added_chunks, writer.write_s)},
+            "lexical_index": {"seconds": round(lexical_s, 3)},
+            "vector_index": {"seconds": round(vectors_s, 3)},
+        },
+    }
+
+def ingest_file(fpath: str, sha: Optional[str] = None) -> Dict:
+    """
+    Incrementally index a single PDF (e.g. right after upload) without
+    scanning the rest of data/papers.
+    """
+    t_start = time.perf_counter()
+    col = _get_collection()
+    manifest = _get_manifest()
+    fname = os.path.basename(fpath)
+    st = os.stat(fpath)
 
-        ids, docs, metas = [], [], []
-        for i, ch in enumerate(chunks):
-            ids.append(f"{doc_id}::chunk::{i}")
-            docs.append(ch)
-            metas.append({"source": fname, "chunk": i, "sha256": sha, "doc_id": doc_id})
+    prepared = _prepare_doc(fpath, _known_sha(manifest, fname), sha=sha)
+    writer = _EmbedWriter(col, get_engine().embedding_function, EMBED_BATCH_SIZE)
+    n = _queue_doc(col, writer, manifest, prepared, st)
+    writer.flush()
 
-        # tiny manifest row for doc
-        ids.append(doc_id)
-        docs.append(f"[DOC] {fname}")
-        metas.append({"source": fname, "chunk": -1, "sha256": sha, "doc_id": doc_id})
+    if n is not None:
+        get_engine().publish_corpus(COLLECTION)
 
-        col.add(ids=ids, documents=docs, metadatas=metas)
-        added_docs += 1
-        added_chunks += len(chunks)
+    return {
+        "source": fname,
+        "sha256": prepared["sha256"],
+        "added_docs": int(n is not None),
+        "added_chunks": n or 0,
+        "wall_s": round(time.perf_counter() - t_start, 3),
+    }
 
-    return {"added_docs": added_docs, "added_chunks": added_chunks}
+def find_ingested_by_sha(sha: str) -> Optional[Dict]:
+    """Manifest row of an already-ingested document with this content hash."""
+    return _get_manifest().find_by_sha(sha)
 
 def collection_stats() -> Dict:
     """Quick stats for the dashboard."""
     try:
-        col = _get_collection()
-        res = col.count()
-        return {"collection": COLLECTION, "vectors": res, "db_dir": DB_DIR}
+        res = get_engine().count(COLLECTION)
+        return {"collection": COLLECTION, "vectors": res, "documents": _get_manifest().count(),
+                "db_dir": DB_DIR}
     except Exception as e:
-        return {"error": str(e), "collection": COLLECTION, "vectors": 0, "db_dir": DB_DIR}
\ No newline at end of file
+        return {"error": str(e), "collection": COLLECTION, "vectors": 0, "db_dir": DB_DIR}
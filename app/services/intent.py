@@ -2,44 +2,49 @@ from app.schemas import IntentResult
 import re
 
 # Very simple heuristics; replace with small LLM or classifier later.
+# (intent, confidence, keywords) in priority order: the first intent with a keyword in the text wins.
+INTENT_KEYWORDS = [
+    ("summarize", 0.75, ["summarize", "summary", "synthesize"]),
+    ("compare", 0.7, ["compare", "contrast", "vs.", "versus"]),
+    ("extract", 0.65, ["extract", "pull out", "list all", "what are the"]),
+    ("cite", 0.6, ["cite", "citation", "references", "page"]),
+    ("critique", 0.6, ["critique", "limitations", "reviewer", "revise"]),
+]
+
+ACRONYMS = {
+    "cpes": "Cannabis Pain Expectancies Scale",
+    "eds": "Everyday Discrimination Scale",
+    "act": "Acceptance and Commitment Therapy",
+    "mturk": "Amazon Mechanical Turk",
+}
+
+# Intent-specific preambles (helps Step 3 retrieval later)
+PREAMBLES = {
+    "summarize": "Task: summarize. Scope: peer-reviewed PDFs in corpus. Query: {msg}.",
+    "compare": "Task: compare across papers/studies. Query: {msg}.",
+    "extract": "Task: extract structured facts (N, population, outcomes, effect direction). Query: {msg}.",
+    "cite": "Task: provide page-level citations supporting user query. Query: {msg}.",
+    "critique": "Task: critique methods/limitations. Query: {msg}.",
+}
+
+_ws = re.compile(r"\s+")
+_acronym_res = [(re.compile(rf"\b{k}\b", re.IGNORECASE), v) for k, v in ACRONYMS.items()]
+
 def classify_intent(message: str) -> IntentResult:
     text = message.lower()
 
-    if any(k in text for k in ["summarize", "summary", "synthesize"]):
-        return IntentResult(intent="summarize", confidence=0.75)
-    if any(k in text for k in ["compare", "contrast", "vs.", "versus"]):
-        return IntentResult(intent="compare", confidence=0.7)
-    if any(k in text for k in ["extract", "pull out", "list all", "what are the"]):
-        return IntentResult(intent="extract", confidence=0.65)
-    if any(k in text for k in ["cite", "citation", "references", "page"]):
-        return IntentResult(intent="cite", confidence=0.6)
-    if any(k in text for k in ["critique", "limitations", "reviewer", "revise"]):
-        return IntentResult(intent="critique", confidence=0.6)
+    for intent, confidence, keywords in INTENT_KEYWORDS:
+        if any(k in text for k in keywords):
+            return IntentResult(intent=intent, confidence=confidence)
 
     return IntentResult(intent="other", confidence=0.4)
 
 def normalize_message(message: str, intent: str) -> str:
     # Strip boilerplate, standardize whitespace, expand common acronyms (cheap stub).
-    msg = re.sub(r"\s+", " ", message).strip()
-
-    replacements = {
-        "cpes": "Cannabis Pain Expectancies Scale",
-        "eds": "Everyday Discrimination Scale",
-        "act": "Acceptance and Commitment Therapy",
-        "mturk": "Amazon Mechanical Turk",
-    }
-    for k, v in replacements.items():
-        msg = re.sub(rf"\b{k}\b", v, msg, flags=re.IGNORECASE)
-
-    # Intent-specific preambles (helps Step 3 retrieval later)
-    if intent == "summarize":
-        return f"Task: summarize. Scope: peer-reviewed PDFs in corpus. Query: {msg}."
-    if intent == "compare":
-        return f"Task: compare across papers/studies. Query: {msg}."
-    if intent == "extract":
-        return f"Task: extract structured facts (N, population, outcomes, effect direction). Query: {msg}."
-    if intent == "cite":
-        return f"Task: provide page-level citations supporting user query. Query: {msg}."
-    if intent == "critique":
-        return f"Task: critique methods/limitations. Query: {msg}."
-    return msg
+    msg = _ws.sub(" ", message).strip()
+
+    for rx, v in _acronym_res:
+        msg = rx.sub(v, msg)
+
+    preamble = PREAMBLES.get(intent)
+    return preamble.format(msg=msg) if preamble else msg
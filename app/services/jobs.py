@@ -0,0 +1,169 @@
+# app/services/jobs.py
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from app.services.retrieval import get_engine
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: fall back to the in-process guard only
+    fcntl = None
+
+REINDEX_LOCK_FILE = "reindex.lock"   # inside the Chroma DB dir; held for the job's lifetime
+MAX_JOBS_KEPT = 20
+
+
+class JobConflict(Exception):
+    """Raised when a reindex is requested while another one is running."""
+
+    def __init__(self, running_id: Optional[str]):
+        super().__init__("A reindex job is already running.")
+        self.running_id = running_id
+
+
+class ReindexJobs:
+    """
+    Runs reindexing as background jobs, one at a time.
+
+    Each job runs ingest in its own thread, so request workers stay free for
+    chat traffic. A file lock next to the index keeps other uvicorn worker
+    processes from starting a second reindex concurrently; run_exclusive
+    holds the same lock for smaller index writes (single-file ingest).
+    """
+
+    def __init__(self, run: Callable[..., Dict], lock_dir: Optional[str] = None):
+        self._run = run
+        self._lock_dir = lock_dir
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._cancel: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._running_id: Optional[str] = None
+        self._exclusive = False
+
+    def _acquire_file_lock(self):
+        if fcntl is None:
+            return None
+        lock_dir = self._lock_dir or get_engine().db_path
+        os.makedirs(lock_dir, exist_ok=True)
+        fh = open(os.path.join(lock_dir, REINDEX_LOCK_FILE), "w")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            raise JobConflict(None)
+        return fh
+
+    def start(self) -> Dict:
+        """Start a reindex job; raises JobConflict if one is already running."""
+        with self._lock:
+            if self._running_id is not None or self._exclusive:
+                raise JobConflict(self._running_id)
+            lock_fh = self._acquire_file_lock()
+            job_id = uuid.uuid4().hex[:12]
+            job = {
+                "id": job_id,
+                "kind": "reindex",
+                "state": "running",
+                "created_at": time.time(),
+                "finished_at": None,
+                "docs_total": None,
+                "docs_done": 0,
+                "chunks_done": 0,
+                "docs_per_s": 0.0,
+                "chunks_per_s": 0.0,
+                "eta_s": None,
+                "result": None,
+                "error": None,
+            }
+            self._jobs[job_id] = job
+            self._cancel[job_id] = threading.Event()
+            self._running_id = job_id
+            while len(self._jobs) > MAX_JOBS_KEPT:
+                old_id, _ = self._jobs.popitem(last=False)
+                self._cancel.pop(old_id, None)
+
+        t = threading.Thread(target=self._worker, args=(job_id, lock_fh),
+                             name=f"reindex-{job_id}", daemon=True)
+        t.start()
+        return self.get(job_id)
+
+    def run_exclusive(self, fn: Callable[..., Dict], *args, **kwargs) -> Dict:
+        """
+        Run `fn` in the calling thread under the reindex lock; raises
+        JobConflict if a reindex (here or in another worker) holds it.
+        """
+        with self._lock:
+            if self._running_id is not None or self._exclusive:
+                raise JobConflict(self._running_id)
+            lock_fh = self._acquire_file_lock()
+            self._exclusive = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if lock_fh is not None:
+                lock_fh.close()
+            with self._lock:
+                self._exclusive = False
+
+    def _on_progress(self, job_id: str, p: Dict):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            elapsed = max(time.time() - job["created_at"], 1e-6)
+            job.update(p)
+            job["docs_per_s"] = round(job["docs_done"] / elapsed, 3)
+            job["chunks_per_s"] = round(job["chunks_done"] / elapsed, 2)
+            remaining = (job["docs_total"] or 0) - job["docs_done"]
+            job["eta_s"] = round(remaining / job["docs_per_s"], 1) if job["docs_per_s"] else None
+
+    def _worker(self, job_id: str, lock_fh):
+        cancel = self._cancel[job_id]
+        try:
+            result = self._run(progress=lambda p: self._on_progress(job_id, p), cancel=cancel)
+            state, error = ("cancelled" if result.get("cancelled") else "succeeded"), None
+        except Exception as e:
+            result, state, error = None, "failed", str(e)
+        finally:
+            if lock_fh is not None:
+                lock_fh.close()   # releases the flock
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(state=state, result=result, error=error,
+                           finished_at=time.time(), eta_s=0 if state == "succeeded" else None)
+            self._running_id = None
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self):
+        with self._lock:
+            return [dict(j) for j in reversed(self._jobs.values())]
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """Request cancellation; the job stops after its current document."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["state"] == "running":
+                job["state"] = "cancelling"
+                self._cancel[job_id].set()
+            return dict(job)
+
+    def running_id(self) -> Optional[str]:
+        with self._lock:
+            return self._running_id
+
+    def shutdown(self):
+        """Ask a running job to stop (app shutdown)."""
+        running = self.running_id()
+        if running:
+            self.cancel(running)
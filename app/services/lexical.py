@@ -0,0 +1,125 @@
+# app/services/lexical.py
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+LEXICAL_ENABLED = os.getenv("LEXICAL_ENABLED", "1") not in ("0", "false", "False")
+LEXICAL_INDEX_FILE = "bm25_{name}.json.gz"   # lives inside DB_DIR; rebuilt by ingest
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Dense retrieval is skipped for short queries made mostly of rare terms
+KEYWORD_MAX_TERMS = int(os.getenv("LEXICAL_KEYWORD_MAX_TERMS", "4"))
+RARE_DF_RATIO = float(os.getenv("LEXICAL_RARE_DF_RATIO", "0.02"))      # in <= 2% of chunks
+RARE_TERM_FRACTION = float(os.getenv("LEXICAL_RARE_TERM_FRACTION", "0.5"))
+
+_token_re = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how in is it its of on or that the this to was were
+what when where which who why with about do does did can could should would there their these
+those than then so such into over under between vs versus i we you they he she me my our your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric terms without stopwords; single letters dropped, digits kept."""
+    return [t for t in _token_re.findall((text or "").lower())
+            if t not in STOPWORDS and (len(t) > 1 or t.isdigit())]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the same chunks as the vector index.
+
+    Postings are term -> [(doc, tf)], so a query touches only the chunks
+    containing its terms. Each hit also gets a `coverage` in [0, 1]: the
+    idf-weighted share of query terms the chunk contains, used as its
+    relevance score next to cosine similarities.
+    """
+
+    def __init__(self, docs: List[Dict], postings: Dict[str, List[Tuple[int, int]]],
+                 lengths: List[int], version: str = "0"):
+        self.docs = docs            # [{"source", "chunk", "text", "topics"[, "page"][, "id"]}]
+        self.postings = postings
+        self.lengths = lengths
+        self.version = version
+        self.n = len(docs)
+        self.avgdl = (sum(lengths) / self.n) if self.n else 0.0
+
+    @classmethod
+    def build(cls, rows: Iterable[Tuple], version: str = "0") -> "BM25Index":
+        """rows: (source, chunk, text), optionally followed by topic packs and the first page."""
+        docs, lengths = [], []
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for source, chunk, text, *extra in rows:
+            idx = len(docs)
+            terms = tokenize(text)
+            doc = {"source": source, "chunk": chunk, "text": text, "topics": list(extra[0]) if extra else []}
+            if len(extra) > 1 and extra[1]:
+                doc["page"] = extra[1]
+            if len(extra) > 2 and extra[2]:
+                doc["id"] = extra[2]   # collection id: lets search look up the chunk's embedding
+            docs.append(doc)
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings[term].append((idx, tf))
+        return cls(docs, dict(postings), lengths, version)
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1.0 + (self.n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 12, packs=None) -> List[Tuple[int, float, float]]:
+        """Best chunks for `query` as (doc index, bm25 score, coverage), optionally within topic packs."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.n:
+            return []
+        packs = set(packs) if packs else None
+        idfs = {t: self.idf(t) for t in terms}
+        total_idf = sum(idfs.values()) or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, float] = defaultdict(float)
+        for term in terms:
+            idf = idfs[term]
+            for idx, tf in self.postings.get(term, ()):
+                if packs and packs.isdisjoint(self.docs[idx].get("topics", ())):
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[idx] / (self.avgdl or 1.0))
+                scores[idx] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+                matched[idx] += idf
+        best = heapq.nlargest(top_k, scores.items(), key=lambda kv: kv[1])
+        return [(idx, score, matched[idx] / total_idf) for idx, score in best]
+
+    def is_keyword_query(self, query: str) -> bool:
+        """
+        True for short queries where most terms are rare in the corpus
+        (e.g. "divalproex", "PATH Wave 6"): exact matches beat embeddings.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or len(terms) > KEYWORD_MAX_TERMS or not self.n:
+            return False
+        rare = sum(1 for t in terms if 0 < len(self.postings.get(t, ())) <= RARE_DF_RATIO * self.n)
+        return rare >= max(1, math.ceil(RARE_TERM_FRACTION * len(terms)))
+
+    def save(self, path: str):
+        tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"   # concurrent builders never share a tmp file
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=3) as f:
+            json.dump({"version": self.version, "docs": self.docs, "lengths": self.lengths,
+                       "postings": self.postings}, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        postings = {t: [tuple(p) for p in plist] for t, plist in data["postings"].items()}
+        return cls(data["docs"], postings, data["lengths"], data["version"])
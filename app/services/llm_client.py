@@ -0,0 +1,269 @@
+# app/services/llm_client.py
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+HF_TEXTGEN_URL = os.getenv("HF_TEXTGEN_URL")   # e.g. a local TGI: http://localhost:8080/generate
+LLM_TIMEOUT_SEC = float(os.getenv("LLM_TIMEOUT_SEC", "30"))           # per-call deadline
+LLM_CONNECT_TIMEOUT_SEC = float(os.getenv("LLM_CONNECT_TIMEOUT_SEC", "5"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SEC = float(os.getenv("LLM_BREAKER_RESET_SEC", "30"))
+
+
+class LLMUnavailable(Exception):
+    """The call failed, timed out, or was not attempted; callers fall back."""
+
+
+class CircuitOpen(LLMUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive failures; open -> half_open
+    once `reset_after` seconds have passed, letting a single trial call
+    through; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, reset_after: float = LLM_BREAKER_RESET_SEC,
+                 clock=time.monotonic):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state_locked()
+
+    def _state_locked(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state_locked()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial = False
+
+    def release(self):
+        """An admitted call ended without an outcome (cancelled, abandoned): free the trial slot."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._trial or self._consecutive >= self.failures:
+                if self._opened_at is None or self._trial:
+                    self.trips += 1
+                self._opened_at = self._clock()
+            self._trial = False
+
+
+class LLMClient:
+    """
+    Async client for a text-generation-inference style endpoint
+    (POST {"inputs", "parameters"}; SSE `data:` lines when streaming).
+
+    One pooled httpx.AsyncClient per event loop, a semaphore capping calls in
+    flight, a deadline covering queueing + the whole response, and a circuit
+    breaker that rejects calls outright while the endpoint keeps failing.
+    """
+
+    def __init__(self, url: str, token: Optional[str] = None, timeout: float = LLM_TIMEOUT_SEC,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, breaker: Optional[CircuitBreaker] = None):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self._http: Optional[httpx.AsyncClient] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self.counters = {"calls": 0, "failures": 0, "timeouts": 0, "rejected": 0, "stale_sessions": 0}
+
+    def _retire(self, http: httpx.AsyncClient, loop):
+        """
+        Close a session left behind on another event loop, on that loop. If
+        the loop is already closed its connections cannot be closed any more;
+        count them so a loop-hopping caller shows up in stats().
+        """
+        if loop is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(http.aclose(), loop)
+        else:
+            self.counters["stale_sessions"] += 1
+
+    def _session(self):
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            # connections and the semaphore belong to one loop (the app's, or a wrapper's asyncio.run)
+            if self._http is not None:
+                self._retire(self._http, self._loop)
+            headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+            self._http = httpx.AsyncClient(
+                headers=headers,
+                timeout=httpx.Timeout(self.timeout, connect=LLM_CONNECT_TIMEOUT_SEC),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+            )
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._http, self._sem
+
+    async def aclose(self):
+        if self._http is not None:
+            if self._loop is asyncio.get_running_loop():
+                await self._http.aclose()
+            else:
+                self._retire(self._http, self._loop)
+        self._http = self._sem = self._loop = None
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self.counters["rejected"] += 1
+            raise CircuitOpen("circuit open")
+        self.counters["calls"] += 1
+
+    def _failed(self, e: BaseException) -> LLMUnavailable:
+        self.breaker.record_failure()
+        self.counters["failures"] += 1
+        if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)):
+            self.counters["timeouts"] += 1
+            return LLMUnavailable("deadline exceeded")
+        if isinstance(e, LLMUnavailable):
+            return e
+        return LLMUnavailable(str(e) or type(e).__name__)
+
+    def _payload(self, prompt: str, params: Dict, stream: bool) -> Dict:
+        return {"inputs": prompt, "parameters": {**params, "return_full_text": False}, "stream": stream}
+
+    async def generate(self, prompt: str, params: Dict, timeout: Optional[float] = None) -> str:
+        self._admit()
+        http, sem = self._session()
+
+        async def call():
+            async with sem:
+                r = await http.post(self.url, json=self._payload(prompt, params, False))
+                r.raise_for_status()
+                data = r.json()
+            if isinstance(data, list):
+                data = data[0] if data else {}
+            if "error" in data:
+                raise LLMUnavailable(str(data["error"]))
+            return data.get("generated_text", "")
+
+        try:
+            text = await asyncio.wait_for(call(), timeout or self.timeout)
+        except Exception as e:
+            raise self._failed(e) from e
+        except BaseException:
+            self.breaker.release()   # cancelled: no verdict on the endpoint
+            raise
+        self.breaker.record_success()
+        return text
+
+    async def stream(self, prompt: str, params: Dict, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Yield token texts; the deadline bounds the whole stream, not each token."""
+        self._admit()
+        http, sem = self._session()
+        deadline = time.monotonic() + (timeout or self.timeout)
+
+        def remaining() -> float:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise asyncio.TimeoutError()
+            return left
+
+        try:
+            await asyncio.wait_for(sem.acquire(), remaining())
+        except Exception as e:
+            raise self._failed(e) from e
+        except BaseException:
+            self.breaker.release()
+            raise
+        try:
+            async with http.stream("POST", self.url, json=self._payload(prompt, params, True)) as r:
+                r.raise_for_status()
+                lines = r.aiter_lines()
+                while True:
+                    try:
+                        line = await asyncio.wait_for(lines.__anext__(), remaining())
+                    except StopAsyncIteration:
+                        break
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[5:])
+                    if "error" in event:
+                        raise LLMUnavailable(str(event["error"]))
+                    token = event.get("token") or {}
+                    if token.get("text") and not token.get("special"):
+                        yield token["text"]
+        except Exception as e:
+            raise self._failed(e) from e
+        except BaseException:
+            self.breaker.release()   # cancelled, or the caller closed the generator mid-stream
+            raise
+        finally:
+            sem.release()
+        self.breaker.record_success()
+
+    def stats(self) -> Dict:
+        return {**self.counters, "breaker": self.breaker.state, "breaker_trips": self.breaker.trips,
+                "max_concurrency": self.max_concurrency, "timeout_sec": self.timeout}
+
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+def _endpoint():
+    token = os.getenv("HUGGINGFACEHUB_API_TOKEN") or os.getenv("HF_API_TOKEN")
+    model = os.getenv("HF_TEXTGEN_MODEL", "HuggingFaceH4/zephyr-7b-beta")
+    url = os.getenv("HF_TEXTGEN_URL", HF_TEXTGEN_URL or "")
+    if url:
+        return url, token
+    if token:
+        return f"https://router.huggingface.co/hf-inference/models/{model}", token
+    return None, None
+
+def get_llm_client() -> Optional[LLMClient]:
+    """Process-wide client, or None when no endpoint/token is configured."""
+    global _client
+    url, token = _endpoint()
+    if not url:
+        return None
+    with _client_lock:
+        if _client is None or _client.url != url or _client.token != token:
+            _client = LLMClient(url, token)
+        return _client
+
+async def shutdown_llm_client():
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.aclose()
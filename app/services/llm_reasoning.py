@@ -1,8 +1,11 @@
 # app/services/llm_reasoning.py
-from typing import List, Dict, Tuple
-import os
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+import asyncio
 import re
 
+from app.services.llm_client import CircuitOpen, LLMClient, LLMUnavailable, get_llm_client
+from app.services.metrics import LLM_FALLBACKS
+
 # Optional: lightweight cleaning for OCR-y snippets
 _ws = re.compile(r"\s+")
 
@@ -27,7 +30,8 @@ def _build_citations(retrieved: List[Dict]) -> List[str]:
         if key in seen:
             continue
         seen.add(key)
-        cites.append(f"{r.get('source','unknown.pdf')} (chunk {r.get('chunk',-1)})")
+        page = f", p. {r['page']}" if r.get("page") else ""
+        cites.append(f"{r.get('source','unknown.pdf')} (chunk {r.get('chunk',-1)}{page})")
     return cites
 
 def _fallback_answer(user_query: str, retrieved: List[Dict]) -> str:
@@ -45,80 +49,135 @@ def _fallback_answer(user_query: str, retrieved: List[Dict]) -> str:
             + "\n".join(bullets)
             + "\n\n(Use Upload/Reindex to add more sources or refine your query.)")
 
-def generate_answer(
-    user_query: str,
-    retrieved: List[Dict],
-    domain_ok: bool,
-    relevant: bool
-) -> Tuple[str, List[str]]:
-    """
-    Returns (answer_text, citations). This signature matches your router call.
-
-    Behavior:
-      - If out of domain: refuse politely.
-      - If weak/empty retrieval: say insufficient evidence.
-      - Else: Try LLM (if configured); otherwise fallback to extractive summary.
-    """
+def _guard_answer(domain_ok: bool, relevant: bool, retrieved: List[Dict]) -> Optional[str]:
+    """Refusal text when the query is out of scope or evidence is weak; else None."""
     # 0) Out-of-domain guard
     if not domain_ok:
-        return (
-            "This question appears outside the agent’s scope (pain, substance use, and related behavioral health). "
-            "Please rephrase within scope or upload relevant PDFs.",
-            []
-        )
+        return ("This question appears outside the agent’s scope (pain, substance use, and related behavioral health). "
+                "Please rephrase within scope or upload relevant PDFs.")
 
     # 1) Evidence check
     if not relevant or not retrieved:
-        return (
-            "I don’t have enough in-corpus evidence to answer this confidently. "
-            "Consider uploading opioid/pain/substance-use papers relevant to your question, then reindex.",
-            []
-        )
+        return ("I don’t have enough in-corpus evidence to answer this confidently. "
+                "Consider uploading opioid/pain/substance-use papers relevant to your question, then reindex.")
+    return None
 
-    # 2) Prepare context and citations
+def _build_prompt(user_query: str, retrieved: List[Dict]) -> str:
     context_text = _build_context(retrieved)
-    citations = _build_citations(retrieved)
-
-    # 3) Try a Hugging Face inference client if available; otherwise fallback
-    HF_TOKEN = os.getenv("HUGGINGFACEHUB_API_TOKEN") or os.getenv("HF_API_TOKEN")
-    HF_MODEL = os.getenv("HF_TEXTGEN_MODEL", "HuggingFaceH4/zephyr-7b-beta")
-
     system = (
         "You are a careful research assistant for pain/substance-use. "
         "Use ONLY the provided CONTEXT. If it’s insufficient, say so. "
         "Structure the answer concisely (2–5 bullets) and then add a 1–2 sentence rationale. "
         "Do NOT invent citations; cite using the file name and chunk index shown in CONTEXT."
     )
-    prompt = (
+    return (
         f"SYSTEM:\n{system}\n\n"
         f"USER QUERY:\n{user_query}\n\n"
         f"CONTEXT:\n{context_text}\n\n"
         "Write the answer now. If context is weak or off-topic, say so explicitly."
     )
 
-    if HF_TOKEN:
+_GEN_PARAMS = dict(max_new_tokens=400, temperature=0.2, top_p=0.9, repetition_penalty=1.1)
+LLM_UNAVAILABLE_PREFIX = "(LLM unavailable"   # degraded answers start with this; not cached
+
+def _degraded(reason, user_query: str, retrieved: List[Dict]) -> str:
+    LLM_FALLBACKS.inc(reason="circuit_open" if isinstance(reason, CircuitOpen) else "unavailable")
+    return f"{LLM_UNAVAILABLE_PREFIX}: {reason}) " + _fallback_answer(user_query, retrieved)
+
+async def agenerate_answer(
+    user_query: str,
+    retrieved: List[Dict],
+    domain_ok: bool,
+    relevant: bool,
+    client: Optional[LLMClient] = None
+) -> Tuple[str, List[str]]:
+    """
+    Returns (answer_text, citations). This signature matches your router call.
+    `client` defaults to the process-wide get_llm_client().
+
+    Behavior:
+      - If out of domain: refuse politely.
+      - If weak/empty retrieval: say insufficient evidence.
+      - Else: Try LLM (if configured); otherwise fallback to extractive summary.
+    The LLM call has a deadline and goes through the circuit breaker, so a
+    slow or failing endpoint degrades to the extractive answer.
+    """
+    guard = _guard_answer(domain_ok, relevant, retrieved)
+    if guard:
+        return (guard, [])
+
+    citations = _build_citations(retrieved)
+    client = client or get_llm_client()
+    if client is None:
+        # No endpoint/token configured → fallback
+        LLM_FALLBACKS.inc(reason="unconfigured")
+        return (_fallback_answer(user_query, retrieved), citations)
+
+    try:
+        answer = _clean(await client.generate(_build_prompt(user_query, retrieved), _GEN_PARAMS))
+    except LLMUnavailable as e:
+        return (_degraded(e, user_query, retrieved), citations)
+    if not answer:
+        LLM_FALLBACKS.inc(reason="empty")
+        return (_fallback_answer(user_query, retrieved), citations)
+    return (answer, citations)
+
+def generate_answer(
+    user_query: str,
+    retrieved: List[Dict],
+    domain_ok: bool,
+    relevant: bool
+) -> Tuple[str, List[str]]:
+    """
+    Blocking wrapper for scripts; do not call from inside the event loop.
+    Each call uses its own short-lived client (sharing the process-wide
+    circuit breaker) and closes it, leaving the app's pooled client alone.
+    """
+    async def run():
+        shared = get_llm_client()
+        client = shared and LLMClient(shared.url, shared.token, timeout=shared.timeout,
+                                      max_concurrency=shared.max_concurrency, breaker=shared.breaker)
         try:
-            # Use the raw InferenceClient (supports many text models). If your env/model
-            # only supports 'conversational', fall back gracefully.
-            from huggingface_hub import InferenceClient
-            client = InferenceClient(model=HF_MODEL, token=HF_TOKEN)
-            # Prefer text-generation endpoint for broad compatibility
-            # (some hosted models don't support chat_completion)
-            result = client.text_generation(
-                prompt,
-                max_new_tokens=400,
-                temperature=0.2,
-                top_p=0.9,
-                repetition_penalty=1.1,
-            )
-            answer = _clean(result)
-            if not answer:
-                answer = _fallback_answer(user_query, retrieved)
-            return (answer, citations)
-        except Exception as e:
-            # Graceful fallback if model/endpoint isn’t compatible
-            warn = f"(LLM unavailable: {e}) "
-            return (warn + _fallback_answer(user_query, retrieved), citations)
-
-    # 4) No HF/OpenAI configured → fallback
-    return (_fallback_answer(user_query, retrieved), citations)
+            return await agenerate_answer(user_query, retrieved, domain_ok, relevant, client)
+        finally:
+            if client is not None:
+                await client.aclose()
+    return asyncio.run(run())
+
+async def astream_answer(
+    user_query: str,
+    retrieved: List[Dict],
+    domain_ok: bool,
+    relevant: bool
+) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of agenerate_answer: yields answer text pieces as
+    the model produces them. Guards and the extractive fallback are yielded
+    as a single piece; citations come from _build_citations(retrieved).
+    """
+    guard = _guard_answer(domain_ok, relevant, retrieved)
+    if guard:
+        yield guard
+        return
+
+    client = get_llm_client()
+    if client is None:
+        LLM_FALLBACKS.inc(reason="unconfigured")
+        yield _fallback_answer(user_query, retrieved)
+        return
+
+    emitted = False
+    try:
+        async for piece in client.stream(_build_prompt(user_query, retrieved), _GEN_PARAMS):
+            emitted = True
+            yield piece
+    except LLMUnavailable as e:
+        if emitted:
+            LLM_FALLBACKS.inc(reason="interrupted")
+            yield f"\n\n(LLM stream interrupted: {e})"
+        else:
+            yield _degraded(e, user_query, retrieved)
+        return
+    if not emitted:
+        LLM_FALLBACKS.inc(reason="empty")
+        yield _fallback_answer(user_query, retrieved)
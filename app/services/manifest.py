@@ -0,0 +1,95 @@
+# app/services/manifest.py
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+MANIFEST_FILE = "ingest_manifest.sqlite3"   # lives inside the Chroma DB dir
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id        TEXT PRIMARY KEY,
+    source        TEXT NOT NULL,
+    sha256        TEXT NOT NULL,
+    mtime_ns      INTEGER,
+    size          INTEGER,
+    chunks        INTEGER NOT NULL,
+    chunk_size    INTEGER NOT NULL,
+    chunk_overlap INTEGER NOT NULL,
+    updated_at    REAL NOT NULL
+)
+"""
+
+
+class IngestManifest:
+    """
+    Sidecar record of what has been ingested, one row per document.
+
+    Change detection reads this table instead of paging through vector
+    metadata, so it costs O(documents) rather than O(chunks).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as con:
+            con.execute(_SCHEMA)
+            con.execute("CREATE INDEX IF NOT EXISTS documents_sha256 ON documents (sha256)")
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=30)
+        con.row_factory = sqlite3.Row
+        try:
+            with con:   # commit on success, roll back on error
+                yield con
+        finally:
+            con.close()
+
+    def all(self) -> Dict[str, Dict]:
+        """doc_id -> row dict for every ingested document."""
+        with self._connect() as con:
+            rows = con.execute("SELECT * FROM documents").fetchall()
+        return {r["doc_id"]: dict(r) for r in rows}
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        with self._connect() as con:
+            row = con.execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find_by_sha(self, sha256: str) -> Optional[Dict]:
+        with self._connect() as con:
+            row = con.execute("SELECT * FROM documents WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone()
+        return dict(row) if row else None
+
+    def upsert(self, doc_id: str, source: str, sha256: str, mtime_ns: Optional[int],
+               size: Optional[int], chunks: int, chunk_size: int, chunk_overlap: int):
+        with self._connect() as con:
+            con.execute(
+                """INSERT INTO documents
+                       (doc_id, source, sha256, mtime_ns, size, chunks, chunk_size, chunk_overlap, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(doc_id) DO UPDATE SET
+                       source = excluded.source, sha256 = excluded.sha256,
+                       mtime_ns = excluded.mtime_ns, size = excluded.size,
+                       chunks = excluded.chunks, chunk_size = excluded.chunk_size,
+                       chunk_overlap = excluded.chunk_overlap, updated_at = excluded.updated_at""",
+                (doc_id, source, sha256, mtime_ns, size, chunks, chunk_size, chunk_overlap, time.time()),
+            )
+
+    def touch(self, doc_id: str, mtime_ns: int, size: int):
+        """Record a new mtime/size for a document whose content hash is unchanged."""
+        with self._connect() as con:
+            con.execute(
+                "UPDATE documents SET mtime_ns = ?, size = ?, updated_at = ? WHERE doc_id = ?",
+                (mtime_ns, size, time.time(), doc_id),
+            )
+
+    def delete(self, doc_id: str):
+        with self._connect() as con:
+            con.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
+    def count(self) -> int:
+        with self._connect() as con:
+            return con.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
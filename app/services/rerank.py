@@ -0,0 +1,184 @@
+# app/services/rerank.py
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.services.structured_log import get_logger
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") not in ("0", "false", "False")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "20"))              # candidates sent to the model
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))   # per request; <= 0 waits
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "8192"))  # (query, chunk) scores
+
+log = get_logger("rerank")
+
+# (query, passages) -> one relevance score per passage, higher is better
+Scorer = Callable[[str, List[str]], Sequence[float]]
+
+
+class CrossEncoderScorer:
+    """sentence-transformers CrossEncoder, loaded on first use."""
+
+    def __init__(self, model_name: str = RERANK_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name)
+        return self._model
+
+    def __call__(self, query: str, passages: List[str]) -> Sequence[float]:
+        return self.load().predict([(query, p) for p in passages])
+
+
+def _chunk_id(item: Dict) -> str:
+    return f"{item.get('source', 'unknown')}::{item.get('chunk', -1)}"
+
+
+class Reranker:
+    """
+    Re-orders the top_k fused candidates by a (query, chunk) scorer.
+
+    Cache misses are scored in one batch on a single background thread; the
+    caller waits at most budget_ms and otherwise keeps the RRF order. A batch
+    that finishes late still fills the score cache, keyed by
+    (hash of corpus version + query, chunk id). While a batch is running,
+    other requests do not queue behind it: they keep the RRF order at once.
+    """
+
+    def __init__(self, scorer: Optional[Scorer] = None, top_k: int = RERANK_TOP_K,
+                 budget_ms: float = RERANK_BUDGET_MS, cache_size: int = RERANK_CACHE_SIZE):
+        self.scorer = scorer or CrossEncoderScorer()
+        self.top_k = top_k
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._busy = threading.Semaphore(1)   # held from submit until the batch is done
+        self.counters = {"calls": 0, "batches": 0, "scored_pairs": 0, "cache_hits": 0,
+                         "timeouts": 0, "skipped_busy": 0, "errors": 0}
+
+    @staticmethod
+    def query_key(query: str, version: str = "") -> str:
+        return hashlib.sha256(f"{version}\x00{query}".encode()).hexdigest()[:16]
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.counters[key] += n
+
+    def _cached(self, qkey: str, ids: List[str]) -> Dict[str, float]:
+        out = {}
+        with self._lock:
+            for cid in ids:
+                score = self._cache.get((qkey, cid))
+                if score is not None:
+                    self._cache.move_to_end((qkey, cid))
+                    out[cid] = score
+        return out
+
+    def _score(self, qkey: str, query: str, ids: List[str], passages: List[str]) -> Dict[str, float]:
+        try:
+            scores = [float(s) for s in self.scorer(query, passages)]
+        finally:
+            self._busy.release()
+        with self._lock:
+            for cid, score in zip(ids, scores):
+                self._cache[(qkey, cid)] = score
+                self._cache.move_to_end((qkey, cid))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self.counters["batches"] += 1
+            self.counters["scored_pairs"] += len(ids)
+        return dict(zip(ids, scores))
+
+    def rerank(self, query: str, items: List[Dict], version: str = "",
+               budget_ms: Optional[float] = None) -> List[Dict]:
+        """
+        Items best-first by rerank score (top_k only; the rest keep their
+        order after them). Returns `items` unchanged if the budget runs out,
+        the scorer is still busy with an earlier batch, or it fails.
+        """
+        if len(items) < 2 or self.top_k < 2:
+            return items
+        self._count("calls")
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        head, tail = items[:self.top_k], items[self.top_k:]
+        ids = [_chunk_id(it) for it in head]
+        qkey = self.query_key(query, version)
+
+        scores = self._cached(qkey, ids)
+        self._count("cache_hits", len(scores))
+        missing = [i for i, cid in enumerate(ids) if cid not in scores]
+        if missing:
+            if not self._busy.acquire(blocking=False):
+                self._count("skipped_busy")   # a timed-out batch still holds the worker
+                return items
+            fut = self._pool.submit(self._score, qkey, query, [ids[i] for i in missing],
+                                    [head[i].get("excerpt", "") for i in missing])
+            try:
+                scores.update(fut.result(timeout=budget_ms / 1000 if budget_ms > 0 else None))
+            except FutureTimeout:
+                self._count("timeouts")
+                return items
+            except Exception as e:
+                self._count("errors")
+                log.warning("rerank.failed", error=str(e))   # fused order kept
+                return items
+
+        ranked = []
+        for it, cid in zip(head, ids):
+            it = dict(it)
+            it["rerank_score"] = round(scores[cid], 4)
+            ranked.append(it)
+        ranked.sort(key=lambda it: it["rerank_score"], reverse=True)
+        return ranked + tail
+
+    def warm(self):
+        load = getattr(self.scorer, "load", None)
+        if load is not None:
+            try:
+                load()
+            except Exception as e:
+                log.warning("rerank.warm_incomplete", error=str(e))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self.counters)
+            out["cache_size"] = len(self._cache)
+        out.update(top_k=self.top_k, budget_ms=self.budget_ms)
+        return out
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_reranker: Optional[Reranker] = None
+_reranker_lock = threading.Lock()
+
+def get_reranker() -> Optional[Reranker]:
+    """Process-wide reranker, or None when RERANK_ENABLED is off."""
+    global _reranker
+    if not RERANK_ENABLED:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = Reranker()
+    return _reranker
+
+def shutdown_reranker():
+    global _reranker
+    with _reranker_lock:
+        if _reranker is not None:
+            _reranker.close()
+        _reranker = None
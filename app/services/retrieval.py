@@ -1,18 +1,57 @@
 # app/services/retrieval.py
 import chromadb
-from typing import List, Dict, Tuple
-import re
+import chromadb.errors
+from typing import List, Dict, Tuple, Optional, Sequence
 import os
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
 
 from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
 
+from app.services.embedding_cache import QueryEmbeddingCache
+from app.services.lexical import BM25Index, LEXICAL_ENABLED, LEXICAL_INDEX_FILE
+from app.services.topics import packs_for_terms, packs_from_metadata, topic_where
+from app.services.rerank import get_reranker
+from app.services.metrics import timed
+from app.services.structured_log import get_logger
+from app.services.vector_index import ChromaBackend, NumpyVectorIndex, VectorBackend
+
 DB_DIR = "data/chroma_db"
 COLLECTION = "papers"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+CORPUS_VERSION_FILE = "corpus_version"   # lives inside DB_DIR; bumped by ingest
+
+# Vector backend: "chroma" (HNSW) or "numpy" (exact search over a memory-mapped
+# copy of the collection's embeddings, rebuilt by ingest for each corpus version)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float16")   # numpy backend storage: float32 | float16 | int8
+VECTOR_INDEX_FILE = "vectors_{name}"                   # lives inside DB_DIR; .npy, .rows.bin, ... + .json.gz
+
+# Multi-Query Settings
+MULTI_QUERY_ENABLED = True  # Toggle multi-query on/off
+NUM_QUERY_VARIATIONS = 3    # How many variations to generate
+USE_LLM_FOR_QUERIES = False # Use LLM (requires API key) vs templates
 
-MAX_RESULTS = 12
-MIN_SCORE = 0.25
+# Retrieval Settings
+MAX_RESULTS = 12            # Results per query
+MIN_SCORE = 0.25            # Minimum relevance threshold
 TOP_N = 5
 
+# Topic filter: search only chunks tagged with the query's TOPIC_PACKS, unless
+# fewer than TOPIC_FILTER_MIN_RESULTS pass MIN_SCORE (then search everything)
+TOPIC_FILTER_ENABLED = os.getenv("TOPIC_FILTER_ENABLED", "1") not in ("0", "false", "False")
+TOPIC_FILTER_MIN_RESULTS = int(os.getenv("TOPIC_FILTER_MIN_RESULTS", "3"))
+
+log = get_logger("retrieval")
+
+# get_collection() on a missing collection: ValueError in older chromadb releases
+_COLLECTION_MISSING = (ValueError,) + tuple(
+    getattr(chromadb.errors, n) for n in ("InvalidCollectionException", "NotFoundError")
+    if hasattr(chromadb.errors, n))
+
 _whitespace = re.compile(r"\s+")
 
 def _clean_excerpt(s: str) -> str:
@@ -21,69 +60,818 @@ def _clean_excerpt(s: str) -> str:
 
 def _get_embedding_function():
     return SentenceTransformerEmbeddingFunction(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
+        model_name=EMBEDDING_MODEL
     )
 
 def passes_relevance(max_score: float, threshold: float = MIN_SCORE) -> bool:
     """Check if the max score passes the relevance threshold."""
     return max_score >= threshold
 
-def retrieve_relevant_chunks(query: str, topic_terms: List[str] = None, n_results: int = TOP_N) -> Tuple[List[Dict], float]:
+
+# ============================================================
+# STEP 0: PROCESS-WIDE RETRIEVAL ENGINE
+# ============================================================
+
+class RetrievalEngine:
+    """
+    Long-lived owner of the Chroma client, the embedding model and the
+    collection handles. One instance is shared by retrieval, ingest and /status
+    so none of them pay client or model construction per request.
+    """
+
+    def __init__(self, db_path: str = DB_DIR, model_name: str = EMBEDDING_MODEL,
+                 query_cache: Optional[QueryEmbeddingCache] = None,
+                 backend: str = VECTOR_BACKEND, vector_dtype: str = VECTOR_DTYPE):
+        if backend not in ("chroma", "numpy"):
+            raise ValueError(f"VECTOR_BACKEND must be 'chroma' or 'numpy', got {backend!r}")
+        self.db_path = db_path
+        self.model_name = model_name
+        self.backend = backend
+        self.vector_dtype = vector_dtype
+        self.query_cache = query_cache or QueryEmbeddingCache()
+        self._lock = threading.RLock()
+        self._client = None
+        self._embedding_function = None
+        self._collections: Dict[str, object] = {}
+        self._lexical: Dict[str, BM25Index] = {}
+        self._vectors: Dict[str, NumpyVectorIndex] = {}
+        self._corpus_version = "0"
+        self._corpus_version_mtime = None
+        self._reload_tried: Dict[Tuple[str, str], str] = {}   # (kind, name) -> version last reloaded for
+
+    @property
+    def client(self):
+        """Chroma PersistentClient, opened once on first use."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = chromadb.PersistentClient(path=self.db_path)
+        return self._client
+
+    @property
+    def embedding_function(self):
+        """SentenceTransformer embedding function, loaded once on first use."""
+        if self._embedding_function is None:
+            with self._lock:
+                if self._embedding_function is None:
+                    self._embedding_function = _get_embedding_function()
+        return self._embedding_function
+
+    def embed_queries(self, queries: List[str]) -> List:
+        """
+        Embed queries through the LRU cache; misses share one model call.
+        """
+        return self.query_cache.get_or_embed(
+            self.model_name, list(queries), self.embedding_function
+        )
+
+    def get_collection(self, name: str = COLLECTION, create: bool = False):
+        """
+        Return a cached collection handle.
+
+        Missing collections are not cached, so a later ingest makes them
+        visible without a restart. With create=True the collection is created.
+        """
+        col = self._collections.get(name)
+        if col is not None:
+            return col
+        with self._lock:
+            col = self._collections.get(name)
+            if col is not None:
+                return col
+            if create:
+                col = self.client.get_or_create_collection(
+                    name, embedding_function=self.embedding_function
+                )
+            else:
+                col = self.client.get_collection(
+                    name, embedding_function=self.embedding_function
+                )
+            self._collections[name] = col
+            return col
+
+    def _existing_collection(self, name: str):
+        """
+        Handle for reading ids/documents/metadata only: no embedding function,
+        so the model is not loaded, and None instead of creating a missing
+        collection.
+        """
+        col = self._collections.get(name)
+        if col is None:
+            try:
+                col = self.client.get_collection(name)
+            except _COLLECTION_MISSING:
+                return None
+        return col
+
+    def count(self, name: str = COLLECTION) -> int:
+        """Vector count without forcing the embedding model to load; 0 if there is no collection."""
+        col = self._existing_collection(name)
+        return col.count() if col is not None else 0
+
+    def invalidate(self, name: Optional[str] = None):
+        """Drop cached collection handles (all, or just one)."""
+        with self._lock:
+            if name is None:
+                self._collections.clear()
+            else:
+                self._collections.pop(name, None)
+
+    def corpus_version(self) -> str:
+        """
+        Current corpus version. Re-read only when the version file changes,
+        so every worker sees a bump made by ingest in any process.
+        """
+        path = os.path.join(self.db_path, CORPUS_VERSION_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return "0"
+        if mtime != self._corpus_version_mtime:
+            with self._lock:
+                try:
+                    with open(path) as f:
+                        self._corpus_version = f.read().strip() or "0"
+                except OSError:
+                    return self._corpus_version
+                self._corpus_version_mtime = mtime
+        return self._corpus_version
+
+    @staticmethod
+    def new_corpus_version() -> str:
+        return f"{time.time_ns():x}"
+
+    def bump_corpus_version(self, version: Optional[str] = None) -> str:
+        """
+        Publish a new corpus version (or `version`); answers cached for older
+        versions stop matching. Ingest builds the indexes for the version
+        first, so workers that see the bump find the files already in place.
+        """
+        version = version or self.new_corpus_version()
+        path = os.path.join(self.db_path, CORPUS_VERSION_FILE)
+        os.makedirs(self.db_path, exist_ok=True)
+        with self._lock:
+            tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp, "w") as f:
+                f.write(version)
+            os.replace(tmp, path)
+        return version
+
+    def _current(self, kind: str, cache: Dict, name: str, load):
+        """
+        The cached index for `name` when it matches the corpus version; else
+        the last good one while a background thread loads the files ingest
+        wrote (once per version). Requests never build an index. With nothing
+        cached yet the files are loaded inline, once.
+        """
+        version = self.corpus_version()
+        index = cache.get(name)
+        if index is not None and index.version == version:
+            return index
+        key = (kind, name)
+        if index is None:
+            with self._lock:
+                index = cache.get(name)
+                if index is None and self._reload_tried.get(key) != version:
+                    self._reload_tried[key] = version
+                    index = load()
+                    if index is not None:
+                        cache[name] = index
+                return index
+        with self._lock:
+            if self._reload_tried.get(key) == version:
+                return index
+            self._reload_tried[key] = version
+
+        def reload():
+            try:
+                fresh = load()
+            except Exception as e:
+                log.warning(f"{kind}.reload_failed", collection=name, error=str(e))
+                return
+            if fresh is not None:
+                cache[name] = fresh
+
+        threading.Thread(target=reload, name=f"{kind}-reload", daemon=True).start()
+        return index
+
+    def lexical_index(self, name: str = COLLECTION) -> Optional[BM25Index]:
+        """BM25 index saved by ingest for the current corpus version (the last good one meanwhile)."""
+        if not LEXICAL_ENABLED:
+            return None
+        return self._current("lexical_index", self._lexical, name,
+                             lambda: BM25Index.load(os.path.join(self.db_path, LEXICAL_INDEX_FILE.format(name=name))))
+
+    def _collection_pages(self, name: str, include: List[str], page_size: int):
+        col = self._existing_collection(name)
+        if col is None:
+            return
+        total = col.count()
+        for offset in range(0, total, page_size):
+            yield col.get(include=include, limit=page_size, offset=offset)
+
+    def rebuild_lexical_index(self, name: str = COLLECTION, version: Optional[str] = None,
+                              page_size: int = 5000) -> BM25Index:
+        """
+        Build the BM25 index from the collection's chunks and save it (ingest,
+        before publishing `version`; the current version by default).
+        """
+        rows = []
+        for res in self._collection_pages(name, ["documents", "metadatas"], page_size):
+            rows.extend(
+                (meta.get("source", "unknown.pdf"), meta["chunk"], doc or "", packs_from_metadata(meta),
+                 meta.get("page"), doc_id)
+                for doc_id, doc, meta in zip(res["ids"], res["documents"], res["metadatas"])
+                if meta and meta.get("chunk", -1) >= 0
+            )
+        rows.sort(key=lambda r: (r[0], r[1]))
+        index = BM25Index.build(rows, version=version or self.corpus_version())
+        os.makedirs(self.db_path, exist_ok=True)
+        index.save(os.path.join(self.db_path, LEXICAL_INDEX_FILE.format(name=name)))
+        self._lexical[name] = index
+        return index
+
+    def vector_backend(self, name: str = COLLECTION) -> Optional[VectorBackend]:
+        """
+        Backend that answers vector queries for `name` (VECTOR_BACKEND); the
+        Chroma collection until ingest has written a numpy index.
+        """
+        if self.backend == "numpy":
+            index = self.vector_index(name)
+            if index is not None:
+                return index
+        return ChromaBackend(self.get_collection(name))
+
+    def vector_index(self, name: str = COLLECTION) -> Optional[NumpyVectorIndex]:
+        """Memory-mapped index saved by ingest for the current corpus version (the last good one meanwhile)."""
+
+        def load():
+            index = NumpyVectorIndex.load(os.path.join(self.db_path, VECTOR_INDEX_FILE.format(name=name)))
+            if index is not None and index.dtype != self.vector_dtype:
+                log.warning("vector_index.dtype_mismatch", collection=name, stored=index.dtype,
+                            configured=self.vector_dtype)   # the next ingest rebuilds with the configured dtype
+            return index
+
+        return self._current("vector_index", self._vectors, name, load)
+
+    def rebuild_vector_index(self, name: str = COLLECTION, version: Optional[str] = None,
+                             page_size: int = 5000) -> NumpyVectorIndex:
+        """
+        Copy the collection's embeddings into the numpy index files (ingest,
+        before publishing `version`; the current version by default).
+        """
+        ids, embeddings, documents, metadatas = [], [], [], []
+        for res in self._collection_pages(name, ["embeddings", "documents", "metadatas"], page_size):
+            ids.extend(res["ids"])
+            embeddings.extend(res["embeddings"])
+            documents.extend(doc or "" for doc in res["documents"])
+            metadatas.extend(meta or {} for meta in res["metadatas"])
+        index = NumpyVectorIndex.build(
+            os.path.join(self.db_path, VECTOR_INDEX_FILE.format(name=name)),
+            ids, embeddings, documents, metadatas, version=version or self.corpus_version(),
+            dtype=self.vector_dtype,
+        )
+        self._vectors[name] = index
+        return index
+
+    def publish_corpus(self, name: str = COLLECTION) -> Dict[str, float]:
+        """
+        After ingest changed the collection: build the lexical (and numpy
+        vector) index files for a new corpus version, then publish it, so
+        workers never see a version whose files are missing. Returns build
+        seconds per index.
+        """
+        version = self.new_corpus_version()
+        t0 = time.perf_counter()
+        self.rebuild_lexical_index(name, version)
+        lexical_s = time.perf_counter() - t0
+        vectors_s = 0.0
+        if self.backend == "numpy":
+            t0 = time.perf_counter()
+            self.rebuild_vector_index(name, version)
+            vectors_s = time.perf_counter() - t0
+        self.bump_corpus_version(version)   # invalidates the semantic answer cache
+        return {"lexical_s": lexical_s, "vectors_s": vectors_s}
+
+    def warm(self, name: str = COLLECTION):
+        """Load the model and open the collection ahead of the first request."""
+        try:
+            self.embedding_function
+            self.get_collection(name)
+            if LEXICAL_ENABLED and self.lexical_index(name) is None:
+                self.rebuild_lexical_index(name)   # no index file yet (first start after upgrade)
+            if self.backend == "numpy" and self.vector_index(name) is None:
+                self.rebuild_vector_index(name)
+        except Exception as e:
+            log.warning("engine.warm_incomplete", error=str(e))
+
+    def close(self):
+        """Release handles; the next access reopens them."""
+        with self._lock:
+            self._collections.clear()
+            self._lexical.clear()
+            self._vectors.clear()
+            self._client = None
+
+
+_engine: Optional[RetrievalEngine] = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> RetrievalEngine:
+    """Return the process-wide RetrievalEngine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RetrievalEngine()
+    return _engine
+
+def shutdown_engine():
+    """Close and forget the process-wide engine (app shutdown)."""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.close()
+        _engine = None
+
+
+# ============================================================
+# STEP 1: MULTI-QUERY GENERATOR
+# ============================================================
+
+class MultiQueryGenerator:
     """
-    Retrieve and filter relevant chunks based on MIN_SCORE threshold.
-    
+    Generates multiple query variations to improve retrieval recall.
+    Based on the LangChain Multi-Query Retrieval pattern.
+    """
+
+    def __init__(self, num_variations: int = NUM_QUERY_VARIATIONS):
+        self.num_variations = num_variations
+        self.prompt_template = """Generate {n} different versions of this question to help retrieve relevant documents from a research paper database.
+
+Each variation should rephrase the question in a different way while maintaining the core intent.
+
+Original question: {question}
+
+Output only the {n} alternative questions, one per line, without numbering or explanations."""
+
+    def generate_with_llm(self, question: str) -> List[str]:
+        """
+        Generate query variations using an LLM (OpenAI/Anthropic).
+        Falls back to template-based if LLM fails.
+        """
+        try:
+            import openai
+
+            prompt = self.prompt_template.format(
+                n=self.num_variations,
+                question=question
+            )
+
+            response = openai.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=200
+            )
+
+            # Parse response
+            variations = response.choices[0].message.content.strip().split('\n')
+            variations = [v.strip() for v in variations if v.strip()]
+
+            # Always include original question first
+            all_queries = [question] + variations
+
+            return all_queries[:self.num_variations + 1]
+
+        except Exception as e:
+            log.warning("query_generation.llm_failed", error=str(e))
+            return self.generate_template_based(question)
+
+    def generate_template_based(self, question: str) -> List[str]:
+        """
+        Fallback: Generate variations using templates.
+        Fast and doesn't require API calls.
+        """
+        # Start with original
+        variations = [question]
+
+        # Template-based variations
+        templates = [
+            f"What are the key findings about {question}?",
+            f"Explain the research on {question}",
+            f"What information exists regarding {question}?",
+            f"Summarize knowledge about {question}",
+            f"What do papers say about {question}?"
+        ]
+
+        for template in templates:
+            if len(variations) >= self.num_variations + 1:
+                break
+            # Avoid duplicates
+            if template.lower().strip() != question.lower().strip():
+                variations.append(template)
+
+        return variations[:self.num_variations + 1]
+
+    def generate(self, question: str, use_llm: bool = False) -> List[str]:
+        """
+        Main entry point for query generation.
+
+        Args:
+            question: Original user question
+            use_llm: If True, use LLM; otherwise use templates
+
+        Returns:
+            List of query variations (including original)
+        """
+        if use_llm:
+            return self.generate_with_llm(question)
+        else:
+            return self.generate_template_based(question)
+
+
+# ============================================================
+# STEP 2: MULTI-QUERY SEARCHER
+# ============================================================
+
+_preamble = re.compile(r"^Task:.*?Query:\s*", re.IGNORECASE)   # added by intent.normalize_message
+
+
+class MultiQuerySearcher:
+    """
+    Performs vector search with multiple query variations and merges results.
+    Uses Reciprocal Rank Fusion (RRF) for result fusion; the BM25 ranking of
+    the original query is fused in as one more list.
+    """
+
+    def __init__(self, collection_name: str = COLLECTION, engine: Optional[RetrievalEngine] = None):
+        self.collection_name = collection_name
+        self.engine = engine or get_engine()
+
+    def _get_backend(self) -> Optional[VectorBackend]:
+        """Get the engine's vector backend (shared Chroma collection or numpy index)."""
+        try:
+            return self.engine.vector_backend(self.collection_name)
+        except Exception as e:
+            log.warning("search.collection_unavailable", collection=self.collection_name, error=str(e))
+            return None
+
+    def _create_doc_id(self, doc: Dict) -> str:
+        """Create unique identifier for deduplication."""
+        source = doc.get("source", "unknown")
+        chunk = doc.get("chunk", -1)
+        return f"{source}::{chunk}"
+
+    def _to_items(self, docs: List[str], metas: List[Dict], dists: List[float]) -> List[Dict]:
+        """Convert one row of a Chroma query result into document dictionaries."""
+        items = []
+        for doc, meta, dist in zip(docs, metas, dists):
+            score = max(0.0, 1.0 - float(dist))
+            item = {
+                "source": meta.get("source", "unknown.pdf"),
+                "chunk": meta.get("chunk", -1),
+                "excerpt": _clean_excerpt(doc)[:1400],
+                "score": round(score, 3),
+                "distance": round(float(dist), 3)
+            }
+            if meta.get("page"):   # chunks ingested before page tracking have none
+                item["page"] = meta["page"]
+            items.append(item)
+        return items
+
+    def search_batch(self, queries: List[str], top_k: int = MAX_RESULTS,
+                     where: Optional[Dict] = None) -> List[List[Dict]]:
+        """
+        Search with several queries in one vector query.
+
+        Queries are embedded through the engine's query cache (one model
+        call for all misses) and the vectors go to the vector backend as
+        one batch (one Chroma query_embeddings request, or one matmul over
+        the numpy index), so latency does not grow with the number of
+        queries.
+
+        Args:
+            queries: Search queries
+            top_k: Number of results to retrieve per query
+            where: Optional Chroma metadata filter (e.g. topic flags)
+
+        Returns:
+            One list of document dictionaries per query, in query order
+        """
+        if not queries:
+            return []
+
+        backend = self._get_backend()
+        if backend is None:
+            return [[] for _ in queries]
+
+        try:
+            with timed("embed"):
+                vectors = self.engine.embed_queries(queries)
+            with timed("vector_search"):
+                results = backend.query(vectors, n_results=top_k, where=where)
+        except Exception as e:
+            log.warning("search.batch_failed", queries=len(queries), error=str(e))
+            return [[] for _ in queries]
+
+        all_docs = results.get("documents") or [[] for _ in queries]
+        all_metas = results.get("metadatas") or [[] for _ in queries]
+        all_dists = results.get("distances") or [[1.0] * len(d) for d in all_docs]
+
+        return [
+            self._to_items(docs, metas, dists)
+            for docs, metas, dists in zip(all_docs, all_metas, all_dists)
+        ]
+
+    def search_lexical(self, query: str, top_k: int = MAX_RESULTS, index: Optional[BM25Index] = None,
+                       packs=None, scored: Optional[List[Dict]] = None) -> List[Dict]:
+        """
+        BM25 search. `lexical_score` is the idf-weighted share of query terms
+        matched and `bm25` the raw score; neither is on the similarity scale,
+        so `score`/`distance` are the dense similarity of `query` to each hit,
+        as search_batch reports it. They come from `scored` (dense results for
+        the same query) where the hit is there, else from the hit's stored
+        embedding. With `packs`, only chunks tagged with one of those topic
+        packs match.
+        """
+        index = index or self.engine.lexical_index(self.collection_name)
+        if index is None:
+            return []
+        with timed("lexical"):
+            hits = index.search(_preamble.sub("", query), top_k=top_k, packs=packs)
+        items, ids = [], []
+        for idx, bm25, coverage in hits:
+            doc = index.docs[idx]
+            item = {
+                "source": doc["source"],
+                "chunk": doc["chunk"],
+                "excerpt": _clean_excerpt(doc["text"])[:1400],
+                "lexical_score": round(coverage, 3),
+                "bm25": round(bm25, 3)
+            }
+            if doc.get("page"):
+                item["page"] = doc["page"]
+            items.append(item)
+            ids.append(doc.get("id"))
+
+        known = {self._create_doc_id(d): d for d in scored or ()}
+        missing = [i for item, i in zip(items, ids) if i and self._create_doc_id(item) not in known]
+        distances = self._distances(query, missing) if missing else {}
+        for item, i in zip(items, ids):
+            dense = known.get(self._create_doc_id(item))
+            if dense is not None:
+                item["score"], item["distance"] = dense["score"], dense["distance"]
+            elif i in distances:
+                item["score"] = round(max(0.0, 1.0 - distances[i]), 3)
+                item["distance"] = round(distances[i], 3)
+            else:
+                item["score"] = 0.0   # index built before ids were stored: no similarity to gate on
+        return items
+
+    def _distances(self, query: str, ids: List[str]) -> Dict[str, float]:
+        """Vector distance from `query` to each chunk id (what a dense search would report)."""
+        backend = self._get_backend()
+        if backend is None:
+            return {}
+        try:
+            with timed("embed"):
+                vector = self.engine.embed_queries([query])[0]
+            with timed("vector_search"):
+                return backend.distances(vector, ids)
+        except Exception as e:
+            log.warning("search.lexical_scoring_failed", hits=len(ids), error=str(e))
+            return {}
+
+    def search_single(self, query: str, top_k: int = MAX_RESULTS) -> List[Dict]:
+        """
+        Search with a single query.
+
+        Args:
+            query: Search query
+            top_k: Number of results to retrieve
+
+        Returns:
+            List of document dictionaries with metadata
+        """
+        return self.search_batch([query], top_k=top_k)[0]
+
+    def fuse(self, ranked_lists: List[List[Dict]]) -> List[Dict]:
+        """
+        Merge per-query result lists using Reciprocal Rank Fusion (RRF).
+
+        Args:
+            ranked_lists: One ranked result list per query variation
+
+        Returns:
+            Merged and deduplicated list of documents, best first
+        """
+        with timed("rrf"):
+            return self._fuse(ranked_lists)
+
+    def _fuse(self, ranked_lists: List[List[Dict]]) -> List[Dict]:
+        # Store results with their query ranks
+        doc_results = defaultdict(list)  # doc_id -> list of (rank, score, doc)
+
+        for query_idx, results in enumerate(ranked_lists):
+            for rank, doc in enumerate(results):
+                doc_id = self._create_doc_id(doc)
+                doc_results[doc_id].append({
+                    "rank": rank,
+                    "score": doc.get("score", 0),
+                    "doc": doc,
+                    "query_idx": query_idx
+                })
+
+        # Apply Reciprocal Rank Fusion (RRF)
+        merged = []
+        for doc_id, occurrences in doc_results.items():
+            # RRF formula: sum of 1/(k + rank) for each occurrence
+            # k=60 is a common constant in RRF literature
+            k = 60
+            rrf_score = sum(1.0 / (k + occ["rank"] + 1) for occ in occurrences)
+
+            # Get the best raw score
+            max_score = max(occ["score"] for occ in occurrences)
+
+            # Take the first occurrence's document and enhance it
+            doc = occurrences[0]["doc"].copy()
+            for occ in occurrences[1:]:   # keep the BM25 fields when a dense list found it first
+                for key in ("lexical_score", "bm25"):
+                    if key in occ["doc"]:
+                        doc.setdefault(key, occ["doc"][key])
+            doc["score"] = round(max_score, 3)
+            doc["rrf_score"] = round(rrf_score, 4)
+            doc["query_hits"] = len(occurrences)  # How many queries found this
+
+            merged.append(doc)
+
+        # Sort by RRF score (better fusion than raw similarity)
+        merged.sort(key=lambda x: x.get("rrf_score", 0), reverse=True)
+
+        return merged
+
+    def search_multi(self, queries: List[str], top_k_per_query: int = MAX_RESULTS,
+                     lexical: bool = LEXICAL_ENABLED, packs=None) -> List[Dict]:
+        """
+        Search with multiple queries and merge results using RRF.
+
+        The first query (the user's own) is also run against the BM25 index.
+        When it is a short query made of rare corpus terms and BM25 finds
+        matches, the vector search is skipped: only the BM25 hits are scored
+        against the query embedding. The query is still embedded (one forward
+        pass, or a query-cache hit) because `score` must stay the dense
+        similarity that MIN_SCORE filters on; only the ANN search and the
+        variation queries are saved.
+
+        Args:
+            queries: List of query variations
+            top_k_per_query: How many results to get per query
+            lexical: Fuse in (or answer from) the BM25 index
+            packs: Restrict both searches to chunks tagged with these topic packs
+
+        Returns:
+            Merged and deduplicated list of documents
+        """
+        if not queries:
+            return []
+        index = self.engine.lexical_index(self.collection_name) if lexical else None
+        if index is not None and index.is_keyword_query(_preamble.sub("", queries[0])):
+            lexical_hits = self.search_lexical(queries[0], top_k_per_query, index, packs)
+            if lexical_hits:
+                log.debug("search.keyword_query", query=queries[0])
+                return self.fuse([lexical_hits])
+
+        ranked = self.search_batch(queries, top_k=top_k_per_query, where=topic_where(packs or ()))
+        if index is not None:
+            lexical_hits = self.search_lexical(queries[0], top_k_per_query, index, packs, scored=ranked[0])
+            if lexical_hits:
+                ranked.append(lexical_hits)
+        return self.fuse(ranked)
+
+
+# ============================================================
+# STEP 3: COMPLETE MULTI-QUERY RAG RETRIEVAL
+# ============================================================
+
+def retrieve_relevant_chunks(
+    query: str,
+    topic_terms=None,
+    n_results: int = TOP_N,
+    use_multi_query: bool = MULTI_QUERY_ENABLED,
+    use_llm_for_queries: bool = USE_LLM_FOR_QUERIES
+) -> Tuple[List[Dict], float]:
+    """
+    Main retrieval function with multi-query support.
+
     Args:
-        query: The search query
-        topic_terms: Optional list of topic terms (currently unused, for future enhancement)
-        n_results: Number of top results to return
-        
+        query: User's search query
+        topic_terms: Topic terms from topics.select_topic_terms; their packs
+            restrict the search to tagged chunks (see TOPIC_FILTER_*)
+        n_results: Number of final results to return
+        use_multi_query: Enable multi-query retrieval
+        use_llm_for_queries: Use LLM for query generation (requires OpenAI API key)
+
     Returns:
-        Tuple of (filtered_items, max_score)
+        Tuple of (filtered_results, max_score)
     """
-    items, max_score = retrieve(query)
-    
-    # Filter by minimum score and limit to n_results
-    filtered = [item for item in items if item.get("score", 0) >= MIN_SCORE]
-    return filtered[:n_results], max_score
 
-def retrieve(query: str) -> Tuple[List[Dict], float]:
-    client = chromadb.PersistentClient(path=DB_DIR)
+    if not use_multi_query:
+        # Single query path (original behavior)
+        items, max_score = retrieve(query)
+        filtered = [item for item in items if item.get("score", 0) >= MIN_SCORE]
+        return filtered[:n_results], max_score
 
-    try:
-        col = client.get_collection(
-            COLLECTION,
-            embedding_function=_get_embedding_function()
-        )
-    except Exception as e:
-        print("[RETRIEVAL] get_collection failed:", e)
-        return [], 0.0
+    # ========== MULTI-QUERY PATH ==========
 
-    res = col.query(
-        query_texts=[query],
-        n_results=MAX_RESULTS,
-        include=["distances", "metadatas", "documents"]
-    )
+    # Step 1: Generate query variations
+    generator = MultiQueryGenerator(num_variations=NUM_QUERY_VARIATIONS)
+    queries = generator.generate(query, use_llm=use_llm_for_queries)
+    log.debug("retrieval.variations", query=query, variations=queries)
 
-    docs = (res.get("documents") or [[]])[0]
-    metas = (res.get("metadatas") or [[]])[0]
-    dists = (res.get("distances") or [[1.0] * len(docs)])[0]
+    # Step 2: Search with all queries, within the query's topic packs if any
+    searcher = MultiQuerySearcher()
+    packs = packs_for_terms(topic_terms) if TOPIC_FILTER_ENABLED else set()
+    merged_results = searcher.search_multi(queries, top_k_per_query=MAX_RESULTS, packs=packs)
+    found = len(merged_results)
 
-    if not docs:
-        return [], 0.0
+    # Step 3: Filter by minimum score
+    filtered = [
+        item for item in merged_results
+        if item.get("score", 0) >= MIN_SCORE
+    ]
+
+    topic_fallback = bool(packs) and len(filtered) < min(n_results, TOPIC_FILTER_MIN_RESULTS)
+    if topic_fallback:
+        # topic filter too narrow: search all chunks
+        merged_results = searcher.search_multi(queries, top_k_per_query=MAX_RESULTS)
+        filtered = [
+            item for item in merged_results
+            if item.get("score", 0) >= MIN_SCORE
+        ]
 
-    items: List[Dict] = []
-    max_score = 0.0
+    passed = len(filtered)
 
-    for doc, meta, dist in zip(docs, metas, dists):
-        score = max(0.0, 1.0 - float(dist))
-        max_score = max(max_score, score)
-        items.append({
-            "source": meta.get("source", "unknown.pdf"),
-            "chunk": meta.get("chunk", -1),
-            "excerpt": _clean_excerpt(doc)[:1400],
-            "score": round(score, 3),
-            "distance": round(float(dist), 3)
-        })
+    # Optional cross-encoder rerank of the top candidates (RRF order if over budget)
+    reranker = get_reranker()
+    if reranker is not None:
+        with timed("rerank"):
+            filtered = reranker.rerank(_preamble.sub("", query), filtered,
+                                       version=searcher.engine.corpus_version())
+
+    # Step 4: Calculate max score
+    max_score = max([item.get("score", 0) for item in merged_results], default=0.0)
+
+    # Step 5: Return top N
+    final_results = filtered[:n_results]
+
+    # one summary event per request instead of a line per step
+    log.info("retrieval", query=query, variations=len(queries), packs=sorted(packs),
+             topic_fallback=topic_fallback, found=found, passed=passed, min_score=MIN_SCORE,
+             returned=len(final_results), max_score=round(max_score, 3))
+
+    return final_results, max_score
+
+
+def prime_query_embeddings(
+    questions: List[str],
+    use_multi_query: bool = MULTI_QUERY_ENABLED,
+    use_llm_for_queries: bool = USE_LLM_FOR_QUERIES,
+    extra: Sequence[str] = ()
+) -> int:
+    """
+    Embed every query retrieve_relevant_chunks will issue for `questions`,
+    plus any `extra` texts (answer-cache keys), in one model call, so later
+    lookups hit the query cache. LLM-generated variations are not
+    reproducible, so nothing is primed for them.
+    Returns the number of distinct texts embedded.
+    """
+    queries = list(extra)
+    if questions and not use_llm_for_queries:
+        if use_multi_query:
+            generator = MultiQueryGenerator(num_variations=NUM_QUERY_VARIATIONS)
+            queries += [q for question in questions for q in generator.generate(question)]
+        else:
+            queries += questions
+    if not queries:
+        return 0
+    queries = list(dict.fromkeys(queries))
+    with timed("embed"):
+        get_engine().embed_queries(queries)
+    return len(queries)
+
+
+def retrieve(query: str) -> Tuple[List[Dict], float]:
+    """
+    Legacy single-query retrieval (kept for backwards compatibility).
+    """
+    searcher = MultiQuerySearcher()
+    items = searcher.search_single(query, top_k=MAX_RESULTS)
+
+    if not items:
+        return [], 0.0
 
     items.sort(key=lambda x: x["score"], reverse=True)
-    return items, max_score
\ No newline at end of file
+    max_score = max([item.get("score", 0) for item in items], default=0.0)
+
+    return items, max_score
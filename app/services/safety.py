@@ -9,6 +9,16 @@ SUICIDE_TERMS = [
     "self-harm", "hurt myself"
 ]
 
+CRISIS_REPLY = (
+    """I’m sorry you’re feeling this way. I can’t provide emergency help.
+If you are in immediate danger, call your local emergency number now.
+In the U.S., you can call or text 988 (Suicide & Crisis Lifeline)."""
+)
+MEDICAL_REPLY = (
+    """I can help discuss research evidence at a high level, but I can’t provide medical advice.
+Consider discussing this with a licensed clinician. If you want a literature summary on a treatment, I can help."""
+)
+
 def basic_safety_check(message: str) -> SafetyResult:
     text = message.lower()
 
@@ -17,11 +27,7 @@ def basic_safety_check(message: str) -> SafetyResult:
         return SafetyResult(
             allowed=False,
             reason="crisis_content",
-            replacement=(
-                """I’m sorry you’re feeling this way. I can’t provide emergency help.
-If you are in immediate danger, call your local emergency number now.
-In the U.S., you can call or text 988 (Suicide & Crisis Lifeline)."""
-            )
+            replacement=CRISIS_REPLY
         )
 
     # Disallow medical advice requests (Step 1 scope)
@@ -29,10 +35,7 @@ In the U.S., you can call or text 988 (Suicide & Crisis Lifeline)."""
         return SafetyResult(
             allowed=False,
             reason="medical_advice",
-            replacement=(
-                """I can help discuss research evidence at a high level, but I can’t provide medical advice.
-Consider discussing this with a licensed clinician. If you want a literature summary on a treatment, I can help."""
-            )
+            replacement=MEDICAL_REPLY
         )
 
     return SafetyResult(allowed=True)
@@ -0,0 +1,229 @@
+# app/services/structured_log.py
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from app.services.metrics import Counter
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")                       # "json" | "text"
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")                           # "retrieval=0.1,chat.turn=0.5"
+LOG_HANDLER_QUEUE_SIZE = int(os.getenv("LOG_HANDLER_QUEUE_SIZE", "10000"))   # records; full -> dropped
+ROOT_LOGGER = "app"
+REQUEST_ID_HEADER = "x-request-id"
+
+
+def _parse_rates(spec: str) -> Dict[str, float]:
+    out = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        event, _, rate = item.partition("=")
+        out[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return out
+
+SAMPLE_RATES: Dict[str, float] = _parse_rates(LOG_SAMPLE)
+
+
+# ---- Request id ----
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_valid_request_id = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+# ---- Formatters (run on the listener thread) ----
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, event, request_id, then the event's fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds")
+                  .replace("+00:00", "Z"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            out["request_id"] = request_id
+        out.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable variant for local runs: `ts level logger event k=v ...`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = dict(getattr(record, "fields", None) or {})
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            fields = {"request_id": request_id, **fields}
+        line = " ".join([self.formatTime(record), record.levelname, record.name, record.getMessage()]
+                        + [f"{k}={v!r}" for k, v in fields.items()])
+        return line + ("\n" + record.exc_text if record.exc_text else "")
+
+
+# ---- Non-blocking handler ----
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to whatever sys.stdout is when the record is emitted (redirects, test capture)."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without formatting them and never
+    waits: when the queue is full the record is dropped and counted, so a
+    slow stdout cannot add latency to requests.
+    """
+
+    def __init__(self, q: "queue.Queue"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:   # tracebacks hold frames that keep changing; render them now
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+Counter("app_log_dropped_total", "Log records dropped because the log queue was full.",
+        fn=lambda: _handler.dropped if _handler else None)
+
+def setup_logging(level: str = None, fmt: str = None, stream=None,
+                  max_queue: int = LOG_HANDLER_QUEUE_SIZE) -> DroppingQueueHandler:
+    """
+    (Re)configure the `app` logger tree: queue handler -> listener thread ->
+    stream (stdout by default). Without `level`, LOG_LEVEL applies unless a
+    level was already set.
+    """
+    global _handler, _listener
+    with _setup_lock:
+        _stop_locked()
+        q: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        out = logging.StreamHandler(stream) if stream is not None else _StdoutHandler()
+        out.setFormatter(TextFormatter() if (fmt or LOG_FORMAT) == "text" else JsonFormatter())
+        _handler = DroppingQueueHandler(q)
+        _listener = QueueListener(q, out)
+        _listener.start()
+        root = logging.getLogger(ROOT_LOGGER)
+        root.addHandler(_handler)
+        if level or root.level == logging.NOTSET:
+            root.setLevel(level or LOG_LEVEL)
+        root.propagate = False
+        return _handler
+
+def _stop_locked():
+    global _handler, _listener
+    if _listener is not None:
+        _listener.stop()   # drains what is queued
+    if _handler is not None:
+        logging.getLogger(ROOT_LOGGER).removeHandler(_handler)
+    _handler = _listener = None
+
+def shutdown_logging():
+    with _setup_lock:
+        _stop_locked()
+
+atexit.register(shutdown_logging)
+
+
+class EventLogger:
+    """
+    `log.info("retrieval", query=q, returned=5)`: an event name plus fields.
+    Level and sampling are checked before anything is built; an event with
+    a rate in LOG_SAMPLE is kept with that probability and carries it as
+    `sample_rate`.
+    """
+
+    __slots__ = ("logger",)
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def log(self, level: int, event: str, exc_info=None, **fields):
+        if _handler is None:
+            setup_logging()
+        if not self.logger.isEnabledFor(level):
+            return
+        rate = SAMPLE_RATES.get(event)
+        if rate is not None:
+            if random.random() >= rate:
+                return
+            fields["sample_rate"] = rate
+        self.logger.log(level, event, exc_info=exc_info,
+                        extra={"fields": fields, "request_id": _request_id.get()})
+
+    def debug(self, event: str, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event: str, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+def get_logger(name: str) -> EventLogger:
+    return EventLogger(logging.getLogger(f"{ROOT_LOGGER}.{name}"))
+
+
+class RequestIdMiddleware:
+    """
+    Binds a request id to everything logged while handling a request: the
+    caller's X-Request-ID when it looks sane, else a fresh one. The id is
+    echoed in the response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        incoming = dict(scope.get("headers") or ()).get(REQUEST_ID_HEADER.encode(), b"").decode("latin-1")
+        request_id = incoming if _valid_request_id.match(incoming) else uuid.uuid4().hex[:16]
+        token = _request_id.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (REQUEST_ID_HEADER.encode(), request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _request_id.reset(token)
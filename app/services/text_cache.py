@@ -0,0 +1,83 @@
+# app/services/text_cache.py
+import gzip
+import json
+import os
+import re
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import PyPDF2
+
+# Bump the suffix whenever page extraction changes; old entries are then ignored and pruned.
+EXTRACTOR_VERSION = f"pypdf2-{PyPDF2.__version__}.1"
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", "data/text_cache")
+
+_unsafe = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class PageTextCache:
+    """
+    Extracted text of each PDF, one string per page, stored as gzipped JSON
+    under `<root>/<sha[:2]>/<sha>.<extractor version>.json.gz`. The key is
+    the file's content hash, so renamed or re-uploaded copies share an
+    entry, and re-chunking or re-embedding never parses the PDF again.
+    Writes are atomic; ingest worker processes can share one root.
+    """
+
+    def __init__(self, root: str = TEXT_CACHE_DIR, version: str = EXTRACTOR_VERSION):
+        self.root = root
+        self.version = version
+        self._suffix = "." + _unsafe.sub("_", version) + ".json.gz"
+
+    def path(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], sha + self._suffix)
+
+    def get(self, sha: str) -> Optional[List[str]]:
+        try:
+            with gzip.open(self.path(sha), "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None   # missing, or a torn/corrupt file: extract again
+        if data.get("sha256") != sha or data.get("extractor") != self.version:
+            return None
+        return data["pages"]
+
+    def put(self, sha: str, pages: List[str]):
+        target = self.path(sha)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump({"sha256": sha, "extractor": self.version, "pages": pages}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, target)
+
+    def get_or_extract(self, sha: str, extract: Callable[[], List[str]]) -> Tuple[List[str], bool]:
+        """(pages, hit): cached pages, else `extract()` stored for next time."""
+        pages = self.get(sha)
+        if pages is not None:
+            return pages, True
+        pages = extract()
+        try:
+            self.put(sha, pages)
+        except OSError:
+            pass   # read-only or full disk: the cache is only an optimization
+        return pages, False
+
+    def prune(self, keep: Iterable[str]) -> int:
+        """Delete entries for hashes not in `keep` and entries from other extractor versions."""
+        keep, removed = set(keep), 0
+        if not os.path.isdir(self.root):
+            return 0
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                sha = name.split(".", 1)[0]
+                if name.endswith(self._suffix) and sha in keep:
+                    continue
+                try:
+                    os.remove(os.path.join(shard_dir, name))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
@@ -1,6 +1,8 @@
 # app/services/topics.py
+import hashlib
+import json
 import re
-from typing import Dict, List, Set
+from typing import Dict, Iterable, List, Optional, Set
 
 # 1) Big-picture domain keywords (broad gate)
 DOMAIN_KEYWORDS = [
@@ -31,18 +33,61 @@ TOPIC_PACKS: Dict[str, List[str]] = {
 
 _domain_re = re.compile("|".join(DOMAIN_KEYWORDS), re.IGNORECASE)
 
+# Whole-word (optionally plural) matching, shared by query routing and chunk
+# tagging so a query only ever filters to chunks that contain its pack terms.
+PACK_PATTERNS = {
+    pack: re.compile(r"\b(?:" + "|".join(re.escape(t) for t in terms) + r")s?\b", re.IGNORECASE)
+    for pack, terms in TOPIC_PACKS.items()
+}
+
+# Chunk metadata: one boolean flag per pack ("t_opioid": True, ...) plus the
+# pack-definition version, so changed packs trigger a metadata-only re-tag.
+TOPIC_FLAG_PREFIX = "t_"
+TOPIC_TAGS_VERSION = hashlib.sha1(json.dumps(TOPIC_PACKS, sort_keys=True).encode()).hexdigest()[:8]
+
 def is_domain_relevant(text: str) -> bool:
     return bool(_domain_re.search(text or ""))
 
+def match_topic_packs(text: str) -> Set[str]:
+    """Names of the TOPIC_PACKS whose terms occur in text."""
+    return {pack for pack, rx in PACK_PATTERNS.items() if rx.search(text or "")}
+
 def select_topic_terms(query: str) -> Set[str]:
-    """Pick a union of packs based on query hints; fallback to empty (no extra filtering)."""
-    q = (query or "").lower()
+    """
+    Pick a union of packs based on query hints; fallback to empty (no extra filtering).
+
+    Terms match as whole words (plus a plural "s"), case-insensitively, with the
+    PACK_PATTERNS used to tag chunks. This used to be a substring test on the
+    lowercased query: "quite" picked the cessation pack, "audience" alcohol,
+    and the upper-case terms (OUD, AUD, THC, PTSD, ...) never matched at all.
+    """
     chosen: Set[str] = set()
 
     # Simple rules; you can also map from intent classifier
-    for pack, terms in TOPIC_PACKS.items():
-        if any(t in q for t in terms):
-            chosen.update(terms)
+    for pack in match_topic_packs(query):
+        chosen.update(TOPIC_PACKS[pack])
 
     # Fallback: if the query is very generic but clearly in-domain, don’t force a pack
     return chosen
+
+def packs_for_terms(topic_terms: Optional[Iterable[str]]) -> Set[str]:
+    """Packs fully covered by topic_terms (inverse of select_topic_terms)."""
+    terms = set(topic_terms or ())
+    return {pack for pack, pack_terms in TOPIC_PACKS.items() if terms.issuperset(pack_terms)}
+
+def topic_flags(packs: Iterable[str]) -> Dict[str, object]:
+    """Chunk metadata for the given packs."""
+    packs = set(packs)
+    flags: Dict[str, object] = {TOPIC_FLAG_PREFIX + p: p in packs for p in TOPIC_PACKS}
+    flags["topics_v"] = TOPIC_TAGS_VERSION
+    return flags
+
+def packs_from_metadata(meta: Dict) -> List[str]:
+    return [p for p in TOPIC_PACKS if meta.get(TOPIC_FLAG_PREFIX + p)]
+
+def topic_where(packs: Iterable[str]) -> Optional[Dict]:
+    """Chroma `where` filter matching chunks tagged with any of the packs."""
+    clauses = [{TOPIC_FLAG_PREFIX + p: True} for p in sorted(packs) if p in TOPIC_PACKS]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
@@ -0,0 +1,314 @@
+# app/services/vector_index.py
+import gzip
+import json
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+SCAN_BLOCK_ROWS = int(os.getenv("VECTOR_SCAN_BLOCK_ROWS", "8192"))   # rows upcast per matmul (12 MB at 384-d)
+
+
+class VectorBackend(ABC):
+    """
+    Vector search over one collection. query() takes Chroma's arguments and
+    returns Chroma-shaped results ({"documents", "metadatas", "distances"},
+    one list per query), so callers do not care which backend answered.
+    """
+
+    @abstractmethod
+    def query(self, query_embeddings: Sequence, n_results: int, where: Optional[Dict] = None) -> Dict:
+        """Top `n_results` per query embedding, nearest first."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored vectors."""
+
+    @abstractmethod
+    def distances(self, query_embedding: Sequence, ids: Sequence[str]) -> Dict[str, float]:
+        """Distance (as in query()) from one query to each stored id; unknown ids are left out."""
+
+
+class ChromaBackend(VectorBackend):
+    """The Chroma collection itself (HNSW + SQLite)."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def query(self, query_embeddings, n_results, where=None):
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where,
+                                     include=["distances", "metadatas", "documents"])
+
+    def count(self):
+        return self.collection.count()
+
+    def distances(self, query_embedding, ids):
+        if not ids:
+            return {}
+        res = self.collection.get(ids=list(ids), include=["embeddings"])
+        if not len(res["ids"]):
+            return {}
+        return _distances(query_embedding, np.asarray(res["embeddings"], dtype=np.float32), res["ids"])
+
+
+def _tmp(target: str) -> str:
+    """Temp name next to `target`, unique per writer so concurrent builds never share one."""
+    return f"{target}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def _distances(query_embedding, vectors: np.ndarray, ids: Sequence[str]) -> Dict[str, float]:
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+    sims = _normalize(vectors.reshape(len(ids), -1)) @ query
+    return {i: max(0.0, 2.0 - 2.0 * float(sim)) for i, sim in zip(ids, sims)}
+
+
+class RowStore:
+    """
+    Documents and metadatas of an index: one JSON record per row in a
+    memory-mapped file, located through an offsets array. A record is
+    decoded only when a query returns its row.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data          # uint8, records back to back
+        self.offsets = offsets    # int64, n + 1 record boundaries
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get(self, i: int) -> Tuple[str, Dict]:
+        """(document, metadata) of row i."""
+        record = json.loads(self.data[self.offsets[i]:self.offsets[i + 1]].tobytes())
+        return record["d"], record["m"]
+
+    @staticmethod
+    def write(data_file: str, documents: Sequence[str], metadatas: Sequence[Dict]) -> np.ndarray:
+        """Write the records to `data_file`; returns the offsets."""
+        offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+        with open(data_file, "wb") as f:
+            for i, (doc, meta) in enumerate(zip(documents, metadatas)):
+                record = json.dumps({"d": doc, "m": meta}, ensure_ascii=False, separators=(",", ":"))
+                offsets[i + 1] = offsets[i] + f.write(record.encode("utf-8"))
+        return offsets
+
+    @classmethod
+    def open(cls, data_file: str, offsets_file: str) -> "RowStore":
+        offsets = np.load(offsets_file, mmap_mode="r")
+        if offsets[-1] == 0:
+            return cls(np.empty(0, dtype=np.uint8), offsets)   # empty files cannot be mapped
+        return cls(np.memmap(data_file, dtype=np.uint8, mode="r"), offsets)
+
+
+def _flag_keys(metadatas: Sequence[Dict]) -> List[str]:
+    """Metadata keys whose values are all booleans (the topic flags topic_where filters on)."""
+    seen, other = set(), set()
+    for meta in metadatas:
+        for key, value in (meta or {}).items():
+            (seen if isinstance(value, bool) else other).add(key)
+    return sorted(seen - other)
+
+
+class NumpyVectorIndex(VectorBackend):
+    """
+    Exact search over unit-length embeddings in one contiguous matrix.
+
+    The matrix lives in `<path>.npy` and is memory-mapped read-only, so
+    workers share the page cache instead of each holding a copy. Documents
+    and metadatas are records in `<path>.rows.bin` (RowStore), also mapped;
+    only the rows a query returns are decoded. Boolean metadata (topic
+    flags) is a small int8 matrix in `<path>.flags.npy` (1 true, 0 false,
+    -1 missing), so topic filters never touch the records; ids and the
+    version are in `<path>.json.gz`. Storage
+    is float32, float16, or int8 with one scale per row. A query batch is
+    one matmul per block of rows (float32 straight off the mapping; float16
+    and int8 upcast into one reused buffer) and the top k per query come
+    from argpartition. Distances are squared L2 like
+    the default Chroma space (2 - 2 cos for unit vectors), so scores and
+    MIN_SCORE mean the same with either backend.
+    """
+
+    def __init__(self, matrix: np.ndarray, ids: List[str], rows: RowStore, version: str = "0",
+                 scales: Optional[np.ndarray] = None, flags: Optional[np.ndarray] = None,
+                 flag_keys: Sequence[str] = ()):
+        self.matrix = matrix
+        self.scales = scales
+        self.ids = ids
+        self.rows = rows
+        self.flags = flags
+        self.flag_keys = {key: j for j, key in enumerate(flag_keys)}
+        self.version = version
+        self._columns: Dict[str, np.ndarray] = {}
+        self._row_of: Optional[Dict[str, int]] = None
+
+    @property
+    def dtype(self) -> str:
+        return str(self.matrix.dtype)
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def _files(path: str):
+        return (path + ".npy", path + ".scales.npy", path + ".rows.bin", path + ".offsets.npy",
+                path + ".flags.npy", path + ".json.gz")
+
+    @classmethod
+    def build(cls, path: str, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict],
+              version: str = "0", dtype: str = "float16") -> "NumpyVectorIndex":
+        """Normalize, quantize and write the index files, then open them memory-mapped."""
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"dtype must be one of {VECTOR_DTYPES}, got {dtype!r}")
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        scales = None
+        if dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            stored = np.round(vectors / scales[:, None]).astype(np.int8)
+        else:
+            stored = vectors.astype(dtype)
+        keys = _flag_keys(metadatas)
+        flags = np.full((len(ids), len(keys)), -1, dtype=np.int8)
+        for i, meta in enumerate(metadatas):
+            for j, key in enumerate(keys):
+                if meta and key in meta:
+                    flags[i, j] = int(meta[key])
+
+        matrix_file, scales_file, rows_file, offsets_file, flags_file, meta_file = cls._files(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = _tmp(rows_file)
+        offsets = RowStore.write(tmp, documents, metadatas)
+        os.replace(tmp, rows_file)
+        for target, array in ((matrix_file, stored), (scales_file, scales), (offsets_file, offsets),
+                              (flags_file, flags)):
+            if array is None:
+                continue
+            tmp = _tmp(target)
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, target)
+        tmp = _tmp(meta_file)
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=3) as f:
+            json.dump({"version": version, "dtype": dtype, "ids": list(ids), "flags": keys},
+                      f, separators=(",", ":"))
+        os.replace(tmp, meta_file)   # written last: it names the version
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["NumpyVectorIndex"]:
+        matrix_file, scales_file, rows_file, offsets_file, flags_file, meta_file = cls._files(path)
+        try:
+            with gzip.open(meta_file, "rt", encoding="utf-8") as f:
+                meta = json.load(f)
+            matrix = np.load(matrix_file, mmap_mode="r")
+            scales = np.load(scales_file) if meta["dtype"] == "int8" else None
+            rows = RowStore.open(rows_file, offsets_file)
+            flags = np.load(flags_file, mmap_mode="r")
+            n, keys = len(meta["ids"]), meta["flags"]
+        except (OSError, ValueError, KeyError):
+            return None
+        if (str(matrix.dtype) != meta["dtype"] or matrix.shape[0] != n or len(rows) != n
+                or flags.shape != (n, len(keys)) or len(rows.data) != rows.offsets[-1]):
+            return None   # files from different builds
+        return cls(matrix, meta["ids"], rows, meta["version"], scales, flags, keys)
+
+    # ---- search ----
+    def _column(self, key: str) -> np.ndarray:
+        """Values of a non-flag metadata key for every row (decodes all records once per key)."""
+        col = self._columns.get(key)
+        if col is None:
+            col = np.empty(len(self.rows), dtype=object)
+            col[:] = [(self.rows.get(i)[1] or {}).get(key) for i in range(len(self.rows))]
+            self._columns[key] = col
+        return col
+
+    def _equals(self, key: str, value) -> np.ndarray:
+        j = self.flag_keys.get(key)
+        if j is not None and isinstance(value, bool):
+            return self.flags[:, j] == int(value)
+        return self._column(key) == value
+
+    def _mask(self, where: Dict) -> np.ndarray:
+        """Rows matching a Chroma `where` of equality clauses combined with $and / $or."""
+        masks = []
+        for key, value in where.items():
+            if key in ("$and", "$or"):
+                parts = [self._mask(clause) for clause in value]
+                masks.append(np.logical_and.reduce(parts) if key == "$and" else np.logical_or.reduce(parts))
+            elif isinstance(value, dict):
+                (op, operand), = value.items()
+                if op not in ("$eq", "$ne"):
+                    raise ValueError(f"unsupported where operator: {op}")
+                eq = self._equals(key, operand)
+                masks.append(eq if op == "$eq" else ~eq)
+            else:
+                masks.append(self._equals(key, value))
+        return np.logical_and.reduce(masks).astype(bool)
+
+    def similarities(self, queries: np.ndarray) -> np.ndarray:
+        """Cosine similarity of each (unit) query to every row: (n_queries, n_rows) float32."""
+        n = self.matrix.shape[0]
+        out = np.empty((queries.shape[0], n), dtype=np.float32)
+        if self.matrix.dtype == np.float32:
+            np.matmul(queries, self.matrix.T, out=out)   # BLAS straight off the mapping
+            return out
+        buf = np.empty((min(SCAN_BLOCK_ROWS, n), self.matrix.shape[1]), dtype=np.float32)
+        for start in range(0, n, SCAN_BLOCK_ROWS):
+            stop = min(start + SCAN_BLOCK_ROWS, n)
+            block = buf[:stop - start]
+            np.copyto(block, self.matrix[start:stop], casting="unsafe")
+            np.matmul(queries, block.T, out=out[:, start:stop])
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def distances(self, query_embedding, ids):
+        if self._row_of is None:
+            self._row_of = {i: row for row, i in enumerate(self.ids)}
+        found = [i for i in ids if i in self._row_of]
+        if not found:
+            return {}
+        rows = [self._row_of[i] for i in found]
+        vectors = self.matrix[rows].astype(np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][:, None]
+        return _distances(query_embedding, vectors, found)
+
+    def query(self, query_embeddings, n_results, where=None):
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not self.ids or n_results <= 0:
+            for key in result:
+                result[key] = [[] for _ in range(len(queries))]
+            return result
+
+        sims = self.similarities(queries)
+        if where:
+            mask = self._mask(where)
+            sims[:, ~mask] = -np.inf
+            available = int(mask.sum())
+        else:
+            available = sims.shape[1]
+        k = min(n_results, available)
+        if k == 0:
+            top = np.empty((len(queries), 0), dtype=np.int64)
+        elif k < sims.shape[1]:
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(sims.shape[1]), (len(queries), 1))
+        for row, cand in zip(sims, top):
+            order = cand[np.argsort(-row[cand], kind="stable")]
+            records = [self.rows.get(i) for i in order]
+            result["ids"].append([self.ids[i] for i in order])
+            result["documents"].append([doc for doc, _ in records])
+            result["metadatas"].append([meta for _, meta in records])
+            result["distances"].append([max(0.0, 2.0 - 2.0 * float(row[i])) for i in order])
+        return result
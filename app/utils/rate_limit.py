@@ -1,18 +1,170 @@
-from collections import defaultdict
+import os
+import sqlite3
+import threading
 import time
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional
+
+from app.services.metrics import RATE_LIMITED
 
 WINDOW_SEC = 5
 MAX_REQS = 5
 
-_bucket = defaultdict(list)
-
-def allow_request(key: str) -> bool:
-    now = time.time()
-    window = _bucket[key]
-    # prune old timestamps
-    while window and now - window[0] > WINDOW_SEC:
-        window.pop(0)
-    if len(window) >= MAX_REQS:
-        return False
-    window.append(now)
-    return True
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")   # "memory" | "sqlite"
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "logs/rate_limit.sqlite3")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+class RateLimit(NamedTuple):
+    """`rate` requests per `per` seconds, allowing bursts of up to `burst`."""
+    rate: int
+    per: float
+    burst: int
+
+    @property
+    def interval(self) -> float:
+        return self.per / self.rate
+
+
+DEFAULT_LIMIT = RateLimit(MAX_REQS, WINDOW_SEC, MAX_REQS)
+
+# Per-route limits; RATE_LIMITS="/chat=5/5:5,/upload=10/60" overrides (rate/per[:burst]).
+ROUTE_LIMITS: Dict[str, RateLimit] = {
+    "/chat": DEFAULT_LIMIT,
+    "/chat/batch": RateLimit(1, 10, 2),   # one batch carries up to CHAT_BATCH_MAX_QUESTIONS questions
+    "/upload": RateLimit(10, 60, 10),
+}
+
+def _parse_limits(spec: str) -> Dict[str, RateLimit]:
+    out = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        route, _, limit = item.partition("=")
+        rate_per, _, burst = limit.partition(":")
+        rate, _, per = rate_per.partition("/")
+        out[route.strip()] = RateLimit(int(rate), float(per), int(burst or rate))
+    return out
+
+ROUTE_LIMITS.update(_parse_limits(os.getenv("RATE_LIMITS", "")))
+
+
+# ---- GCRA ----
+def _gcra(tat: Optional[float], now: float, limit: RateLimit):
+    """
+    Generic Cell Rate Algorithm: one float (theoretical arrival time) per key.
+    Returns (allowed, new_tat).
+    """
+    tat = now if tat is None or tat < now else tat
+    new_tat = tat + limit.interval
+    if new_tat - now > limit.burst * limit.interval:
+        return False, tat
+    return True, new_tat
+
+
+# ---- State backends ----
+class InMemoryBackend:
+    """
+    Per-process state: key -> TAT in LRU order. A key whose TAT has passed
+    carries no information (it equals a fresh key), so it is evicted.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, evict_per_call: int = 8):
+        self.max_keys = max_keys
+        self.evict_per_call = evict_per_call
+        self._tat: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def apply(self, key: str, now: float, fn: Callable[[Optional[float]], tuple]) -> bool:
+        with self._lock:
+            allowed, new_tat = fn(self._tat.get(key))
+            self._tat[key] = new_tat
+            self._tat.move_to_end(key)
+            self._evict_locked(now)
+            return allowed
+
+    def _evict_locked(self, now: float):
+        # oldest-updated keys are at the front; drop idle ones and enforce the cap
+        for _ in range(self.evict_per_call):
+            if not self._tat:
+                break
+            key, tat = next(iter(self._tat.items()))
+            if tat > now and len(self._tat) <= self.max_keys:
+                break
+            del self._tat[key]
+            self.evictions += 1
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._tat)
+
+
+class SQLiteBackend:
+    """
+    Shared state for several uvicorn workers (stand-in for Redis): one row
+    per key, updated inside an IMMEDIATE transaction.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_DB, sweep_every: int = 1000):
+        self.path = path
+        self.sweep_every = sweep_every
+        self._local = threading.local()
+        self._calls = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().execute("CREATE TABLE IF NOT EXISTS rate_limit (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=OFF")   # limiter state is disposable
+            self._local.con = con
+        return con
+
+    def apply(self, key: str, now: float, fn: Callable[[Optional[float]], tuple]) -> bool:
+        con = self._conn()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            row = con.execute("SELECT tat FROM rate_limit WHERE key = ?", (key,)).fetchone()
+            allowed, new_tat = fn(row[0] if row else None)
+            con.execute("INSERT OR REPLACE INTO rate_limit (key, tat) VALUES (?, ?)", (key, new_tat))
+            self._calls += 1
+            if self._calls % self.sweep_every == 0:
+                con.execute("DELETE FROM rate_limit WHERE tat < ?", (now,))   # idle keys
+            con.execute("COMMIT")
+            return allowed
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+
+    def size(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM rate_limit").fetchone()[0]
+
+
+class RateLimiter:
+    def __init__(self, backend=None, limits: Optional[Dict[str, RateLimit]] = None):
+        self.backend = backend or InMemoryBackend()
+        self.limits = ROUTE_LIMITS if limits is None else limits
+        self.rejected = 0
+
+    def allow(self, key: str, route: str = "/chat", now: Optional[float] = None) -> bool:
+        limit = self.limits.get(route, DEFAULT_LIMIT)
+        now = time.time() if now is None else now
+        allowed = self.backend.apply(f"{route}|{key}", now, lambda tat: _gcra(tat, now, limit))
+        if not allowed:
+            self.rejected += 1
+        return allowed
+
+
+def _default_backend():
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteBackend(RATE_LIMIT_DB)
+    return InMemoryBackend()
+
+limiter = RateLimiter(_default_backend())
+
+def allow_request(key: str, route: str = "/chat") -> bool:
+    allowed = limiter.allow(key, route)
+    if not allowed:
+        RATE_LIMITED.inc(route=route)
+    return allowed
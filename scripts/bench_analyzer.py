@@ -0,0 +1,55 @@
+"""
+Per-message cost of query analysis: the separate safety / intent / normalize /
+domain / topic functions vs the single-pass analyzer.
+
+    python -m scripts.bench_analyzer [--repeat 2000]
+"""
+import argparse
+import json
+import time
+
+from app.services.analyzer import analyze_query
+from app.services.intent import classify_intent, normalize_message
+from app.services.safety import basic_safety_check
+from app.services.topics import is_domain_relevant, select_topic_terms
+
+MESSAGES = [
+    "divalproex",
+    "Summarize the relationship between chronic pain and substance use.",
+    "Compare smoking vs. vaping outcomes for sleep quality in veterans with PTSD",
+    "What are the findings on CPES and pain-related anxiety among cannabis users?",
+    "I have been reading about how pain motivates smoking and I would like a summary of the "
+    "mechanistic considerations, especially nicotine withdrawal and negative affect. " * 3,
+]
+
+
+def separate(message):
+    safety = basic_safety_check(message)
+    intent = classify_intent(message)
+    normalized = normalize_message(message, intent.intent)
+    return safety, intent, normalized, is_domain_relevant(normalized), select_topic_terms(normalized)
+
+
+def _per_call_us(fn, message, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(message)
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeat", type=int, default=2000)
+    args = ap.parse_args()
+
+    rows = []
+    for msg in MESSAGES:
+        old = _per_call_us(separate, msg, args.repeat)
+        new = _per_call_us(analyze_query, msg, args.repeat)
+        rows.append({"chars": len(msg), "separate_us": round(old, 2), "analyzer_us": round(new, 2),
+                     "speedup": round(old / new, 2) if new else None})
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+BM25 vs dense retrieval latency on the ingested collection.
+
+    python -m scripts.bench_lexical [--db data/chroma_db] [--repeat 20] [query ...]
+
+Reports index build time and per-query p50/p95 latency for the lexical path
+and the dense path (embedding with a cold query cache + vector search), and
+whether each query would skip dense retrieval.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from app.services.lexical import BM25Index
+from app.services.retrieval import COLLECTION, DB_DIR, MAX_RESULTS, MultiQuerySearcher, RetrievalEngine
+
+DEFAULT_QUERIES = [
+    "CPES",
+    "PATH Wave 6",
+    "divalproex",
+    "pain-related anxiety and smoking dependence motives",
+    "How does chronic pain affect motivation to smoke?",
+]
+
+
+def _ms(samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+    return {"p50_ms": round(statistics.median(samples) * 1000, 3), "p95_ms": round(p95 * 1000, 3)}
+
+
+def _timed(fn, repeat):
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=DB_DIR)
+    ap.add_argument("--collection", default=COLLECTION)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("queries", nargs="*", default=DEFAULT_QUERIES)
+    args = ap.parse_args()
+
+    engine = RetrievalEngine(db_path=args.db)
+    col = engine.client.get_or_create_collection(args.collection)
+    res = col.get(include=["documents", "metadatas"])
+    rows = [(m.get("source", ""), m["chunk"], d or "") for d, m in zip(res["documents"], res["metadatas"])
+            if m and m.get("chunk", -1) >= 0]
+    if not rows:
+        raise SystemExit(f"Collection '{args.collection}' in {args.db} is empty; run an ingest first.")
+
+    build = _timed(lambda: BM25Index.build(rows), max(1, args.repeat // 4))
+    index = BM25Index.build(rows)
+    searcher = MultiQuerySearcher(args.collection, engine=engine)
+
+    report = {"chunks": index.n, "terms": len(index.postings), "build": _ms(build), "queries": []}
+    for q in args.queries:
+        entry = {"query": q, "keyword_query": index.is_keyword_query(q),
+                 "lexical": _ms(_timed(lambda: searcher.search_lexical(q, MAX_RESULTS, index), args.repeat))}
+
+        def dense():
+            engine.query_cache.clear()   # include the embedding forward pass
+            searcher.search_batch([q], top_k=MAX_RESULTS)
+        try:
+            engine.embed_queries([q])   # load the model outside the timed runs; raises if unavailable
+            entry["dense"] = _ms(_timed(dense, args.repeat))
+        except Exception as e:
+            entry["dense"] = {"error": str(e)}
+        report["queries"].append(entry)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Stage-level latency and throughput of the chat pipeline on a synthetic corpus.
+
+    python -m scripts.bench_pipeline [--chunks 2000] [--repeat 200] [--seed 0]
+                                     [--stages analyzer,chat_e2e] [--out run.json]
+                                     [--baseline old.json] [--tolerance 0.25]
+
+Builds a deterministic corpus into a temporary Chroma directory with a hashing
+embedding function (no model download), then times each stage on its own:
+query analysis, retrieval (single vs multi-query), RRF merge, context/prompt
+building, memory write/read, and POST /chat through TestClient (answer cache
+off, no LLM endpoint, so the extractive fallback answers). Memory and the
+interaction log go to the temporary directory too.
+
+Prints (or writes) JSON with p50/p95/p99/mean ms and sequential throughput per
+stage. With --baseline, stages whose p95 grew by more than --tolerance (and
+by at least --min-delta-ms) are listed under "regressions" and the exit
+status is 1.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+
+from app.services import retrieval
+from app.services.analyzer import analyze_query
+from app.services.llm_reasoning import _build_citations, _build_prompt
+from app.services.retrieval import COLLECTION, MAX_RESULTS, MultiQueryGenerator, MultiQuerySearcher, RetrievalEngine
+from app.services.structured_log import ROOT_LOGGER
+from app.services.topics import TOPIC_PACKS, match_topic_packs, topic_flags
+from scripts.latency import percentile
+
+STAGES = ("analyzer", "retrieval_single", "retrieval_multi", "rrf_merge", "context_build",
+          "memory_write", "memory_read", "chat_e2e")
+
+QUERIES = [
+    "Summarize the relationship between chronic pain and smoking cessation.",
+    "Compare alcohol and cannabis use among veterans with PTSD",
+    "What are the findings on opioid misuse and sleep quality?",
+    "oxycodone hyperalgesia",
+    "How does anxiety affect relapse after quitting nicotine?",
+    "Extract the sample size and measures used for insomnia and pain catastrophizing",
+]
+
+_FILLER = """
+participants reported higher scores across the sample compared with baseline measures model results
+indicated significant associations after adjusting for covariates study cohort adults survey regression
+analysis outcomes effect moderate odds ratio confidence interval follow months assessment clinical
+""".split()
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """Deterministic bag-of-words vectors: one md5 bucket per token, unit length."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def __call__(self, input):
+        out = []
+        for text in input:
+            v = np.zeros(self.dim, dtype=np.float32)
+            for tok in text.lower().split():
+                v[int(hashlib.md5(tok.encode()).hexdigest(), 16) % self.dim] += 1.0
+            n = np.linalg.norm(v)
+            out.append((v / n if n else v).tolist())
+        return out
+
+
+def synthetic_corpus(n_chunks: int, seed: int = 0, chunks_per_doc: int = 20) -> Iterator[Tuple[str, int, str]]:
+    """(source, chunk, text) rows: filler prose, a few topic-pack terms and some rare tokens per chunk."""
+    rng = random.Random(seed)
+    topic_words = [t for terms in TOPIC_PACKS.values() for t in terms]
+    for i in range(n_chunks):
+        words = rng.choices(_FILLER, k=rng.randint(60, 120))
+        words += rng.sample(topic_words, k=rng.randint(2, 6))
+        words += [f"term{rng.randint(0, 5000)}" for _ in range(3)]
+        rng.shuffle(words)
+        yield f"synthetic_{i // chunks_per_doc:04d}.pdf", i % chunks_per_doc, " ".join(words)
+
+
+def build_engine(db_path: str, n_chunks: int, seed: int = 0, batch_size: int = 512) -> RetrievalEngine:
+    """Engine over a fresh synthetic collection, with topic tags and a BM25 index like a real ingest."""
+    engine = RetrievalEngine(db_path=db_path)
+    engine._embedding_function = HashEmbeddingFunction()
+    col = engine.get_collection(COLLECTION, create=True)
+    rows = list(synthetic_corpus(n_chunks, seed))
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        col.add(ids=[f"{src}::chunk::{ch}" for src, ch, _ in batch],
+                documents=[text for _, _, text in batch],
+                metadatas=[{"source": src, "chunk": ch, **topic_flags(match_topic_packs(text))}
+                           for src, ch, text in batch])
+    engine.publish_corpus(COLLECTION)
+    return engine
+
+
+def measure(fn: Callable[[int], object], repeat: int, warmup: int = 3) -> Dict:
+    """Call fn(i) `repeat` times after `warmup` untimed calls; latency percentiles and throughput."""
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    began = time.perf_counter()
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - t0)
+    total = time.perf_counter() - began
+    s = sorted(samples)
+    ms = lambda x: round(x * 1000, 4)
+    return {"n": len(s), "mean_ms": ms(sum(s) / len(s)), "p50_ms": ms(percentile(s, 0.50)),
+            "p95_ms": ms(percentile(s, 0.95)), "p99_ms": ms(percentile(s, 0.99)),
+            "throughput_rps": round(len(s) / total, 1) if total else None}
+
+
+@contextlib.contextmanager
+def _isolated(workdir: str, engine: RetrievalEngine):
+    """Point the process-wide engine, memory store and interaction log at `workdir`; restore after."""
+    from app.memory import log_writer, long_term
+    from app.routers import chat as chat_router
+
+    saved = (retrieval._engine, chat_router.ANSWER_CACHE_ENABLED, long_term._store,
+             long_term.LOG_PATH, log_writer._writer)
+    app_log = logging.getLogger(ROOT_LOGGER)
+    saved_level = app_log.level
+    app_log.setLevel(logging.WARNING)                 # per-request info events would flood the report
+    saved_env = {k: os.environ.pop(k) for k in ("HF_TEXTGEN_URL",) if k in os.environ}
+    writer = log_writer.InteractionLogWriter(os.path.join(workdir, "conversation_history.jsonl"))
+    writer.start()
+    retrieval._engine = engine
+    chat_router.ANSWER_CACHE_ENABLED = False          # time the pipeline, not cache hits
+    long_term._store = long_term.LongTermStore(os.path.join(workdir, "history.sqlite3"), legacy_log=None)
+    long_term.LOG_PATH = writer.path
+    log_writer._writer = writer
+    try:
+        yield
+    finally:
+        writer.close()
+        app_log.setLevel(saved_level)
+        (retrieval._engine, chat_router.ANSWER_CACHE_ENABLED, long_term._store,
+         long_term.LOG_PATH, log_writer._writer) = saved
+        os.environ.update(saved_env)
+
+
+def _stage_fns(engine: RetrievalEngine) -> Dict[str, Callable[[int], object]]:
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.memory.long_term import store_interaction, summarize_history
+    from app.memory.short_term import ShortTermMemory
+
+    analyses = [analyze_query(q) for q in QUERIES]
+    searcher = MultiQuerySearcher(COLLECTION, engine=engine)
+    variations = [MultiQueryGenerator().generate(a.normalized) for a in analyses]
+    ranked = [searcher.search_batch(v, top_k=MAX_RESULTS) for v in variations]
+    retrieved = [searcher.fuse(r)[:retrieval.TOP_N] for r in ranked]   # unthresholded: never empty
+    memory = ShortTermMemory(window_size=5)
+    client = TestClient(app)
+    pick = lambda seq, i: seq[i % len(seq)]
+
+    def memory_write(i):
+        tid, msg = f"bench-{i % 50}", pick(QUERIES, i)
+        memory.add(tid, "user", msg)
+        memory.add(tid, "assistant", "answer " + msg)
+        store_interaction(tid, msg, "answer " + msg, pick(retrieved, i))
+
+    def memory_read(i):
+        tid = f"bench-{i % 50}"
+        return memory.get(tid), summarize_history(tid)
+
+    def chat(i):
+        # one thread per request so the per-thread rate limit never answers 429
+        r = client.post("/chat", json={"thread_id": f"bench-chat-{i}", "message": pick(QUERIES, i)})
+        if r.status_code != 200:
+            raise RuntimeError(f"/chat returned {r.status_code}: {r.text[:200]}")
+
+    return {
+        "analyzer": lambda i: analyze_query(pick(QUERIES, i)),
+        "retrieval_single": lambda i: retrieval.retrieve_relevant_chunks(
+            pick(analyses, i).normalized, pick(analyses, i).topic_terms, use_multi_query=False),
+        "retrieval_multi": lambda i: retrieval.retrieve_relevant_chunks(
+            pick(analyses, i).normalized, pick(analyses, i).topic_terms),
+        "rrf_merge": lambda i: searcher.fuse(pick(ranked, i)),
+        "context_build": lambda i: (_build_prompt(pick(analyses, i).normalized, pick(retrieved, i)),
+                                    _build_citations(pick(retrieved, i))),
+        "memory_write": memory_write,
+        "memory_read": memory_read,
+        "chat_e2e": chat,
+    }
+
+
+def run_suite(chunks: int = 2000, repeat: int = 200, seed: int = 0,
+              stages: Optional[List[str]] = None) -> Dict:
+    """Build the corpus and time the selected stages; the report is JSON-serializable."""
+    stages = list(stages or STAGES)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"unknown stages: {sorted(unknown)}")
+
+    report = {"meta": {"chunks": chunks, "repeat": repeat, "seed": seed,
+                       "python": platform.python_version(), "platform": platform.platform(),
+                       "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())},
+              "stages": {}}
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as workdir:
+        t0 = time.perf_counter()
+        engine = build_engine(os.path.join(workdir, "chroma"), chunks, seed)
+        report["meta"]["build_sec"] = round(time.perf_counter() - t0, 3)
+        try:
+            with _isolated(workdir, engine):
+                fns = _stage_fns(engine)
+                for name in stages:
+                    report["stages"][name] = measure(fns[name], repeat)
+        finally:
+            engine.close()
+    return report
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float = 0.25, min_delta_ms: float = 0.05,
+            metric: str = "p95_ms") -> List[Dict]:
+    """Stages present in both runs whose `metric` grew by more than `tolerance` and `min_delta_ms`."""
+    out = []
+    for stage, cur in report.get("stages", {}).items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or not old.get(metric):
+            continue
+        if cur[metric] > old[metric] * (1 + tolerance) and cur[metric] - old[metric] >= min_delta_ms:
+            out.append({"stage": stage, "metric": metric, "baseline": old[metric],
+                        "current": cur[metric], "ratio": round(cur[metric] / old[metric], 2)})
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chunks", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of: " + ", ".join(STAGES))
+    ap.add_argument("--out", help="write the JSON report here instead of stdout")
+    ap.add_argument("--baseline", help="earlier report to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95 growth")
+    ap.add_argument("--min-delta-ms", type=float, default=0.05, help="ignore smaller absolute p95 growth")
+    args = ap.parse_args()
+
+    report = run_suite(args.chunks, args.repeat, args.seed, [s for s in args.stages.split(",") if s])
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance, args.min_delta_ms)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if report.get("regressions"):
+        print(f"{len(report['regressions'])} stage(s) regressed: "
+              + ", ".join(r["stage"] for r in report["regressions"]), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Recall and latency of the vector backends on a synthetic corpus.
+
+    python -m scripts.bench_vectors [--chunks 20000] [--batches 100] [--batch 4] [--top-k 12]
+                                    [--dtypes float32,float16,int8]
+
+Builds the seeded synthetic corpus of scripts.bench_pipeline into a temporary
+Chroma collection, then runs the same query batches (one batch = the query
+variations of one request) against Chroma (HNSW) and the memory-mapped numpy
+index in each storage dtype. Recall@k is measured against exact float32
+search over the collection's own embeddings. Prints JSON.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.retrieval import COLLECTION
+from app.services.vector_index import ChromaBackend, NumpyVectorIndex
+from scripts.bench_pipeline import build_engine, measure, synthetic_corpus
+
+
+def _query_batches(chunks, batches, batch, seed):
+    """Short phrases cut from random chunks, grouped like per-request query variations."""
+    rng = random.Random(seed + 1)
+    texts = [text.split() for _, _, text in synthetic_corpus(chunks, seed)]
+    out = []
+    for _ in range(batches):
+        group = []
+        for _ in range(batch):
+            words = rng.choice(texts)
+            start = rng.randrange(max(1, len(words) - 8))
+            group.append(" ".join(words[start:start + 8]))
+        out.append(group)
+    return out
+
+
+def _recall(results, truth):
+    hits = sum(len(set(got) & set(want)) for got, want in zip(results, truth))
+    return round(hits / max(1, sum(len(w) for w in truth)), 4)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chunks", type=int, default=20000)
+    ap.add_argument("--batches", type=int, default=100)
+    ap.add_argument("--batch", type=int, default=4, help="queries per batch (query variations)")
+    ap.add_argument("--top-k", type=int, default=12)
+    ap.add_argument("--dtypes", default="float32,float16,int8")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_vectors_") as workdir:
+        t0 = time.perf_counter()
+        engine = build_engine(os.path.join(workdir, "chroma"), args.chunks, args.seed)
+        build_s = time.perf_counter() - t0
+        batches = _query_batches(args.chunks, args.batches, args.batch, args.seed)
+        vectors = [engine.embed_queries(b) for b in batches]
+
+        exact = None
+        backends = {"chroma": ChromaBackend(engine.get_collection(COLLECTION))}
+        report = {"chunks": args.chunks, "batches": args.batches, "batch": args.batch, "top_k": args.top_k,
+                  "corpus_build_sec": round(build_s, 3), "backends": {}}
+        for dtype in ["float32"] + [d for d in args.dtypes.split(",") if d and d != "float32"]:
+            engine.vector_dtype = dtype
+            t0 = time.perf_counter()
+            index = engine.rebuild_vector_index(COLLECTION)
+            index_s = time.perf_counter() - t0
+            if dtype == "float32":
+                exact = index   # ground truth
+                truth = [index.query(v, args.top_k)["ids"] for v in vectors]
+            if dtype in args.dtypes.split(","):
+                # each dtype keeps its own files: rebuild writes over the same path, so copy out of it
+                backends[f"numpy_{dtype}"] = NumpyVectorIndex(np.array(index.matrix), index.ids, index.rows,
+                                                              index.version, index.scales, index.flags,
+                                                              list(index.flag_keys))
+                report["backends"][f"numpy_{dtype}"] = {"index_build_sec": round(index_s, 3),
+                                                        "matrix_bytes": int(index.matrix.nbytes)}
+
+        for name, backend in backends.items():
+            got = [backend.query(v, args.top_k)["ids"] for v in vectors]
+            truth_flat = [ids for t in truth for ids in t]
+            entry = report["backends"].setdefault(name, {})
+            entry["recall_at_k"] = _recall([ids for g in got for ids in g], truth_flat)
+            entry["batch_latency"] = measure(lambda i: backend.query(vectors[i % len(vectors)], args.top_k),
+                                             repeat=len(vectors))
+        report["exact_rows"] = exact.count() if exact else 0
+        engine.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Run a question set through POST /chat/batch and print one NDJSON line per
+answer, in completion order.
+
+    python -m scripts.chat_batch questions.txt [--url http://127.0.0.1:8000]
+                                 [--batch-id eval-1] [--concurrency 4] [--out answers.jsonl]
+
+Questions come from a file (or `-` for stdin): plain text with one question
+per line, or JSON lines with {"id": ..., "message": ...}. Without --url the
+app runs in-process through TestClient against the local corpus. Sets larger
+than CHAT_BATCH_MAX_QUESTIONS are sent as consecutive batches; `index` is
+rewritten to the position in the whole file.
+"""
+import argparse
+import contextlib
+import json
+import sys
+import time
+import uuid
+
+from app.schemas import BATCH_MAX_QUESTIONS
+
+
+def read_questions(lines):
+    """[{"id", "message"}] from text or JSON lines; blank lines and # comments are skipped."""
+    out = []
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            row = json.loads(line)
+            out.append({"id": str(row.get("id", n)), "message": row["message"]})
+        else:
+            out.append({"id": str(n), "message": line})
+    return out
+
+
+def _client(url, stack: contextlib.ExitStack):
+    if url:
+        import httpx
+        return stack.enter_context(httpx.Client(base_url=url, timeout=None))
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.services.structured_log import setup_logging
+    with contextlib.redirect_stdout(sys.stderr):   # startup logs; stdout stays pure NDJSON
+        client = stack.enter_context(TestClient(app))
+        setup_logging(stream=sys.stderr)            # drains what startup queued, then logs to stderr
+    return client
+
+
+def run_batches(client, questions, batch_id, concurrency=None, size=BATCH_MAX_QUESTIONS, retry_wait=10.0):
+    """Yield result dicts as the server streams them, one request per `size` questions."""
+    for offset in range(0, len(questions), size):
+        body = {"batch_id": batch_id, "questions": questions[offset:offset + size]}
+        if concurrency:
+            body["max_concurrency"] = concurrency
+        for attempt in range(3):
+            with client.stream("POST", "/chat/batch", json=body) as r:
+                if r.status_code == 429 and attempt < 2:
+                    time.sleep(retry_wait)   # the batch route allows one batch per 10 s after a burst
+                    continue
+                if r.status_code != 200:
+                    r.read()
+                    raise SystemExit(f"/chat/batch returned {r.status_code}: {r.text}")
+                for line in r.iter_lines():
+                    if line:
+                        item = json.loads(line)
+                        item["index"] += offset
+                        yield item
+                break
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("questions", help="question file, or - for stdin")
+    ap.add_argument("--url", help="server base URL (default: run the app in-process)")
+    ap.add_argument("--batch-id", default=None)
+    ap.add_argument("--concurrency", type=int, default=None)
+    ap.add_argument("--out", help="write NDJSON here instead of stdout")
+    args = ap.parse_args()
+
+    if args.questions == "-":
+        questions = read_questions(sys.stdin)
+    else:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = read_questions(f)
+    if not questions:
+        raise SystemExit("no questions")
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    t0 = time.perf_counter()
+    failed = 0
+    try:
+        with contextlib.ExitStack() as stack:
+            client = _client(args.url, stack)
+            for item in run_batches(client, questions, args.batch_id or f"cli-{uuid.uuid4().hex[:8]}",
+                                    args.concurrency):
+                failed += "error" in item
+                out.write(json.dumps(item, ensure_ascii=False) + "\n")
+                out.flush()
+    finally:
+        if args.out:
+            out.close()
+    print(json.dumps({"questions": len(questions), "failed": failed,
+                      "elapsed_s": round(time.perf_counter() - t0, 2)}), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
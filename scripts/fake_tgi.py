@@ -0,0 +1,104 @@
+"""
+Local fake text-generation-inference server for tests and load runs.
+
+    python -m scripts.fake_tgi --port 8081 --delay 0.5
+    HF_TEXTGEN_URL=http://127.0.0.1:8081/generate uvicorn app.main:app
+"""
+import argparse
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, so connection reuse is observable
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        srv = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with srv.lock:
+            srv.requests += 1
+            srv.peers.add(self.client_address)
+            srv.in_flight += 1
+            srv.max_in_flight = max(srv.max_in_flight, srv.in_flight)
+        try:
+            time.sleep(srv.config["delay"])
+            if srv.config["status"] != 200:
+                return self._send(srv.config["status"], {"error": "fake failure"})
+            words = srv.config["text"].split(" ")
+            if not body.get("stream"):
+                return self._send(200, [{"generated_text": srv.config["text"]}])
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, word in enumerate(words):
+                text = word if i == 0 else " " + word
+                self._chunk(f"data:{json.dumps({'token': {'text': text, 'special': False}})}\n\n")
+                time.sleep(srv.config["token_delay"])
+            self._chunk(f"data:{json.dumps({'token': {'text': '</s>', 'special': True}, 'generated_text': srv.config['text']})}\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with srv.lock:
+                srv.in_flight -= 1
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeTGIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, text="Fake answer from the model.", delay=0.0, token_delay=0.0, status=200):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.config = {"text": text, "delay": delay, "token_delay": token_delay, "status": status}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.peers = set()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/generate"
+
+
+@contextmanager
+def serve(**config):
+    server = FakeTGIServer(**config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--delay", type=float, default=0.0, help="seconds before each response")
+    ap.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    ap.add_argument("--status", type=int, default=200, help="HTTP status to answer with")
+    args = ap.parse_args()
+    srv = FakeTGIServer(args.port, delay=args.delay, token_delay=args.token_delay, status=args.status)
+    print(f"fake TGI listening on {srv.url}")
+    srv.serve_forever()
@@ -0,0 +1,8 @@
+"""Latency statistics shared by the benchmark and load scripts."""
+import math
+from typing import List
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending, non-empty sample list."""
+    return sorted_samples[max(0, min(len(sorted_samples) - 1, math.ceil(q * len(sorted_samples)) - 1))]
@@ -0,0 +1,282 @@
+"""
+Replay recorded (or synthetic) chat traffic against the server under load.
+
+    python -m scripts.load_replay [--log logs/conversation_history.jsonl ...] [--synthetic 200]
+                                  [--concurrency 1,4,16] [--rates 5,20,50] [--duration 20]
+                                  [--url http://127.0.0.1:8000] [--llm-delay 0.2]
+                                  [--thread-ids recorded|unique] [--min-overlap 0.8] [--out run.json]
+
+Messages come from the interaction log (rotated .gz files too) or from a
+seeded synthetic mix. Each load level runs for --duration seconds: closed
+loop with N concurrent clients (--concurrency) and/or open loop with Poisson
+arrivals at R requests/s (--rates; latency counts from the scheduled arrival,
+so queueing is not hidden). Without --url a server is started here with
+uvicorn, pointed at the fake TGI endpoint from scripts/fake_tgi.py (fixed
+--llm-delay) and at a temporary conversation log, so only our own stack is
+measured and the replayed log is not appended to. With --url, point that
+server's HF_TEXTGEN_URL at a fake endpoint yourself (python -m scripts.fake_tgi).
+
+Prints (or writes) JSON: one entry per level with throughput, latency
+percentiles, error and 429 rates, and overlap of the returned retrieval with
+the recorded retrieved_docs (Jaccard and recall over (source, chunk)). With
+--min-overlap the exit status is 1 when any level's mean Jaccard falls below it.
+"""
+import argparse
+import asyncio
+import contextlib
+import gzip
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.memory.long_term import LOG_PATH
+from scripts.fake_tgi import serve
+from scripts.latency import percentile
+
+_TOPICS = ["opioid tapering", "chronic pain", "opioid use disorder", "buprenorphine",
+           "pain catastrophizing", "alcohol use", "cannabis and pain", "naloxone distribution"]
+_TEMPLATES = ["Summarize the evidence on {a}", "Compare {a} and {b}", "What do studies say about {a} and {b}?",
+              "Extract sample sizes from studies on {a}", "Critique the methods used to study {a}",
+              "Which papers discuss {a}? Cite them."]
+_OFF_DOMAIN = ["What's the weather in Paris tomorrow?", "Recommend a good pasta recipe"]
+
+
+# ---- Workloads ----
+def _open_log(path: str):
+    return gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else open(path, encoding="utf-8")
+
+def read_log(paths: List[str]) -> List[Dict]:
+    """[{thread_id, message, retrieved}] from interaction log files; unreadable lines are skipped."""
+    out = []
+    for path in paths:
+        with _open_log(path) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    out.append({"thread_id": rec["thread_id"], "message": rec["user_message"],
+                                "retrieved": [(d.get("source"), d.get("chunk")) for d in rec.get("retrieved_docs") or []]})
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    continue
+    return [r for r in out if r["message"].strip()]
+
+def synthetic_mix(n: int, seed: int = 0, turns_per_thread: int = 3) -> List[Dict]:
+    """Seeded in-domain questions across intents plus ~5% off-domain ones; no recorded retrieval."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        if rng.random() < 0.05:
+            message = rng.choice(_OFF_DOMAIN)
+        else:
+            a, b = rng.sample(_TOPICS, 2)
+            message = rng.choice(_TEMPLATES).format(a=a, b=b)
+        out.append({"thread_id": f"synthetic-{i // turns_per_thread}", "message": message, "retrieved": None})
+    return out
+
+
+def overlap(recorded, returned) -> Dict[str, float]:
+    """Jaccard and recall of the returned (source, chunk) pairs against the recorded ones."""
+    a, b = set(map(tuple, recorded)), set(map(tuple, returned))
+    if not a and not b:
+        return {"jaccard": 1.0, "recall": 1.0}
+    return {"jaccard": len(a & b) / len(a | b), "recall": len(a & b) / len(a) if a else 1.0}
+
+
+# ---- Load ----
+async def run_level(client: httpx.AsyncClient, records: List[Dict], concurrency: Optional[int] = None,
+                    rate: Optional[float] = None, duration: float = 20.0, max_requests: Optional[int] = None,
+                    thread_ids: str = "recorded", seed: int = 0, timeout: float = 60.0) -> Dict:
+    """One load level: `concurrency` closed-loop clients, or Poisson arrivals at `rate` per second."""
+    if (concurrency is None) == (rate is None):
+        raise ValueError("give exactly one of concurrency or rate")
+    results = []
+    began = time.perf_counter()
+    deadline = began + duration
+
+    async def one(i: int, scheduled: float):
+        rec = records[i % len(records)]
+        thread_id = rec["thread_id"] if thread_ids == "recorded" else f"load-{i}"
+        try:
+            r = await client.post("/chat", json={"thread_id": thread_id, "message": rec["message"]}, timeout=timeout)
+            status, body = r.status_code, (r.json() if r.status_code == 200 else None)
+        except (httpx.HTTPError, ValueError) as e:
+            status, body = type(e).__name__, None
+        res = {"status": status, "latency": time.perf_counter() - scheduled}
+        if body is not None and rec["retrieved"] is not None:
+            res.update(overlap(rec["retrieved"], [(d.get("source"), d.get("chunk")) for d in body.get("retrieval") or []]))
+        results.append(res)
+
+    if concurrency:
+        issued = iter(range(max_requests or sys.maxsize))
+
+        async def client_loop():
+            for i in issued:
+                if time.perf_counter() >= deadline:
+                    return
+                await one(i, time.perf_counter())
+
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    else:
+        rng = random.Random(seed)
+        tasks, at, i = [], began, 0
+        while at < deadline and i < (max_requests or sys.maxsize):
+            delay = at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(i, at)))
+            i += 1
+            at += rng.expovariate(rate)
+        await asyncio.gather(*tasks)
+
+    level = {"concurrency": concurrency} if concurrency else {"rate_rps": rate}
+    return {**level, **summarize(results, time.perf_counter() - began)}
+
+
+def summarize(results: List[Dict], elapsed: float) -> Dict:
+    n = len(results)
+    ok = [r for r in results if r["status"] == 200]
+    limited = sum(r["status"] == 429 for r in results)
+    lat = sorted(r["latency"] for r in ok)
+    ms = lambda x: round(x * 1000, 2)
+    compared = [r for r in ok if "jaccard" in r]
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    return {
+        "requests": n, "ok": len(ok), "elapsed_s": round(elapsed, 2),
+        "offered_rps": round(n / elapsed, 2) if elapsed else None,
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+        "error_rate": round((n - len(ok) - limited) / n, 4) if n else 0.0,
+        "rate_limited_rate": round(limited / n, 4) if n else 0.0,
+        "mean_ms": ms(sum(lat) / len(lat)) if lat else None,
+        "p50_ms": ms(percentile(lat, 0.50)) if lat else None,
+        "p95_ms": ms(percentile(lat, 0.95)) if lat else None,
+        "p99_ms": ms(percentile(lat, 0.99)) if lat else None,
+        "overlap_compared": len(compared),
+        "retrieval_jaccard": round(sum(r["jaccard"] for r in compared) / len(compared), 4) if compared else None,
+        "retrieval_recall": round(sum(r["recall"] for r in compared) / len(compared), 4) if compared else None,
+        "statuses": statuses,
+    }
+
+
+async def run_levels(base_url: str, records: List[Dict], concurrency: List[int], rates: List[float],
+                     duration: float, thread_ids: str = "recorded", seed: int = 0, transport=None) -> List[Dict]:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=max(concurrency + [64]))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, transport=transport) as client:
+        levels = []
+        for c in concurrency:
+            levels.append(await run_level(client, records, concurrency=c, duration=duration,
+                                          thread_ids=thread_ids, seed=seed))
+        for r in rates:
+            levels.append(await run_level(client, records, rate=r, duration=duration,
+                                          thread_ids=thread_ids, seed=seed))
+        return levels
+
+
+# ---- Local stack ----
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@contextlib.contextmanager
+def local_server(workdir: str, llm_delay: float = 0.2, startup_timeout: float = 120.0):
+    """uvicorn app.main:app on a free port, answering through the fake TGI endpoint; yields its base URL."""
+    with serve(delay=llm_delay) as llm:
+        port = _free_port()
+        env = {**os.environ, "HF_TEXTGEN_URL": llm.url, "LOG_LEVEL": "WARNING",
+               "CONVERSATION_LOG": os.path.join(workdir, "conversation_history.jsonl"),
+               "CONVERSATION_DB": os.path.join(workdir, "conversation_history.sqlite3")}
+        proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                                 "--port", str(port), "--log-level", "warning"], env=env, stdout=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{port}"
+        try:
+            give_up = time.monotonic() + startup_timeout
+            while True:
+                if proc.poll() is not None:
+                    raise SystemExit(f"server exited with status {proc.returncode}")
+                try:
+                    if httpx.get(url + "/health", timeout=1.0).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.monotonic() > give_up:
+                    raise SystemExit("server did not become healthy")
+                time.sleep(0.25)
+            yield url
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def _floats(spec: str, cast=float) -> List:
+    return [cast(x) for x in spec.split(",") if x.strip()]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--log", nargs="*", default=None, help=f"interaction log(s) to replay (default {LOG_PATH})")
+    ap.add_argument("--synthetic", type=int, default=0, help="use N synthetic messages instead of a log")
+    ap.add_argument("--concurrency", default="1,4,16", help="closed-loop client counts")
+    ap.add_argument("--rates", default="", help="open-loop arrival rates (requests/s)")
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds per level")
+    ap.add_argument("--url", help="running server (default: start one with a fake LLM)")
+    ap.add_argument("--llm-delay", type=float, default=0.2, help="fake LLM latency in seconds")
+    ap.add_argument("--thread-ids", choices=("recorded", "unique"), default="recorded",
+                    help="recorded: per-thread rate limits apply as in production")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--min-overlap", type=float, default=None, help="fail below this mean retrieval Jaccard")
+    ap.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = ap.parse_args()
+
+    if args.synthetic:
+        records, source = synthetic_mix(args.synthetic, args.seed), f"synthetic:{args.synthetic}"
+    else:
+        paths = args.log or [LOG_PATH]
+        records, source = read_log(paths), ",".join(paths)
+    if not records:
+        raise SystemExit("no messages to replay (try --synthetic 200)")
+
+    concurrency, rates = _floats(args.concurrency, int), _floats(args.rates)
+    with contextlib.ExitStack() as stack:
+        url = args.url
+        if url is None:
+            url = stack.enter_context(local_server(stack.enter_context(tempfile.TemporaryDirectory()),
+                                                   args.llm_delay))
+        levels = asyncio.run(run_levels(url, records, concurrency, rates, args.duration, args.thread_ids, args.seed))
+
+    report = {"source": source, "messages": len(records), "url": args.url or "local",
+              "llm_delay_s": None if args.url else args.llm_delay, "duration_s": args.duration,
+              "thread_ids": args.thread_ids, "levels": levels}
+    low = [lv for lv in levels if args.min_overlap is not None and lv["retrieval_jaccard"] is not None
+           and lv["retrieval_jaccard"] < args.min_overlap]
+    if args.min_overlap is not None:
+        report["overlap_failures"] = len(low)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    for lv in levels:
+        label = f"c={lv['concurrency']}" if "concurrency" in lv else f"rate={lv['rate_rps']}/s"
+        print(f"{label:>12}  {lv['throughput_rps']} rps  p50 {lv['p50_ms']} ms  p95 {lv['p95_ms']} ms  "
+              f"429 {lv['rate_limited_rate']:.1%}  err {lv['error_rate']:.1%}  jaccard {lv['retrieval_jaccard']}",
+              file=sys.stderr)
+    if low:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
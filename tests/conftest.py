@@ -0,0 +1,103 @@
+import hashlib
+
+import numpy as np
+import pytest
+from chromadb.api.types import EmbeddingFunction
+from fastapi.testclient import TestClient
+
+from app.services import retrieval
+from app.services.retrieval import RetrievalEngine
+
+PAPERS = [
+    "pain and smoking cessation outcomes",
+    "alcohol use among veterans with chronic pain",
+    "cannabis expectancies for pain relief",
+    "sleep impairment and nicotine dependence",
+]
+
+
+class FakeEmbeddingFunction(EmbeddingFunction):
+    """Deterministic bag-of-words embedding so tests never load a model."""
+
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+        self.calls = 0
+
+    def __call__(self, input):
+        self.calls += 1
+        out = []
+        for text in input:
+            v = np.zeros(self.dim, dtype=np.float32)
+            for tok in text.lower().split():
+                v[int(hashlib.md5(tok.encode()).hexdigest(), 16) % self.dim] += 1.0
+            n = np.linalg.norm(v)
+            out.append((v / n if n else v).tolist())
+        return out
+
+
+@pytest.fixture
+def fake_embedder():
+    """Factory for the fake embedding function: fake_embedder(dim=64)."""
+    return FakeEmbeddingFunction
+
+
+@pytest.fixture
+def make_engine(tmp_path, fake_embedder):
+    """
+    Factory for a RetrievalEngine under tmp_path with the fake embedder. The
+    "papers" collection gets `texts` (PAPERS by default; ids doc::i, metadata
+    p<i>.pdf chunk 0 unless given) and its indexes are built and published,
+    as ingest would.
+    """
+    def make(texts=PAPERS, metadatas=None, dim: int = 64, path: str = "chroma") -> RetrievalEngine:
+        engine = RetrievalEngine(db_path=str(tmp_path / path))
+        engine._embedding_function = fake_embedder(dim)
+        col = engine.get_collection("papers", create=True)
+        if texts:
+            col.add(
+                ids=[f"doc::{i}" for i in range(len(texts))],
+                documents=list(texts),
+                metadatas=metadatas or [{"source": f"p{i}.pdf", "chunk": 0} for i in range(len(texts))],
+            )
+        engine.publish_corpus("papers")
+        engine._embedding_function.calls = 0
+        return engine
+
+    return make
+
+
+@pytest.fixture
+def engine(make_engine):
+    """Engine over the four PAPERS."""
+    return make_engine()
+
+
+@pytest.fixture
+def app_engine(engine, monkeypatch):
+    """`engine`, installed as the process-wide engine the app and services use."""
+    monkeypatch.setattr(retrieval, "_engine", engine)
+    return engine
+
+
+@pytest.fixture
+def memory_store(tmp_path, monkeypatch):
+    """
+    Long-term memory and the interaction log under tmp_path: swaps the store,
+    LOG_PATH and the log writer, as scripts/bench_pipeline._isolated does.
+    """
+    from app.memory import log_writer, long_term
+
+    writer = log_writer.InteractionLogWriter(str(tmp_path / "conversation_history.jsonl"))
+    store = long_term.LongTermStore(str(tmp_path / "conversation_history.sqlite3"), legacy_log=None)
+    monkeypatch.setattr(long_term, "_store", store)
+    monkeypatch.setattr(long_term, "LOG_PATH", writer.path)
+    monkeypatch.setattr(log_writer, "_writer", writer)
+    yield store
+    writer.close()
+
+
+@pytest.fixture
+def client(app_engine, memory_store):
+    """TestClient for the app, retrieving from `app_engine` and remembering into `memory_store`."""
+    from app.main import app
+    return TestClient(app)
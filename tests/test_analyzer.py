@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from app.services.analyzer import analyze_query
+from app.services.intent import ACRONYMS, INTENT_KEYWORDS, classify_intent, normalize_message
+from app.services.safety import CLINICAL_TERMS, SUICIDE_TERMS, basic_safety_check
+from app.services.topics import TOPIC_PACKS, is_domain_relevant, select_topic_terms
+
+MESSAGES = [
+    "Summarize behavioral impacts from paper X",
+    "I feel suicidal and want to end my life",
+    "What dose of oxycodone should I take?",
+    "Compare smoking vs. vaping and sleep quality",
+    "What are the findings on CPES and chronic pain?",
+    "List all limitations of the ACT trial on MTurk",
+    "Cite pages about PTSD hyperarousal and alcohol (AUDIT) scores",
+    "Quitting was quite hard; does audience size matter?",
+    "opioids, opiates and prescription opioid misuse in OUD",
+    "Effects of divalproex on smoking cue reactivity",
+    "central sensitization and fear-avoidance in catastrophizing",
+    "e-cigarette and ecig use among smokers",
+    "hello",
+    "",
+]
+
+VOCAB = ([t for t in SUICIDE_TERMS + CLINICAL_TERMS]
+         + [k for _, _, kws in INTENT_KEYWORDS for k in kws]
+         + [t for terms in TOPIC_PACKS.values() for t in terms]
+         + list(ACRONYMS) + ["pain", "withdrawal", "dependent", "smokers", "nociceptive", "sleeps",
+                             "papers", "study", "the", "of", "quite", "react", "audience", "pages"])
+
+
+def _random_messages(n=400, seed=7):
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        words = rng.sample(VOCAB, rng.randint(1, 6))
+        if rng.random() < 0.3:
+            words = [w.upper() if rng.random() < 0.5 else w.title() for w in words]
+        out.append(" ".join(words))
+    return out
+
+
+def _reference(message):
+    safety = basic_safety_check(message)
+    intent = classify_intent(message)
+    normalized = normalize_message(message, intent.intent)
+    return safety, intent, normalized, is_domain_relevant(normalized), select_topic_terms(normalized)
+
+
+@pytest.mark.parametrize("message", MESSAGES + _random_messages())
+def test_analyzer_matches_individual_functions(message):
+    safety, intent, normalized, domain_ok, topic_terms = _reference(message)
+    got = analyze_query(message)
+    assert got.safety == safety
+    assert got.intent == intent
+    assert got.normalized == normalized
+    assert got.domain_ok == domain_ok
+    assert got.topic_terms == topic_terms
+
+
+NON_ASCII = ["İ", "ß", "ﬁ", "K", "ſ", "é", "Σ", "\u0307", "ǅ", "ΐ", "  ", "\n", "-"]
+
+
+def _non_ascii_messages(n=400, seed=11):
+    # pieces glued with and without spaces: lower() changes the length of "İ" and "ǅ"-like
+    # text, and combining marks change where word boundaries fall
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        pieces = rng.sample(VOCAB, rng.randint(1, 4)) + rng.sample(NON_ASCII, rng.randint(1, 3))
+        rng.shuffle(pieces)
+        out.append("".join(p + (" " if rng.random() < 0.5 else "") for p in pieces))
+    return out
+
+
+@pytest.mark.parametrize("message", _non_ascii_messages() + [
+    "I want to kill  myself", "İ kill myself", "İpain and opioİds", "kill\nmyself", "Summarİze pain",
+])
+def test_analyzer_matches_individual_functions_on_non_ascii_and_odd_whitespace(message):
+    safety, intent, normalized, domain_ok, topic_terms = _reference(message)
+    got = analyze_query(message)
+    assert (got.safety, got.intent, got.normalized, got.domain_ok, got.topic_terms) == \
+        (safety, intent, normalized, domain_ok, topic_terms)
@@ -0,0 +1,36 @@
+import time
+
+from app.services.answer_cache import SemanticAnswerCache
+
+
+def _store(cache, vec, intent="summarize", version="v1", answer="A"):
+    cache.store(vec, intent, version, "q", answer, ["p.pdf (chunk 0)"], [{"source": "p.pdf", "chunk": 0}], 0.8)
+
+
+def test_similar_query_hits_and_other_intent_misses():
+    cache = SemanticAnswerCache(threshold=0.9, ttl_sec=60, max_size=8)
+    _store(cache, [1.0, 0.0, 0.0])
+
+    hit = cache.lookup([0.99, 0.05, 0.0], "summarize", "v1")
+    assert hit and hit["answer"] == "A"
+    assert cache.lookup([0.0, 1.0, 0.0], "summarize", "v1") is None
+    assert cache.lookup([1.0, 0.0, 0.0], "compare", "v1") is None
+
+
+def test_corpus_version_ttl_and_lru_eviction():
+    cache = SemanticAnswerCache(threshold=0.9, ttl_sec=60, max_size=2)
+    _store(cache, [1.0, 0.0, 0.0])
+    assert cache.lookup([1.0, 0.0, 0.0], "summarize", "v2") is None   # reindexed
+    assert cache.stats()["size"] == 0
+    assert cache.stats()["invalidations"] == 1 and cache.stats()["expirations"] == 0
+
+    _store(cache, [1.0, 0.0, 0.0], answer="A")
+    _store(cache, [0.0, 1.0, 0.0], answer="B")
+    _store(cache, [0.0, 0.0, 1.0], answer="C")                          # evicts A
+    assert cache.lookup([1.0, 0.0, 0.0], "summarize", "v1") is None
+    assert cache.stats()["evictions"] == 1
+
+    cache.ttl_sec = 0
+    time.sleep(0.01)
+    assert cache.lookup([0.0, 1.0, 0.0], "summarize", "v1") is None
+    assert cache.stats()["expirations"] == 2 and cache.stats()["invalidations"] == 1
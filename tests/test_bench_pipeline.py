@@ -0,0 +1,24 @@
+from app.services import retrieval
+from scripts.bench_pipeline import STAGES, compare, run_suite, synthetic_corpus
+
+
+def test_synthetic_corpus_is_deterministic():
+    assert list(synthetic_corpus(30, seed=1)) == list(synthetic_corpus(30, seed=1))
+    assert list(synthetic_corpus(30, seed=1)) != list(synthetic_corpus(30, seed=2))
+
+
+def test_run_suite_reports_every_stage_and_restores_engine():
+    before = retrieval._engine
+    report = run_suite(chunks=60, repeat=3)
+    assert set(report["stages"]) == set(STAGES)
+    for stats in report["stages"].values():
+        assert stats["n"] == 3 and stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+    assert retrieval._engine is before
+
+
+def test_compare_flags_only_real_regressions():
+    base = {"stages": {"analyzer": {"p95_ms": 0.05}, "chat_e2e": {"p95_ms": 40.0}, "rrf_merge": {"p95_ms": 0.2}}}
+    cur = {"stages": {"analyzer": {"p95_ms": 0.08}, "chat_e2e": {"p95_ms": 60.0}, "rrf_merge": {"p95_ms": 0.21}}}
+    regressions = compare(cur, base, tolerance=0.25, min_delta_ms=0.05)
+    assert [r["stage"] for r in regressions] == ["chat_e2e"]   # analyzer grew < 0.05 ms
+    assert regressions[0]["ratio"] == 1.5
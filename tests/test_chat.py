@@ -1,14 +1,11 @@
-from fastapi.testclient import TestClient
-from app.main import app
+import json
 
-client = TestClient(app)
-
-def test_health():
+def test_health(client):
     r = client.get('/health')
     assert r.status_code == 200
     assert r.json()['status'] == 'ok'
 
-def test_chat_ok():
+def test_chat_ok(client):
     r = client.post('/chat', json={
         "thread_id": "t1",
         "message": "Summarize behavioral impacts from paper X"
@@ -18,7 +15,7 @@ def test_chat_ok():
     assert js["intent"]["intent"] in ["summarize","compare","extract","cite","critique","other"]
     assert js["safety"]["allowed"] is True
 
-def test_chat_safety_block():
+def test_chat_safety_block(client):
     r = client.post('/chat', json={
         "thread_id": "t1",
         "message": "I feel suicidal and want to end my life"
@@ -26,3 +23,135 @@ def test_chat_safety_block():
     assert r.status_code == 200
     js = r.json()
     assert js["safety"]["allowed"] is False
+
+def _events(body: str):
+    out = []
+    for block in filter(None, body.split("\n\n")):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+def test_chat_stream_event_order(client, monkeypatch):
+    from app.routers import chat as chat_router
+    hits = [{"source": "opioids.pdf", "chunk": 0, "score": 0.9,
+             "excerpt": "Opioid tapering reduced pain interference in chronic pain patients."}]
+    monkeypatch.setattr(chat_router, "retrieve_relevant_chunks", lambda *a, **k: (hits, 0.9))
+    monkeypatch.setattr(chat_router, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.delenv("HUGGINGFACEHUB_API_TOKEN", raising=False)
+    monkeypatch.delenv("HF_API_TOKEN", raising=False)
+
+    r = client.post('/chat/stream', json={"thread_id": "t-stream", "message": "Summarize opioid tapering and chronic pain"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    events = _events(r.text)
+    names = [e for e, _ in events]
+    assert names[0] == "meta" and names[1] == "sources" and names[-1] == "done"
+    assert set(names[2:-1]) == {"token"}
+    assert events[1][1]["citations"] == ["opioids.pdf (chunk 0)"]
+    done = events[-1][1]
+    assert done["generated_answer"] == "".join(d["text"] for e, d in events if e == "token").strip()
+
+def test_chat_stream_safety_block(client):
+    r = client.post('/chat/stream', json={"thread_id": "t-stream", "message": "I feel suicidal and want to end my life"})
+    events = _events(r.text)
+    assert [e for e, _ in events] == ["meta", "done"]
+    assert events[0][1]["safety"]["allowed"] is False
+    assert events[1][1]["tags"] == ["safety_blocked"]
+
+def test_chat_batch_streams_ndjson_in_completion_order(client, monkeypatch):
+    import asyncio
+    from app.routers import chat as chat_router
+    hits = [{"source": "opioids.pdf", "chunk": 0, "score": 0.9,
+             "excerpt": "Opioid tapering reduced pain interference in chronic pain patients."}]
+    primed, active, peak = [], [0], [0]
+
+    async def fake_answer(user_query, retrieved, domain_ok, relevant):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.05 if "first" in user_query else 0.0)
+        active[0] -= 1
+        return f"answer: {user_query}", ["opioids.pdf (chunk 0)"]
+
+    def no_memory(*a, **k):
+        raise AssertionError("batch touched conversational memory")
+
+    monkeypatch.setattr(chat_router, "retrieve_relevant_chunks", lambda *a, **k: (hits, 0.9))
+    monkeypatch.setattr(chat_router, "prime_query_embeddings", lambda qs, extra=(): primed.append(list(qs)))
+    monkeypatch.setattr(chat_router, "agenerate_answer", fake_answer)
+    monkeypatch.setattr(chat_router, "ANSWER_CACHE_ENABLED", False)
+    for name in ("_remember", "store_interaction"):
+        monkeypatch.setattr(chat_router, name, no_memory)
+    monkeypatch.setattr(chat_router.memory, "add", no_memory)
+
+    questions = [{"id": "q1", "message": "Summarize the first opioid tapering study"},
+                 {"id": "q2", "message": "I feel suicidal and want to end my life"},
+                 {"id": "q3", "message": "Summarize chronic pain and opioid misuse"},
+                 {"id": "q4", "message": "Compare tapering outcomes in chronic pain"}]
+    r = client.post("/chat/batch", json={"batch_id": "b-order", "questions": questions, "max_concurrency": 2})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+
+    assert sorted(item["index"] for item in lines) == [0, 1, 2, 3]
+    assert lines[-1]["id"] == "q1"                      # slowest answer arrives last
+    by_id = {item["id"]: item for item in lines}
+    assert by_id["q2"]["tags"] == ["safety_blocked"] and by_id["q2"]["retrieval"] == []
+    assert by_id["q3"]["citations"] == ["opioids.pdf (chunk 0)"]
+    assert by_id["q3"]["generated_answer"] == "answer: " + by_id["q3"]["normalized_message"]
+    assert len(primed) == 1 and len(primed[0]) == 3      # one embedding call for the allowed questions
+    assert peak[0] <= 2
+
+def test_chat_batch_reports_a_malformed_item_and_a_failed_feeder(client, monkeypatch):
+    from app.routers import chat as chat_router
+    analyze = chat_router._analyze
+    monkeypatch.setattr(chat_router, "_analyze", lambda q: {} if q.message == "broken" else analyze(q))
+    monkeypatch.setattr(chat_router, "retrieve_relevant_chunks", lambda *a, **k: ([], 0.0))
+    monkeypatch.setattr(chat_router, "ANSWER_CACHE_ENABLED", False)
+    questions = [{"message": "I want to end my life"}, {"message": "broken"}, {"message": "I feel suicidal"}]
+
+    r = client.post("/chat/batch", json={"batch_id": "b-malformed", "questions": questions})
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert sorted(item["index"] for item in lines) == [0, 1, 2]
+    assert [item["index"] for item in lines if "error" in item] == [1]
+
+    def boom(turns):
+        raise RuntimeError("retrieval down")
+    monkeypatch.setattr(chat_router, "_retrieve_wave", boom)
+    questions[1] = {"message": "Summarize chronic pain"}
+    r = client.post("/chat/batch", json={"batch_id": "b-feeder", "questions": questions})
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert lines[-1] == {"index": None, "error": "batch aborted: retrieval down"}
+    assert sorted(item["index"] for item in lines[:-1]) == [0, 2]
+
+
+def test_chat_batch_validates_and_rate_limits(client):
+    assert client.post("/chat/batch", json={"batch_id": "b-empty", "questions": []}).status_code == 422
+    body = {"batch_id": "b-429", "questions": [{"message": "I want to end my life"}]}
+    codes = [client.post("/chat/batch", json=body).status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
+
+
+def test_answer_cache_key_ignores_the_intent_preamble(make_engine, monkeypatch):
+    import numpy as np
+    from app.routers import chat as chat_router
+    from app.schemas import ChatRequest
+    from app.services import retrieval
+    from app.services.answer_cache import SemanticAnswerCache
+
+    engine = make_engine(texts=(), dim=256)
+    monkeypatch.setattr(retrieval, "_engine", engine)
+    monkeypatch.setattr(chat_router, "answer_cache", SemanticAnswerCache(threshold=0.85))
+    monkeypatch.setattr(chat_router, "ANSWER_CACHE_ENABLED", True)
+    hits = [{"source": "p.pdf", "chunk": 0, "score": 0.9, "excerpt": "..."}]
+    monkeypatch.setattr(chat_router, "retrieve_relevant_chunks", lambda *a, **k: (hits, 0.9))
+
+    first, second, again = (chat_router._analyze(ChatRequest(thread_id="t", message=m))
+                            for m in ("Summarize smoking", "Summarize alcohol", "Summarize smoking"))
+    a, b = engine.embed_queries([first["normalized"], second["normalized"]])
+    assert float(np.dot(a, b)) >= 0.85   # the preamble alone would make these one cache entry
+
+    turn = chat_router._retrieve(first)
+    chat_router.answer_cache.store(turn["query_vec"], "summarize", turn["corpus_version"], first["normalized"],
+                                   "about smoking", [], hits, 0.9)
+    assert chat_router._retrieve(second)["cached"] is None
+    assert chat_router._retrieve(again)["cached"]["answer"] == "about smoking"
@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+
+import pytest
+
+import app.services.retrieval as retrieval
+from app.services import ingest
+from app.services.jobs import ReindexJobs, JobConflict
+from app.services.text_cache import PageTextCache
+
+
+def make_pdf(path, pages):
+    """Write a minimal text PDF (one content stream per page)."""
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objs.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                    f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objs)} 0 R >>")
+        kids.append(f"{len(objs)} 0 R")
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out, offsets = b"%PDF-1.4\n", []
+    for i, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch, fake_embedder):
+    engine = retrieval.RetrievalEngine(db_path=str(tmp_path / "chroma"))
+    engine._embedding_function = fake_embedder()
+    monkeypatch.setattr(retrieval, "_engine", engine)
+    papers = tmp_path / "papers"
+    papers.mkdir()
+    monkeypatch.setattr(ingest, "DATA_DIR", str(papers))
+    monkeypatch.setattr(ingest, "TEXT_CACHE_DIR", str(tmp_path / "text_cache"))
+    make_pdf(papers / "a.pdf", ["Pain and smoking cessation outcomes"])
+    make_pdf(papers / "b.pdf", ["Alcohol use among veterans", "Chronic pain and sleep"])
+    return engine, papers
+
+
+def test_reingest_uses_manifest_not_hashes(corpus):
+    engine, papers = corpus
+    first = ingest.ingest_all(workers=1, batch_size=2)
+    assert first["added_docs"] == 2 and first["added_chunks"] >= 2
+
+    second = ingest.ingest_all(workers=1)
+    assert second["added_docs"] == 0 and second["hashed_docs"] == 0
+
+    os.utime(papers / "a.pdf", ns=(1, 1))          # touched, same content
+    third = ingest.ingest_all(workers=1)
+    assert third["hashed_docs"] == 1 and third["added_docs"] == 0
+
+
+def test_manifest_rows_stay_out_of_the_index(corpus):
+    engine, papers = corpus
+    ingest.ingest_all(workers=1)
+    col = engine.get_collection()
+    assert col.get(where={"chunk": -1})["ids"] == []
+    assert ingest.collection_stats()["documents"] == 2
+
+    os.remove(papers / "b.pdf")
+    out = ingest.ingest_all(workers=1)
+    assert out["removed_docs"] == 1
+    assert col.get(where={"source": "b.pdf"})["ids"] == []
+
+
+def test_reindex_job_progress_and_single_flight(tmp_path):
+    gate = threading.Event()
+
+    def fake_ingest(progress, cancel):
+        progress({"docs_total": 2, "docs_done": 1, "chunks_done": 10})
+        gate.wait(5)
+        return {"added_docs": 2, "cancelled": cancel.is_set()}
+
+    jobs = ReindexJobs(fake_ingest, lock_dir=str(tmp_path))
+    job = jobs.start()
+    with pytest.raises(JobConflict):
+        jobs.start()
+
+    assert jobs.cancel(job["id"])["state"] == "cancelling"
+    gate.set()
+    for _ in range(100):
+        if jobs.get(job["id"])["state"] not in ("running", "cancelling"):
+            break
+        time.sleep(0.02)
+    done = jobs.get(job["id"])
+    assert done["state"] == "cancelled"
+    assert done["docs_done"] == 1 and done["chunks_done"] == 10
+    assert jobs.start()["id"] != job["id"]      # lock released
+
+
+def test_upload_streams_dedupes_and_ingests_one_file(corpus, tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.routers import files
+
+    engine, papers = corpus
+    monkeypatch.setattr(files, "DATA_DIR", str(papers))
+    make_pdf(tmp_path / "c.pdf", ["Cannabis expectancies for pain"])
+    body = (tmp_path / "c.pdf").read_bytes()
+    client = TestClient(app)
+
+    r = client.post("/upload?ingest=true", files={"file": ("c.pdf", body, "application/pdf")})
+    js = r.json()
+    assert r.status_code == 200 and js["duplicate"] is False
+    assert js["ingest"]["added_docs"] == 1
+    assert engine.get_collection().get(where={"source": "c.pdf"})["ids"]
+
+    r = client.post("/upload", files={"file": ("copy.pdf", body, "application/pdf")})
+    assert r.json()["duplicate"] is True
+
+    make_pdf(tmp_path / "d.pdf", ["Opioid misuse and sleep"])
+    other_worker = ReindexJobs(lambda **kw: {}, lock_dir=engine.db_path)   # holds the index flock
+    r = other_worker.run_exclusive(client.post, "/upload?ingest=true",
+                                   files={"file": ("d.pdf", (tmp_path / "d.pdf").read_bytes(), "application/pdf")})
+    assert r.status_code == 409 and r.json()["saved_as"] == "d.pdf"
+    assert (papers / "d.pdf").exists() and not engine.get_collection().get(where={"source": "d.pdf"})["ids"]
+    assert not (papers / "copy.pdf").exists()
+
+    monkeypatch.setattr(files, "MAX_UPLOAD_BYTES", 10)
+    r = client.post("/upload", files={"file": ("big.pdf", body, "application/pdf")})
+    assert r.status_code == 413
+    assert not list(papers.glob("*big.pdf*"))
+
+
+def test_chunks_are_topic_tagged_and_retagged(corpus, monkeypatch):
+    engine, papers = corpus
+    ingest.ingest_all(workers=1)
+    col = engine.get_collection()
+    tagged = col.get(where={"t_nicotine": True}, include=["metadatas"])["metadatas"]
+    assert {m["source"] for m in tagged} == {"a.pdf"}
+    assert all(m["t_cessation_relapse"] and not m["t_alcohol"] for m in tagged)
+
+    # changed pack definitions: metadata-only re-tag, nothing re-embedded
+    monkeypatch.setattr(ingest, "TOPIC_TAGS_VERSION", "new")
+    monkeypatch.setattr(ingest, "topic_flags", lambda packs: {"t_alcohol": "alcohol" in packs, "topics_v": "new"})
+    engine.embedding_function.calls = 0
+    out = ingest.ingest_all(workers=1)
+    assert out["retagged_chunks"] == col.count() and engine.embedding_function.calls == 0
+    assert ingest.ingest_all(workers=1)["retagged_chunks"] == 0
+
+    # the re-tag pages through the collection
+    monkeypatch.setattr(ingest, "TOPIC_TAGS_VERSION", "newer")
+    monkeypatch.setattr(ingest, "topic_flags", lambda packs: {"topics_v": "newer"})
+    assert ingest._retag_topics(col, batch_size=1) == col.count() > 1
+    assert {m["topics_v"] for m in col.get(include=["metadatas"])["metadatas"]} == {"newer"}
+
+
+def test_rechunking_reads_the_text_cache_and_keeps_pages(corpus, monkeypatch):
+    engine, papers = corpus
+    first = ingest.ingest_all(workers=1)
+    assert first["text_cache_hits"] == 0
+    metas = engine.get_collection().get(where={"source": "b.pdf"}, include=["metadatas"])["metadatas"]
+    assert [(m["page"], m["page_end"]) for m in metas] == [(1, 2)]
+    from app.services.llm_reasoning import _build_citations
+    hits = retrieval.MultiQuerySearcher().search_single("Alcohol use among veterans")
+    assert hits and all("page" in h for h in hits)
+    assert _build_citations([h for h in hits if h["source"] == "b.pdf"]) == ["b.pdf (chunk 0, p. 1)"]
+
+    # new chunking params: every document is re-chunked from cached page text, no PDF parsing
+    def no_parse(path):
+        raise AssertionError("PDF parsed again")
+    monkeypatch.setattr(ingest, "_pdf_pages", no_parse)
+    monkeypatch.setattr(ingest, "CHUNK_SIZE", 20)
+    monkeypatch.setattr(ingest, "CHUNK_OVERLAP", 0)
+    second = ingest.ingest_all(workers=1)
+    assert second["added_docs"] == 2 and second["text_cache_hits"] == 2
+    res = engine.get_collection().get(where={"source": "b.pdf"}, include=["documents", "metadatas"])
+    pages = {doc: meta["page"] for doc, meta in zip(res["documents"], res["metadatas"])}
+    assert pages["Alcohol use among"] == 1 and pages["Chronic pain and"] == 2
+
+
+def test_page_text_cache_versions_and_prune(tmp_path):
+    cache = PageTextCache(str(tmp_path), version="x-1")
+    assert cache.get("ab" * 32) is None
+    pages, hit = cache.get_or_extract("ab" * 32, lambda: ["p1", "p2"])
+    assert (pages, hit) == (["p1", "p2"], False)
+    assert cache.get_or_extract("ab" * 32, lambda: 1 / 0) == (["p1", "p2"], True)
+    cache.put("cd" * 32, ["other"])
+
+    assert PageTextCache(str(tmp_path), version="x-2").get("ab" * 32) is None   # extractor changed
+    assert cache.prune(keep={"ab" * 32}) == 1
+    assert cache.get("ab" * 32) == ["p1", "p2"] and cache.get("cd" * 32) is None
@@ -0,0 +1,194 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.llm_client import CircuitBreaker, CircuitOpen, LLMClient, LLMUnavailable
+from app.services import llm_reasoning
+from scripts.fake_tgi import serve
+
+PARAMS = {"max_new_tokens": 16}
+
+
+def test_generate_reuses_pooled_connection():
+    with serve(text="pooled answer") as srv:
+        async def run():
+            client = LLMClient(srv.url)
+            try:
+                return [await client.generate("q", PARAMS) for _ in range(3)]
+            finally:
+                await client.aclose()
+        assert asyncio.run(run()) == ["pooled answer"] * 3
+        assert srv.requests == 3
+        assert len(srv.peers) == 1   # one keep-alive connection
+
+
+def test_stream_yields_tokens_and_skips_special():
+    with serve(text="alpha beta gamma") as srv:
+        async def run():
+            client = LLMClient(srv.url)
+            try:
+                return [t async for t in client.stream("q", PARAMS)]
+            finally:
+                await client.aclose()
+        assert asyncio.run(run()) == ["alpha", " beta", " gamma"]
+
+
+def test_deadline_bounds_slow_endpoint():
+    with serve(delay=2.0) as srv:
+        async def run():
+            client = LLMClient(srv.url, timeout=0.2)
+            try:
+                await client.generate("q", PARAMS)
+            finally:
+                await client.aclose()
+        start = time.monotonic()
+        with pytest.raises(LLMUnavailable, match="deadline"):
+            asyncio.run(run())
+        assert time.monotonic() - start < 1.5
+
+
+def test_concurrency_cap():
+    with serve(delay=0.1) as srv:
+        async def run():
+            client = LLMClient(srv.url, max_concurrency=2)
+            try:
+                await asyncio.gather(*(client.generate("q", PARAMS) for _ in range(6)))
+            finally:
+                await client.aclose()
+        asyncio.run(run())
+        assert srv.requests == 6
+        assert srv.max_in_flight <= 2
+
+
+def test_circuit_breaker_opens_and_recovers():
+    now = [0.0]
+    breaker = CircuitBreaker(failures=2, reset_after=10, clock=lambda: now[0])
+    with serve(status=503) as srv:
+        async def call(client):
+            return await client.generate("q", PARAMS)
+
+        async def run():
+            client = LLMClient(srv.url, breaker=breaker)
+            try:
+                for _ in range(2):
+                    with pytest.raises(LLMUnavailable):
+                        await call(client)
+                assert breaker.state == "open"
+                with pytest.raises(CircuitOpen):
+                    await call(client)
+                assert srv.requests == 2            # rejected without touching the endpoint
+
+                now[0] = 11                          # half-open: one trial call
+                srv.config["status"] = 200
+                assert await call(client) == srv.config["text"]
+                assert breaker.state == "closed"
+            finally:
+                await client.aclose()
+        asyncio.run(run())
+    assert breaker.trips == 1
+
+
+def test_half_open_failure_reopens():
+    now = [0.0]
+    breaker = CircuitBreaker(failures=1, reset_after=5, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 6
+    assert breaker.allow() and not breaker.allow()   # only one trial in flight
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.trips == 2
+
+
+def test_cancelled_or_abandoned_trial_frees_half_open():
+    now = [0.0]
+    breaker = CircuitBreaker(failures=1, reset_after=5, clock=lambda: now[0])
+    with serve(delay=0.5) as srv:
+        async def run():
+            client = LLMClient(srv.url, breaker=breaker)
+            try:
+                breaker.record_failure()
+                now[0] = 6
+                task = asyncio.ensure_future(client.generate("q", PARAMS))
+                await asyncio.sleep(0.05)
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+                assert breaker.state == "half_open" and breaker.allow()   # trial slot freed
+                breaker.release()
+
+                srv.config["delay"] = 0.0
+                tokens = client.stream("q", PARAMS)
+                await tokens.__anext__()
+                await tokens.aclose()                                      # caller stops reading
+                assert breaker.allow()
+            finally:
+                await client.aclose()
+        asyncio.run(run())
+
+
+def test_session_on_a_new_loop_closes_the_old_one():
+    with serve(text="ok") as srv:
+        client = LLMClient(srv.url)
+        loop = asyncio.new_event_loop()
+        worker = threading.Thread(target=loop.run_forever)
+        worker.start()
+        try:
+            assert asyncio.run_coroutine_threadsafe(client.generate("q", PARAMS), loop).result(5) == "ok"
+            old = client._http
+
+            async def on_new_loop():
+                try:
+                    return await client.generate("q", PARAMS)
+                finally:
+                    await client.aclose()
+            assert asyncio.run(on_new_loop()) == "ok"
+            deadline = time.monotonic() + 5
+            while not old.is_closed and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert old.is_closed and client.stats()["stale_sessions"] == 0
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            worker.join()
+            loop.close()
+
+
+def test_sync_generate_answer_leaves_the_shared_client_open(monkeypatch):
+    from app.services import llm_client
+    hits = [{"source": "opioids.pdf", "chunk": 0, "excerpt": "Opioid tapering reduced pain."}]
+    with serve(text="sync answer") as srv:
+        monkeypatch.setenv("HF_TEXTGEN_URL", srv.url)
+        monkeypatch.setattr(llm_client, "_client", None)
+        shared = llm_client.get_llm_client()
+
+        async def in_app():
+            return await shared.generate("q", PARAMS)
+        loop = asyncio.new_event_loop()
+        try:
+            assert loop.run_until_complete(in_app()) == "sync answer"
+            http = shared._http
+            assert llm_reasoning.generate_answer("opioid tapering", hits, True, True)[0] == "sync answer"
+            assert shared._http is http and not http.is_closed
+            assert shared.counters["calls"] == 1                  # the sync call used its own client
+            loop.run_until_complete(shared.aclose())
+        finally:
+            loop.close()
+
+
+def test_chat_uses_endpoint_and_degrades(client, monkeypatch):
+    from app.routers import chat as chat_router
+    hits = [{"source": "opioids.pdf", "chunk": 0, "score": 0.9,
+             "excerpt": "Opioid tapering reduced pain interference in chronic pain patients."}]
+    monkeypatch.setattr(chat_router, "retrieve_relevant_chunks", lambda *a, **k: (hits, 0.9))
+    monkeypatch.setattr(chat_router, "ANSWER_CACHE_ENABLED", False)
+    msg = {"thread_id": "t-llm", "message": "Summarize opioid tapering and chronic pain"}
+
+    with serve(text="Model says tapering helps.") as srv:
+        monkeypatch.setenv("HF_TEXTGEN_URL", srv.url)
+        assert client.post("/chat", json=msg).json()["generated_answer"] == "Model says tapering helps."
+
+    with serve(status=500) as srv:
+        monkeypatch.setenv("HF_TEXTGEN_URL", srv.url)
+        answer = client.post("/chat", json=msg).json()["generated_answer"]
+    assert answer.startswith(llm_reasoning.LLM_UNAVAILABLE_PREFIX)
+    assert "Opioid tapering" in answer   # extractive fallback
@@ -0,0 +1,59 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+
+from app.main import app
+from scripts.fake_tgi import serve
+from scripts.load_replay import overlap, read_log, run_level, synthetic_mix
+
+HITS = [{"source": "opioids.pdf", "chunk": 0, "score": 0.9,
+         "excerpt": "Opioid tapering reduced pain interference in chronic pain patients."}]
+
+
+def _record(thread_id, message, docs):
+    return json.dumps({"timestamp": "2026-01-01T00:00:00Z", "thread_id": thread_id, "user_message": message,
+                       "ai_response": "...", "retrieved_docs": [{"source": s, "chunk": c} for s, c in docs]})
+
+
+def test_read_log_handles_rotated_and_bad_lines(tmp_path):
+    live, rotated = tmp_path / "conversation_history.jsonl", tmp_path / "conversation_history.1.jsonl.gz"
+    live.write_text(_record("t1", "Summarize opioid tapering", [("a.pdf", 0)]) + "\nnot json\n")
+    with gzip.open(rotated, "wt", encoding="utf-8") as f:
+        f.write(_record("t2", "Compare pain scales", []) + "\n")
+    records = read_log([str(live), str(rotated)])
+    assert [r["message"] for r in records] == ["Summarize opioid tapering", "Compare pain scales"]
+    assert records[0]["retrieved"] == [("a.pdf", 0)]
+    assert synthetic_mix(20, seed=3) == synthetic_mix(20, seed=3)
+
+
+def test_overlap():
+    assert overlap([("a", 0), ("b", 1)], [("a", 0), ("c", 2)]) == {"jaccard": 1 / 3, "recall": 0.5}
+    assert overlap([], []) == {"jaccard": 1.0, "recall": 1.0}
+
+
+def _run(**kw):
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await run_level(client, **kw)
+    return asyncio.run(go())
+
+
+def test_run_level_reports_latency_overlap_and_429s(app_engine, memory_store, monkeypatch):
+    from app.routers import chat as chat_router
+    monkeypatch.setattr(chat_router, "retrieve_relevant_chunks", lambda *a, **k: (HITS, 0.9))
+    monkeypatch.setattr(chat_router, "ANSWER_CACHE_ENABLED", False)
+    records = [{"thread_id": "load-replay-t", "message": "Summarize opioid tapering and chronic pain",
+                "retrieved": [("opioids.pdf", 0), ("other.pdf", 3)]}]
+    with serve() as llm:
+        monkeypatch.setenv("HF_TEXTGEN_URL", llm.url)
+        closed = _run(records=records, concurrency=2, duration=30, max_requests=8)
+        opened = _run(records=records, rate=500.0, duration=30, max_requests=4, thread_ids="unique")
+
+    assert closed["concurrency"] == 2 and closed["requests"] == 8
+    assert closed["ok"] >= 5 and closed["rate_limited_rate"] > 0   # one thread: burst of 5
+    assert closed["error_rate"] == 0.0
+    assert closed["retrieval_jaccard"] == 0.5 and closed["retrieval_recall"] == 0.5
+    assert closed["p50_ms"] <= closed["p95_ms"] <= closed["p99_ms"]
+    assert opened["rate_rps"] == 500.0 and opened["ok"] == 4 and opened["statuses"] == {"200": 4}
@@ -0,0 +1,113 @@
+import gzip
+import json
+import threading
+import time
+
+from app.memory import log_writer, long_term
+from app.memory.log_writer import InteractionLogWriter
+from app.memory.long_term import LongTermStore
+from app.memory.short_term import ShortTermMemory
+
+
+def test_long_term_store_migrates_jsonl_once_and_reads_per_thread(tmp_path):
+    log = tmp_path / "history.jsonl"
+    with open(log, "w") as f:
+        for i in range(5):
+            f.write(json.dumps({"timestamp": "t", "thread_id": "a" if i % 2 == 0 else "b",
+                                "user_message": f"q{i}", "ai_response": f"r{i}",
+                                "retrieved_docs": []}) + "\n")
+
+    store = LongTermStore(db_path=str(tmp_path / "mem.sqlite3"), legacy_log=str(log))
+    assert [r["user_message"] for r in store.recent("a", 2)] == ["q2", "q4"]
+
+    store.add({"timestamp": "t", "thread_id": "a", "user_message": "q5",
+               "ai_response": "r5", "retrieved_docs": []})
+    again = LongTermStore(db_path=str(tmp_path / "mem.sqlite3"), legacy_log=str(log))
+    assert [r["user_message"] for r in again.recent("a", 10)] == ["q0", "q2", "q4", "q5"]
+    assert again.recent("missing", 3) == []
+
+
+def test_long_term_store_creates_its_directory_and_no_legacy_log(tmp_path):
+    store = LongTermStore(db_path=str(tmp_path / "a" / "mem.sqlite3"), legacy_log=str(tmp_path / "b" / "h.jsonl"))
+    assert store.recent("t", 3) == [] and not (tmp_path / "b").exists()
+
+
+def test_log_writer_batches_rotates_and_compresses(tmp_path):
+    path = tmp_path / "log.jsonl"
+    writer = InteractionLogWriter(str(path), rotate_bytes=200, rotate_daily=False, fsync_interval=0)
+    for i in range(10):
+        assert writer.submit({"i": i, "pad": "x" * 40})
+    writer.flush()
+    writer.submit({"i": 10})                 # file is past 200 bytes: rotates first
+    writer.flush()
+    writer.close()
+
+    assert [json.loads(l)["i"] for l in path.read_text().splitlines()] == [10]
+    rotated = list(tmp_path.glob("log-*.jsonl.gz"))
+    assert len(rotated) == 1
+    with gzip.open(rotated[0], "rt") as f:
+        assert len(f.read().splitlines()) == 10
+    stats = writer.stats()
+    assert stats["written"] == 11 and stats["rotations"] == 1 and stats["dropped"] == 0
+
+
+def test_log_writer_drops_under_back_pressure(tmp_path):
+    writer = InteractionLogWriter(str(tmp_path / "log.jsonl"), max_queue=1, policy="drop")
+    writer.start = lambda: None              # no consumer: the queue stays full
+    assert writer.submit({"i": 0})
+    assert not writer.submit({"i": 1})
+    assert writer.stats()["dropped"] == 1
+
+
+def test_short_term_memory_is_bounded():
+    mem = ShortTermMemory(window_size=2, max_sessions=3, ttl_sec=3600, budget_bytes=10**9)
+    assert mem.get("unknown") == [] and mem.stats()["sessions"] == 0
+
+    for i in range(3):
+        mem.add("a", "user", f"m{i}")
+    assert [t["message"] for t in mem.get("a")] == ["m1", "m2"]
+
+    for t in ("b", "c", "d"):
+        mem.add(t, "user", "hi")
+    assert mem.get("a") == []                      # least recently used
+    assert mem.stats()["evictions"]["lru"] == 1
+
+    mem.budget_bytes = 0
+    mem.add("e", "user", "hi")
+    assert mem.stats()["sessions"] == 1            # only the active session survives
+
+
+def test_short_term_eviction_skips_a_kept_thread_at_the_front():
+    mem = ShortTermMemory(ttl_sec=3600, budget_bytes=10**9)
+    for t in ("a", "b", "c"):
+        mem.add(t, "user", "hi")
+    mem.budget_bytes = mem.stats()["bytes_estimate"] * 2 // 3      # room for two of the three
+    with mem._lock:
+        mem._evict_locked(time.monotonic(), keep="a")   # "a" is least recently used
+    assert mem.get("a") and mem.get("b") == [] and mem.get("c")
+    assert mem.stats()["evictions"]["budget"] == 1
+
+
+def test_short_term_memory_idle_ttl():
+    mem = ShortTermMemory(ttl_sec=0)
+    mem.add("a", "user", "hi")
+    time.sleep(0.01)
+    assert mem.get("a") == []
+    assert mem.stats()["evictions"]["ttl"] == 1
+
+
+def test_store_interaction_writes_sqlite_on_the_log_thread(memory_store, monkeypatch):
+    store, writer = memory_store, log_writer._writer
+    threads = []
+    add_many = store.add_many
+    monkeypatch.setattr(store, "add_many", lambda recs: threads.append(threading.current_thread().name)
+                        or add_many(recs))
+
+    long_term.store_interaction("t1", "q1", "r1", [{"source": "a.pdf", "chunk": 0}])
+    assert [m["message"] for m in long_term.summarize_history("t1")] == ["q1", "r1..."]   # pending
+
+    writer.flush()
+    writer.close()
+    assert threads == ["interaction-log"] and not long_term._pending
+    assert [r["user_message"] for r in store.recent("t1", 3)] == ["q1"]
+    assert len(long_term.summarize_history("t1")) == 2
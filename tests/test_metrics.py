@@ -0,0 +1,67 @@
+from app.services.metrics import (
+    RATE_LIMITED, RESPONSE_TAGS, STAGE_SECONDS, Counter, Gauge, Histogram, Registry, server_timing,
+)
+
+HITS = [{"source": "opioids.pdf", "chunk": 0, "score": 0.9,
+         "excerpt": "Opioid tapering reduced pain interference in chronic pain patients."}]
+
+
+def test_text_exposition_format():
+    reg = Registry()
+    c = Counter("demo_total", "Demo counter.", ("kind",), registry=reg)
+    Gauge("demo_items", "Items.", fn=lambda: 7, registry=reg)
+    h = Histogram("demo_seconds", "Latency.", buckets=(0.1, 1.0), registry=reg)
+    c.inc(kind='a"b')
+    c.inc(2, kind='a"b')
+    h.observe(0.05)
+    h.observe(0.5)
+    h.observe(3)
+
+    text = reg.render()
+    assert '# TYPE demo_total counter\ndemo_total{kind="a\\"b"} 3.0' in text
+    assert "demo_items 7.0" in text
+    assert 'demo_seconds_bucket{le="0.1"} 1\n' in text
+    assert 'demo_seconds_bucket{le="1.0"} 2\n' in text
+    assert 'demo_seconds_bucket{le="+Inf"} 3\n' in text
+    assert "demo_seconds_sum 3.55" in text and "demo_seconds_count 3" in text
+
+
+def test_failing_scrape_callback_is_skipped():
+    reg = Registry()
+    Gauge("broken", "Raises.", fn=lambda: 1 / 0, registry=reg)
+    assert reg.render() == "# HELP broken Raises.\n# TYPE broken gauge\n"
+
+
+def test_server_timing_value():
+    assert server_timing({"retrieval": 0.0123, "llm": 1.5}) == "retrieval;dur=12.30, llm;dur=1500.00"
+
+
+def test_chat_sends_server_timing_and_feeds_metrics(client, monkeypatch):
+    from app.routers import chat as chat_router
+    monkeypatch.setattr(chat_router, "retrieve_relevant_chunks", lambda *a, **k: (HITS, 0.9))
+    monkeypatch.setattr(chat_router, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.delenv("HF_TEXTGEN_URL", raising=False)
+    before = STAGE_SECONDS.count(stage="retrieval")
+
+    r = client.post("/chat", json={"thread_id": "t-metrics", "message": "Summarize opioid tapering and pain"})
+    assert r.status_code == 200
+    stages = [part.split(";")[0] for part in r.headers["server-timing"].split(", ")]
+    for stage in ("analyze", "retrieval", "llm", "memory_write", "memory_read", "total"):
+        assert stage in stages
+    assert STAGE_SECONDS.count(stage="retrieval") == before + 1
+
+    text = client.get("/metrics").text
+    assert 'chat_stage_seconds_bucket{stage="llm",le="+Inf"}' in text
+    assert 'chat_response_tags_total{tag="reasoned_response"}' in text
+    assert 'chat_llm_fallbacks_total{reason="unconfigured"}' in text
+    assert "\nchat_sessions " in text
+    assert "server-timing" not in client.get("/health").headers   # nothing timed
+
+
+def test_rate_limit_rejections_are_counted(client):
+    before = RATE_LIMITED.value(route="/chat")
+    blocked = RESPONSE_TAGS.value(tag="safety_blocked")
+    codes = [client.post("/chat", json={"thread_id": "t-metrics-429", "message": "I want to end my life"}).status_code
+             for _ in range(7)]
+    assert codes.count(429) == RATE_LIMITED.value(route="/chat") - before > 0
+    assert RESPONSE_TAGS.value(tag="safety_blocked") - blocked == codes.count(200)
@@ -0,0 +1,31 @@
+from app.utils.rate_limit import RateLimit, RateLimiter, InMemoryBackend, SQLiteBackend
+
+
+def test_gcra_burst_then_steady_rate():
+    limiter = RateLimiter(InMemoryBackend(), limits={"/chat": RateLimit(5, 5.0, 5)})
+    assert all(limiter.allow("t", now=100.0) for _ in range(5))
+    assert not limiter.allow("t", now=100.0)
+    assert limiter.allow("t", now=101.0)          # one token back per second
+    assert not limiter.allow("t", now=101.0)
+    assert limiter.allow("other", now=101.0)      # keys are independent
+    assert limiter.rejected == 2
+
+
+def test_idle_keys_are_evicted():
+    backend = InMemoryBackend(max_keys=1000)
+    limiter = RateLimiter(backend, limits={"/chat": RateLimit(1, 1.0, 1)})
+    for i in range(50):
+        limiter.allow(f"k{i}", now=0.0)
+    assert backend.size() == 50
+    for i in range(10):
+        limiter.allow("fresh", now=100.0 + i)
+    assert backend.size() < 50
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    path = str(tmp_path / "rl.sqlite3")
+    limits = {"/chat": RateLimit(2, 10.0, 2)}
+    a = RateLimiter(SQLiteBackend(path), limits=limits)
+    b = RateLimiter(SQLiteBackend(path), limits=limits)   # a second "worker"
+    assert a.allow("t", now=0.0) and b.allow("t", now=0.0)
+    assert not a.allow("t", now=0.0) and not b.allow("t", now=0.0)
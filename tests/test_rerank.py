@@ -0,0 +1,81 @@
+import threading
+
+from app.services import rerank, retrieval
+from app.services.rerank import Reranker
+
+
+def _items(*texts):
+    return [{"source": f"p{i}.pdf", "chunk": 0, "score": 0.9 - i / 100, "excerpt": t}
+            for i, t in enumerate(texts)]
+
+
+class WordOverlapScorer:
+    """Cheap stand-in for a cross-encoder: shared words with the query."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, query, passages):
+        self.batches.append(list(passages))
+        words = set(query.lower().split())
+        return [len(words & set(p.lower().split())) for p in passages]
+
+
+def test_rerank_orders_top_k_in_one_batch_and_caches():
+    scorer = WordOverlapScorer()
+    reranker = Reranker(scorer, top_k=3, budget_ms=0)
+    items = _items("sleep quality", "alcohol use", "smoking cessation and pain", "pain and smoking")
+
+    out = reranker.rerank("smoking cessation pain", items)
+    assert [d["source"] for d in out] == ["p2.pdf", "p0.pdf", "p1.pdf", "p3.pdf"]   # p3 beyond top_k
+    assert out[0]["rerank_score"] == 3 and "rerank_score" not in out[3]
+    assert len(scorer.batches) == 1 and len(scorer.batches[0]) == 3
+
+    reranker.rerank("smoking cessation pain", items)
+    assert len(scorer.batches) == 1                      # served from the score cache
+    reranker.rerank("smoking cessation pain", items, version="v2")
+    assert len(scorer.batches) == 2                      # new corpus version, new keys
+    assert reranker.stats()["cache_hits"] == 3
+
+
+def test_rerank_budget_keeps_fused_order_and_fills_cache_late():
+    release = threading.Event()
+
+    def slow(query, passages):
+        release.wait(2)
+        return list(range(len(passages)))
+
+    calls = []
+    reranker = Reranker(lambda q, p: calls.append(q) or slow(q, p), top_k=5, budget_ms=20)
+    items = _items("a", "b", "c")
+    assert reranker.rerank("q", items) is items
+    assert reranker.stats()["timeouts"] == 1
+
+    # the late batch still holds the worker: other queries skip scoring instead of queueing
+    assert reranker.rerank("other", items, budget_ms=0) is items
+    assert reranker.stats()["skipped_busy"] == 1 and calls == ["q"]
+
+    release.set()
+    reranker._pool.submit(lambda: None).result()         # wait for the late batch
+    assert [d["excerpt"] for d in reranker.rerank("q", items)] == ["c", "b", "a"]
+    assert reranker.stats()["batches"] == 1
+    reranker.close()
+
+
+def test_rerank_scorer_error_keeps_fused_order():
+    def broken(query, passages):
+        raise RuntimeError("model missing")
+    items = _items("a", "b")
+    reranker = Reranker(broken, budget_ms=0)
+    assert reranker.rerank("q", items) is items
+    assert reranker.stats()["errors"] == 1
+
+
+def test_retrieval_applies_reranker(app_engine, monkeypatch):
+    monkeypatch.setattr(retrieval, "MIN_SCORE", -1.0)
+    monkeypatch.setattr(rerank, "RERANK_ENABLED", True)
+    monkeypatch.setattr(rerank, "_reranker", Reranker(WordOverlapScorer(), budget_ms=0))
+
+    found, _ = retrieval.retrieve_relevant_chunks("sleep nicotine dependence", n_results=2)
+    assert found[0]["excerpt"].startswith("sleep impairment")
+    assert found[0]["rerank_score"] == 3
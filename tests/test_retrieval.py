@@ -0,0 +1,177 @@
+import os
+import time
+
+import pytest
+
+from app.services import lexical
+from app.services.embedding_cache import QueryEmbeddingCache
+from app.services.lexical import BM25Index
+from app.services import retrieval
+from app.services.retrieval import RetrievalEngine, MultiQuerySearcher
+from app.services.topics import TOPIC_PACKS, match_topic_packs, packs_for_terms, select_topic_terms, topic_flags, topic_where
+
+
+def test_engine_caches_collection_handle(engine):
+    assert engine.get_collection("papers") is engine.get_collection("papers")
+    assert engine.count("papers") == 4
+
+
+def test_search_multi_uses_one_embedding_pass(engine):
+    searcher = MultiQuerySearcher(engine=engine)
+    queries = ["pain smoking", "chronic pain alcohol", "cannabis pain", "sleep nicotine"]
+
+    merged = searcher.search_multi(queries, top_k_per_query=3)
+
+    assert engine.embedding_function.calls == 1
+    assert merged and all("rrf_score" in d for d in merged)
+    assert merged == sorted(merged, key=lambda d: d["rrf_score"], reverse=True)
+
+
+def test_search_batch_matches_single_queries(engine):
+    searcher = MultiQuerySearcher(engine=engine)
+    queries = ["pain smoking", "alcohol veterans"]
+
+    batched = searcher.search_batch(queries, top_k=2)
+    singles = [searcher.search_single(q, top_k=2) for q in queries]
+
+    assert batched == singles
+
+
+def test_query_embedding_cache_hits_and_eviction(tmp_path, fake_embedder):
+    cache = QueryEmbeddingCache(max_size=2, spill_dir=str(tmp_path / "spill"))
+    ef = fake_embedder()
+
+    cache.get_or_embed("m", ["a", "b"], ef)
+    cache.get_or_embed("m", ["a", "b"], ef)
+    assert ef.calls == 1
+    assert cache.stats()["hits"] == 2
+
+    cache.get_or_embed("m", ["c"], ef)          # evicts "a" to disk
+    assert cache.stats()["evictions"] == 1
+    cache.get_or_embed("m", ["a"], ef)          # served from the spill
+    assert ef.calls == 2
+    assert cache.stats()["spill_hits"] == 1
+
+    cache.get_or_embed("other-model", ["a"], ef)
+    assert ef.calls == 3
+
+
+def test_repeated_search_skips_the_model(engine):
+    searcher = MultiQuerySearcher(engine=engine)
+
+    first = searcher.search_multi(["pain smoking", "sleep nicotine"], top_k_per_query=3)
+    second = searcher.search_multi(["pain smoking", "sleep nicotine"], top_k_per_query=3)
+
+    assert first == second
+    assert engine.embedding_function.calls == 1
+
+
+def test_bm25_ranks_exact_terms_and_detects_keyword_queries():
+    rows = [(f"p{i}.pdf", 0, f"smoking and pain outcomes in sample {i}") for i in range(60)]
+    rows.append(("ditre2012.pdf", 0, "Effects of divalproex on smoking cue reactivity"))
+    index = BM25Index.build(rows)
+
+    idx, _, coverage = index.search("divalproex", top_k=1)[0]
+    assert index.docs[idx]["source"] == "ditre2012.pdf" and coverage == 1.0
+    assert index.is_keyword_query("Divalproex")
+    assert not index.is_keyword_query("smoking and pain")          # common terms
+    assert not index.is_keyword_query("how does divalproex change smoking pain outcomes sample")
+
+
+def test_read_only_probes_do_not_create_a_collection(tmp_path):
+    engine = RetrievalEngine(db_path=str(tmp_path / "empty"))
+    assert engine.count("missing") == 0
+    assert engine.rebuild_lexical_index("missing").docs == []
+    assert "missing" not in [getattr(c, "name", c) for c in engine.client.list_collections()]
+
+
+def test_keyword_query_skips_vector_search_but_embeds_the_query(engine, monkeypatch):
+    monkeypatch.setattr(lexical, "RARE_DF_RATIO", 0.3)   # 1 of 4 chunks counts as rare
+    searcher = MultiQuerySearcher(engine=engine)
+
+    queried = []
+    backend = engine.vector_backend("papers")
+    monkeypatch.setattr(engine, "vector_backend", lambda name: backend)
+    monkeypatch.setattr(backend, "query", lambda *a, **kw: queried.append(a) or backend.collection.query(
+        *a, include=["distances", "metadatas", "documents"], **kw))
+
+    merged = searcher.search_multi(["cannabis expectancies"], top_k_per_query=3)
+    assert not queried                                   # no ANN search over the collection
+    assert engine.embedding_function.calls == 1          # the query is still embedded to score the hits
+    assert merged[0]["source"] == "p2.pdf" and merged[0]["lexical_score"] == 1.0
+    dense = {d["source"]: d["score"] for d in searcher.search_single("cannabis expectancies", top_k=4)}
+    assert merged[0]["score"] == dense["p2.pdf"] < 1.0     # dense similarity, not term coverage
+
+    merged = searcher.search_multi(["pain", "chronic pain"], top_k_per_query=3)   # common term
+    assert engine.embedding_function.calls == 2
+    assert max(d["query_hits"] for d in merged) == 3   # two dense lists + the lexical one
+    assert all("lexical_score" in d for d in merged if d["query_hits"] == 3)
+
+
+def test_lexical_index_follows_corpus_version(engine):
+    first = engine.lexical_index("papers")
+    assert first.n == 4 and engine.lexical_index("papers") is first
+
+    worker = RetrievalEngine(db_path=engine.db_path)   # another process serving requests
+    assert worker.lexical_index("papers").n == 4
+
+    engine.get_collection("papers").add(ids=["doc::4"], documents=["divalproex trial"],
+                                        metadatas=[{"source": "p4.pdf", "chunk": 0}])
+    version = engine.new_corpus_version()
+    engine.rebuild_lexical_index("papers", version)
+    assert worker.lexical_index("papers").n == 4        # not published yet
+    engine.bump_corpus_version(version)
+
+    assert worker.lexical_index("papers").n == 4        # last good index; reload runs off the request path
+    deadline = time.monotonic() + 5
+    while worker.lexical_index("papers").version != version and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert worker.lexical_index("papers").n == 5
+
+
+def test_request_path_never_builds_the_lexical_index(engine, monkeypatch):
+    monkeypatch.setattr(engine, "rebuild_lexical_index", None)   # would raise if called
+    os.remove(os.path.join(engine.db_path, lexical.LEXICAL_INDEX_FILE.format(name="papers")))
+    engine._lexical.clear()
+    engine.bump_corpus_version()
+
+    merged = MultiQuerySearcher(engine=engine).search_multi(["pain smoking"], top_k_per_query=3)
+    assert merged and engine.lexical_index("papers") is None
+
+
+def test_topic_packs_match_whole_words():
+    assert match_topic_packs("Quitting was quite hard for AUDIT responders") == {"alcohol"}
+    assert match_topic_packs("opioids and poor sleep") == {"opioid", "sleep"}
+    assert packs_for_terms(select_topic_terms("cannabis use")) == {"cannabis"}
+    assert topic_where(["sleep"]) == {"t_sleep": True}
+    assert topic_where([]) is None
+
+
+@pytest.mark.parametrize("query, substring_packs, packs", [
+    ("Quitting was quite hard", {"cessation_relapse"}, set()),           # quit
+    ("daytime sleepiness", {"sleep"}, set()),                            # sleep
+    ("OUD and PTSD outcomes", set(), {"opioid", "trauma_ptsd"}),         # upper-case terms
+    ("smokers and opioids", {"opioid"}, {"opioid"}),                     # plurals still match
+])
+def test_select_topic_terms_matches_whole_words_not_substrings(query, substring_packs, packs):
+    # the old rule, kept here to pin down where the selection changed
+    q = query.lower()
+    old = {p for p, terms in TOPIC_PACKS.items() if any(t in q for t in terms)}
+    assert old == substring_packs
+    assert packs_for_terms(select_topic_terms(query)) == packs
+
+
+def test_topic_filter_narrows_then_falls_back(make_engine, monkeypatch):
+    texts = ["cannabis expectancies for pain relief", "pain relief and smoking",
+             "pain relief among veterans", "pain relief with opioids"]
+    engine = make_engine(texts, [{"source": f"p{i}.pdf", "chunk": 0, **topic_flags(match_topic_packs(t))}
+                                 for i, t in enumerate(texts)])
+    monkeypatch.setattr(retrieval, "_engine", engine)
+    searcher = MultiQuerySearcher(engine=engine)
+
+    narrowed = searcher.search_multi(["pain relief"], top_k_per_query=4, packs={"cannabis"})
+    assert [d["source"] for d in narrowed] == ["p0.pdf"]
+
+    # one filtered hit is below TOPIC_FILTER_MIN_RESULTS: the search is redone unfiltered
+    found, _ = retrieval.retrieve_relevant_chunks("pain relief", select_topic_terms("cannabis"), n_results=4)
+    assert len({d["source"] for d in found}) > 1
@@ -0,0 +1,67 @@
+import io
+import json
+import logging
+import queue
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import structured_log
+from app.services.structured_log import DroppingQueueHandler, get_logger, setup_logging, shutdown_logging
+
+HITS = [{"source": "opioids.pdf", "chunk": 0, "score": 0.9,
+         "excerpt": "Opioid tapering reduced pain interference in chronic pain patients."}]
+
+
+def _capture(fn, **setup):
+    out = io.StringIO()
+    setup_logging(stream=out, **setup)
+    try:
+        fn()
+    finally:
+        shutdown_logging()   # drains the queue
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_chat_turn_is_one_json_event_with_request_id(client, monkeypatch):
+    from app.routers import chat as chat_router
+    monkeypatch.setattr(chat_router, "retrieve_relevant_chunks", lambda *a, **k: (HITS, 0.9))
+    monkeypatch.setattr(chat_router, "ANSWER_CACHE_ENABLED", False)
+    responses = []
+    lines = _capture(lambda: responses.append(client.post(
+        "/chat", json={"thread_id": "t-log", "message": "Summarize opioid tapering"},
+        headers={"X-Request-ID": "req-123"})))
+
+    assert responses[0].headers["x-request-id"] == "req-123"
+    turn = [l for l in lines if l["event"] == "chat.turn"]
+    assert len(turn) == 1
+    assert turn[0]["request_id"] == "req-123" and turn[0]["thread_id"] == "t-log"
+    assert turn[0]["level"] == "info" and turn[0]["logger"] == "app.chat"
+
+
+def test_generated_request_id_for_missing_or_odd_header():
+    client = TestClient(app)
+    assert len(client.get("/health").headers["x-request-id"]) == 16
+    assert client.get("/health", headers={"X-Request-ID": "bad id\n"}).headers["x-request-id"] != "bad id\n"
+
+
+def test_level_and_sampling(monkeypatch):
+    log = get_logger("test")
+    monkeypatch.setattr(structured_log, "SAMPLE_RATES", {"never": 0.0, "always": 1.0})
+
+    def emit():
+        log.debug("hidden")
+        log.info("never")
+        log.info("always", n=1)
+        log.warning("plain")
+    lines = _capture(emit, level="INFO")
+    assert [l["event"] for l in lines] == ["always", "plain"]
+    assert lines[0]["sample_rate"] == 1.0 and lines[0]["n"] == 1
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    record = logging.LogRecord("app.test", logging.INFO, __file__, 1, "event", None, None)
+    for _ in range(3):
+        handler.emit(record)
+    assert handler.dropped == 2
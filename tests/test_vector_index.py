@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from app.services.retrieval import MultiQuerySearcher
+from app.services.vector_index import ChromaBackend, NumpyVectorIndex, VectorBackend
+
+
+def _random_index(tmp_path, dtype, n=400, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    metas = [{"source": f"p{i}.pdf", "chunk": i, "t_a": i % 3 == 0, "t_b": i % 5 == 0} for i in range(n)]
+    index = NumpyVectorIndex.build(str(tmp_path / f"vec_{dtype}"), [f"id{i}" for i in range(n)], vectors,
+                                   [f"doc {i}" for i in range(n)], metas, version="v1", dtype=dtype)
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return index, unit, rng.normal(size=(4, dim)).astype(np.float32)
+
+
+@pytest.mark.parametrize("dtype,min_recall", [("float32", 1.0), ("float16", 0.95), ("int8", 0.9)])
+def test_exact_topk_matches_brute_force(tmp_path, dtype, min_recall):
+    index, unit, queries = _random_index(tmp_path, dtype)
+    assert isinstance(index.matrix, np.memmap) and index.dtype == dtype
+    res = index.query(queries.tolist(), n_results=10)
+    truth = np.argsort(-(queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ unit.T, axis=1)[:, :10]
+    hits = sum(len({f"id{i}" for i in t} & set(ids)) for t, ids in zip(truth, res["ids"]))
+    assert hits / truth.size >= min_recall
+    for dists in res["distances"]:
+        assert dists == sorted(dists) and all(0.0 <= d <= 4.0 for d in dists)
+
+
+def test_where_filter_and_reload(tmp_path):
+    index, _, queries = _random_index(tmp_path, "float16")
+    res = index.query(queries.tolist(), n_results=8, where={"$or": [{"t_a": True}, {"t_b": True}]})
+    for metas in res["metadatas"]:
+        assert len(metas) == 8 and all(m["t_a"] or m["t_b"] for m in metas)
+    assert isinstance(index.rows.data, np.memmap) and not index._columns   # flags filtered without decoding rows
+    assert res["documents"][0][0] == f"doc {res['metadatas'][0][0]['chunk']}"
+    assert index.query(queries[:1].tolist(), n_results=5, where={"chunk": 7})["ids"] == [["id7"]]
+
+    again = NumpyVectorIndex.load(str(tmp_path / "vec_float16"))
+    assert again.version == "v1" and again.count() == 400
+    assert again.query(queries.tolist(), 8)["ids"] == index.query(queries.tolist(), 8)["ids"]
+
+
+def test_numpy_backend_matches_chroma_and_follows_corpus_version(engine):
+    queries = ["pain relief", "nicotine dependence and sleep"]
+    chroma = MultiQuerySearcher(engine=engine).search_batch(queries, top_k=4)
+
+    engine.backend, engine.vector_dtype = "numpy", "float32"
+    assert isinstance(engine.vector_backend(), ChromaBackend)   # until an index is written
+    engine.rebuild_vector_index("papers")
+    exact = MultiQuerySearcher(engine=engine).search_batch(queries, top_k=4)
+    for a, b in zip(chroma, exact):
+        assert [d["source"] for d in a] == [d["source"] for d in b]
+        assert [d["score"] for d in a] == pytest.approx([d["score"] for d in b], abs=0.002)
+    vector = engine.embed_queries(queries[:1])[0]
+    ids = ["doc::0", "doc::2", "missing"]
+    by_chroma = ChromaBackend(engine.get_collection("papers")).distances(vector, ids)
+    assert set(by_chroma) == {"doc::0", "doc::2"}
+    assert engine.vector_index().distances(vector, ids) == pytest.approx(by_chroma, abs=0.002)
+
+    engine.get_collection("papers").add(ids=["doc::4"], documents=["pain relief from exercise"],
+                                        metadatas=[{"source": "p4.pdf", "chunk": 0}])
+    assert engine.vector_index().count() == 4           # requests never rebuild the index
+    engine.publish_corpus("papers")
+    assert engine.vector_index().count() == 5
+    assert any(d["source"] == "p4.pdf" for d in MultiQuerySearcher(engine=engine).search_single("pain relief", 5))
+
+
+def test_vector_backend_is_abstract():
+    class Partial(VectorBackend):
+        def count(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        Partial()